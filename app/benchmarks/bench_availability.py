@@ -0,0 +1,85 @@
+"""
+Benchmark: availability index with synthetic appointments.
+
+Builds the in-process availability index from N synthetic appointments
+spread across several resources, then measures "N free slots nearest to D"
+queries and incremental add/remove latency.
+
+Usage (from the ``app`` directory):
+    python -m benchmarks.bench_availability --appointments 100000
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from core.availability import AvailabilityEngine
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _synthetic_appointments(count, resources, start, rng):
+    """Random non-overlapping 30/60 minute bookings during business hours."""
+    per_resource = count // len(resources)
+    for r_index, resource in enumerate(resources):
+        cursor = start + timedelta(hours=9)
+        for i in range(per_resource):
+            cursor += timedelta(minutes=rng.choice((0, 0, 30, 60)))
+            duration = timedelta(minutes=rng.choice((30, 60)))
+            if cursor.hour + duration.seconds / 3600 > 18 or cursor.weekday() == 6:
+                cursor = datetime.combine(cursor.date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=9)
+            yield r_index * per_resource + i + 1, resource, cursor, cursor + duration
+            cursor += duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=100_000)
+    parser.add_argument("--resources", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--slots", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    resources = [f"pro-{i}" for i in range(args.resources)]
+    origin = datetime(2025, 1, 6)
+    engine = AvailabilityEngine(resources=resources, horizon_days=60)
+
+    appointments = list(_synthetic_appointments(args.appointments, resources, origin, rng))
+    last_end = max(end for _, _, _, end in appointments)
+
+    started = time.perf_counter()
+    for appointment_id, resource, start_at, end_at in appointments:
+        engine.add(appointment_id, resource, start_at, end_at)
+    build_seconds = time.perf_counter() - started
+
+    span_minutes = int((last_end - origin).total_seconds() // 60)
+    query_samples = []
+    for _ in range(args.queries):
+        near = origin + timedelta(minutes=rng.randrange(span_minutes))
+        t0 = time.perf_counter()
+        engine.next_free_slots("corte", near, count=args.slots, not_before=origin)
+        query_samples.append((time.perf_counter() - t0) * 1e6)
+
+    update_samples = []
+    for appointment_id, resource, start_at, end_at in rng.sample(appointments, min(1_000, len(appointments))):
+        t0 = time.perf_counter()
+        engine.remove(appointment_id)
+        engine.add(appointment_id, resource, start_at, end_at)
+        update_samples.append((time.perf_counter() - t0) * 1e6)
+
+    print(f"appointments indexed : {len(appointments)} across {len(resources)} resources "
+          f"({origin.date()} .. {last_end.date()})")
+    print(f"index build          : {build_seconds:.3f}s")
+    print(f"{args.slots} nearest slots      : p50 {statistics.median(query_samples):.1f}us  "
+          f"p99 {_percentile(query_samples, 99):.1f}us  max {max(query_samples):.1f}us")
+    print(f"remove+add           : p50 {statistics.median(update_samples):.1f}us  "
+          f"p99 {_percentile(update_samples, 99):.1f}us")
+
+
+if __name__ == "__main__":
+    main()
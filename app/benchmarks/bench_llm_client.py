@@ -0,0 +1,71 @@
+"""
+Benchmark: per-call httpx clients vs the shared pooled LLM client.
+
+Runs ``analyze_message`` against a local LLM stub and compares it with the
+old pattern of opening a new ``httpx.AsyncClient`` for every call, reporting
+the number of TCP connections each approach opened.
+
+Usage (from the ``app`` directory):
+    python -m benchmarks.bench_llm_client --calls 200 --latency 0.005
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from config import settings
+from benchmarks.stub_servers import LLMStub
+
+
+async def _per_call_clients(url: str, calls: int):
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "oi"}]}
+    for _ in range(calls):
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+
+
+async def _shared_client(calls: int):
+    from core import llm
+    from core.http import close_async_clients
+    from core.prompts import get_prompt
+    prompt = get_prompt(llm.EXTRACTION_PROMPT).render("oi")
+    try:
+        for _ in range(calls):
+            await llm._call_openrouter(prompt)
+    finally:
+        await close_async_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub latency in seconds")
+    args = parser.parse_args()
+
+    with LLMStub(latency=args.latency) as stub:
+        # Plain HTTP stub: HTTP/2 needs TLS, so benchmark keep-alive over HTTP/1.1
+        settings.LLM_HTTP2 = False
+        # Plain JSON completions, whatever LLM_STREAMING is set to in the environment
+        settings.LLM_STREAMING = False
+        settings.OPENROUTER_API_KEY = "stub"
+        from core import llm
+        llm.OPENROUTER_URL = stub.url
+
+        results = []
+        for label, coro in (
+            ("per-call client", _per_call_clients(stub.url, args.calls)),
+            ("shared client", _shared_client(args.calls)),
+        ):
+            stub.reset_counters()
+            started = time.perf_counter()
+            asyncio.run(coro)
+            elapsed = time.perf_counter() - started
+            results.append((label, stub.requests, stub.connections, elapsed))
+
+    print(f"{'mode':<16} {'requests':>9} {'connections':>12} {'total s':>9} {'ms/call':>9}")
+    for label, requests, connections, elapsed in results:
+        print(f"{label:<16} {requests:>9} {connections:>12} {elapsed:>9.3f} {elapsed / max(requests, 1) * 1000:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark: lean webhook (early ACK) against the full webhook handler.
+
+Posts the same signed Twilio form payloads to both handlers of ``main:app``
+(in-process ASGI, so network time is excluded) and reports the latency until
+Twilio gets its 200. The full handler parses the form with FastAPI and
+stores the message before answering; the lean one verifies the signature
+and appends the event to a Redis stream. The events queued by the lean
+handler are then stored by ``workers.ingest_consumer`` in batches, whose
+throughput and database statements per message are reported as well.
+
+Redis is fakeredis and the database a throwaway SQLite file unless
+``--database-url`` points at a disposable Postgres (where the consumer
+uses the multi-row insert).
+
+Usage (from the ``app`` directory):
+    python -m benchmarks.bench_webhook --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+LEAN_PATH = "/webhook/whatsapp-lean"
+FULL_PATH = "/webhook/whatsapp"
+AUTH_TOKEN = "bench"
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _forms(count, leads, offset):
+    for i in range(count):
+        yield {
+            "SmsMessageSid": f"SM{offset + i:032d}",
+            "NumMedia": "0",
+            "ProfileName": "Cliente",
+            "WaId": f"55119{i % leads:08d}",
+            "SmsStatus": "received",
+            "Body": "Quero marcar um corte amanhã às 15h",
+            "To": "whatsapp:+15550000000",
+            "NumSegments": "1",
+            "MessageSid": f"SM{offset + i:032d}",
+            "AccountSid": "ACbench",
+            "From": f"whatsapp:+55119{i % leads:08d}",
+            "ApiVersion": "2010-04-01",
+        }
+
+
+async def _post_all(app, path, forms, concurrency):
+    import httpx
+    from core.utils import twilio_signature
+    latencies, errors = [], []
+    queue = list(forms)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def sender():
+            while queue:
+                form = queue.pop()
+                signature = twilio_signature(AUTH_TOKEN, f"http://bench{path}", form.items())
+                started = time.perf_counter()
+                response = await client.post(path, data=form, headers={"X-Twilio-Signature": signature})
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def _report(name, latencies, errors, elapsed):
+    print(f"{name:<6} {len(latencies) / elapsed:>9.0f} req/s   p50 {statistics.median(latencies) * 1000:6.2f}ms   "
+          f"p95 {_percentile(latencies, 95) * 1000:6.2f}ms   p99 {_percentile(latencies, 99) * 1000:6.2f}ms   "
+          f"errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight")
+    parser.add_argument("--batch-size", type=int, default=200, help="ingest consumer batch size")
+    parser.add_argument("--database-url", default=None, help="disposable database (default: temp SQLite file)")
+    args = parser.parse_args()
+
+    db_file = None
+    if args.database_url is None:
+        db_file = tempfile.NamedTemporaryFile(prefix="atendente-bench-", suffix=".db", delete=False).name
+    # Settings are read at import time, so configure before importing the app
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{db_file}",
+        "TWILIO_TOKEN": AUTH_TOKEN,
+        "WEBHOOK_MODE": "full",
+    })
+
+    import fakeredis
+    from core.redis_client import set_redis
+    redis_server = fakeredis.FakeServer()
+    redis_client = fakeredis.FakeRedis(server=redis_server, decode_responses=True)
+    set_redis(sync_client=redis_client, async_client=fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True))
+
+    from sqlalchemy import event
+    import main as app_main
+    import database
+    from controllers.whatsapp import LeanWebhook
+    from workers.ingest_consumer import IngestConsumer
+
+    app = app_main.app
+    app.router.add_route(LEAN_PATH, LeanWebhook(), methods=["POST"])
+
+    statements = [0]
+    statements_lock = threading.Lock()
+
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        with statements_lock:
+            statements[0] += 1
+
+    # Warm up both paths (imports, connection pool, first lead rows) and
+    # store the warmup events so the consumer only measures the run's
+    consumer = IngestConsumer(batch_size=args.batch_size, block_ms=10)
+    consumer.ensure_group()
+    asyncio.run(_post_all(app, FULL_PATH, _forms(20, args.leads, 10_000_000), 1))
+    asyncio.run(_post_all(app, LEAN_PATH, _forms(20, args.leads, 20_000_000), 1))
+    while consumer.consume_batch():
+        pass
+    consumer.stored = 0
+
+    print(f"{args.requests} webhook requests, {args.leads} leads, concurrency {args.concurrency}")
+    statements[0] = 0
+    full = asyncio.run(_post_all(app, FULL_PATH, _forms(args.requests, args.leads, 0), args.concurrency))
+    full_statements = statements[0]
+    lean = asyncio.run(_post_all(app, LEAN_PATH, _forms(args.requests, args.leads, args.requests), args.concurrency))
+    _report("full", *full)
+    _report("lean", *lean)
+
+    statements[0] = 0
+    started = time.perf_counter()
+    while consumer.consume_batch():
+        pass
+    elapsed = time.perf_counter() - started
+    stored = consumer.stored
+    print(f"ingest {stored / elapsed:>9.0f} msg/s   {stored} stored in {elapsed:.2f}s "
+          f"(batches of {args.batch_size})")
+    print(f"db statements / message: full {full_statements / args.requests:.2f}   "
+          f"lean consumer {statements[0] / max(stored, 1):.2f}")
+
+    if db_file:
+        database.engine.dispose()
+        os.unlink(db_file)
+
+
+if __name__ == "__main__":
+    main()
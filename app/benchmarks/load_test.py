@@ -0,0 +1,261 @@
+"""
+Load test: synthetic WhatsApp conversations end to end.
+
+Replays scripted conversations against ``main:app`` (in-process ASGI) and
+runs the outbox relay plus ``process_message`` in a local thread pool that
+stands in for the Celery worker. OpenRouter/OpenAI and Twilio are replaced
+by local stub servers with configurable latency and error injection, Redis
+by fakeredis, and the database is a throwaway SQLite file unless
+``--database-url`` points at a disposable Postgres.
+
+Reports webhook throughput and latency, end-to-end reply latency
+percentiles, database statements per message and LLM calls per message.
+``--output`` writes the same numbers as JSON to compare runs.
+
+Usage (from the ``app`` directory):
+    python -m benchmarks.load_test --conversations 100 --llm-latency 0.3
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from benchmarks.stub_servers import LLMStub, TwilioStub
+
+OPENERS = ["Oi", "Olá, boa tarde", "Bom dia", "oi tudo bem"]
+SERVICE_REQUESTS = ["Quero marcar um corte", "queria agendar manicure", "gostaria de fazer a barba"]
+WHEN = ["amanhã às 15h", "sexta às 10:30", "amanhã 14h", "segunda às 9"]
+FREE_TEXT = [
+    "Boa tarde! Vocês ainda têm horário pra hidratação essa semana? De preferência depois do almoço",
+    "Meu nome é Carla, queria saber se dá pra encaixar uma escova antes do casamento da minha irmã",
+    "Preciso remarcar aquele horário que eu tinha comentado, pode ser no fim da tarde?",
+]
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _script(rng: random.Random, llm_ratio: float):
+    """Three-turn booking conversation; some turns need the LLM."""
+    middle = rng.choice(FREE_TEXT) if rng.random() < llm_ratio else rng.choice(SERVICE_REQUESTS)
+    return [rng.choice(OPENERS), middle, rng.choice(WHEN)]
+
+
+class LocalWorker:
+    """
+    Stand-in for the Celery worker: outbox rows are run by ``process_message``
+    in a thread pool once their countdown expires.
+    """
+
+    def __init__(self, concurrency: int):
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-worker")
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def publish(self, event):
+        from workers.process_message import process_message
+        ready_at = event.available_at.replace(tzinfo=timezone.utc).timestamp()  # stored as naive UTC
+        kwargs = {**event.payload, "ready_at": ready_at}
+
+        def run():
+            time.sleep(max(0.0, ready_at - time.time()))
+            try:
+                process_message.apply(kwargs=kwargs)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+
+        with self.lock:
+            self.pending += 1
+        self.pool.submit(run)
+
+    def idle(self) -> bool:
+        with self.lock:
+            return self.pending == 0
+
+
+async def _converse(client, phone, script, think_time, sent_at, webhook_latency, errors, counter):
+    for text in script:
+        counter["sid"] += 1
+        form = {"From": f"whatsapp:{phone}", "Body": text, "MessageSid": f"SM{counter['sid']:032d}"}
+        started = time.perf_counter()
+        sent_at[phone].append(time.time())
+        response = await client.post("/webhook/whatsapp", data=form)
+        webhook_latency.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+        await asyncio.sleep(think_time)
+
+
+async def _drive(app, conversations, think_time, seed, llm_ratio):
+    import httpx
+    rng = random.Random(seed)
+    sent_at = defaultdict(list)
+    webhook_latency, errors = [], []
+    counter = {"sid": 0}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _converse(client, f"+55119{i:08d}", _script(rng, llm_ratio), think_time,
+                      sent_at, webhook_latency, errors, counter)
+            for i in range(conversations)
+        ))
+        elapsed = time.perf_counter() - started
+    return sent_at, webhook_latency, errors, elapsed
+
+
+def _reply_latencies(sent_at, twilio):
+    """Reply arrival minus the latest inbound message sent before it, per lead."""
+    latencies = []
+    for form, received in zip(list(twilio.messages), list(twilio.received_at)):
+        phone = form.get("To", "").replace("whatsapp:", "")
+        times = sent_at.get(phone, [])
+        index = bisect.bisect_right(times, received) - 1
+        if index >= 0:
+            latencies.append(received - times[index])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--think-time", type=float, default=0.5, help="seconds between a lead's messages")
+    parser.add_argument("--llm-ratio", type=float, default=0.5, help="share of conversations needing the LLM")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--twilio-latency", type=float, default=0.05)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0)
+    parser.add_argument("--coalesce-window", type=float, default=0.3)
+    parser.add_argument("--worker-concurrency", type=int, default=8)
+    parser.add_argument("--database-url", default=None, help="disposable database (default: temp SQLite file)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="max seconds to wait for replies")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    openrouter = LLMStub(latency=args.llm_latency, error_rate=args.llm_error_rate, seed=args.seed).start()
+    openai = LLMStub(latency=args.llm_latency, error_rate=args.llm_error_rate, seed=args.seed + 1).start()
+    twilio = TwilioStub(latency=args.twilio_latency, error_rate=args.twilio_error_rate, seed=args.seed).start()
+    db_file = None
+    if args.database_url is None:
+        db_file = tempfile.NamedTemporaryFile(prefix="atendente-bench-", suffix=".db", delete=False).name
+
+    # Settings are read at import time, so configure before importing the app
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{db_file}",
+        "OPENROUTER_URL": openrouter.url,
+        "OPENAI_URL": openai.url,
+        "OPENROUTER_API_KEY": "bench",
+        "OPENAI_API_KEY": "bench",
+        "LLM_HTTP2": "false",
+        "TWILIO_API_BASE": twilio.base_url,
+        "TWILIO_SID": "ACbench",
+        "TWILIO_TOKEN": "bench",
+        "TWILIO_WHATSAPP": "+15550000000",
+        "TWILIO_ACCOUNT_MPS": "1000",
+        "TWILIO_NUMBER_MPS": "1000",
+        "OUTBOUND_BACKOFF_BASE": "0.05",
+        "OUTBOUND_BACKOFF_CAP": "0.5",
+        "COALESCE_WINDOW_SECONDS": str(args.coalesce_window),
+    })
+
+    import fakeredis
+    from core.redis_client import set_redis
+    redis_server = fakeredis.FakeServer()
+    set_redis(
+        sync_client=fakeredis.FakeRedis(server=redis_server, decode_responses=True),
+        async_client=fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True),
+    )
+
+    from sqlalchemy import event
+    import main as app_main
+    import database
+    from services.twilio_service import flush_outbound
+    from workers.outbox_relay import OutboxRelay
+    from workers.event_loop import shutdown
+
+    statements = [0]
+    statements_lock = threading.Lock()
+
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        with statements_lock:
+            statements[0] += 1
+
+    worker = LocalWorker(args.worker_concurrency)
+    relay = OutboxRelay(publish=worker.publish, poll_interval=0.02)
+    relay_thread = threading.Thread(target=relay.run, daemon=True)
+    relay_thread.start()
+
+    openrouter.reset_counters()
+    openai.reset_counters()
+    sent_at, webhook_latency, errors, send_seconds = asyncio.run(
+        _drive(app_main.app, args.conversations, args.think_time, args.seed, args.llm_ratio)
+    )
+    messages = sum(len(times) for times in sent_at.values())
+
+    # Wait for the relay and the worker to drain, then for outbound sends
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        if relay.published >= messages and worker.idle():
+            break
+    flush_outbound(timeout=max(1.0, deadline - time.monotonic()))
+    relay.stop()
+    relay_thread.join(timeout=5)
+    shutdown()
+
+    replies = _reply_latencies(sent_at, twilio)
+    llm_calls = openrouter.requests + openai.requests
+    results = {
+        "conversations": args.conversations,
+        "messages": messages,
+        "webhook_errors": len(errors),
+        "webhook_rps": round(messages / send_seconds, 1) if send_seconds else 0.0,
+        "webhook_p50_ms": round(statistics.median(webhook_latency) * 1000, 2) if webhook_latency else 0.0,
+        "webhook_p99_ms": round(_percentile(webhook_latency, 99) * 1000, 2),
+        "replies": len(replies),
+        "reply_p50_s": round(_percentile(replies, 50), 3),
+        "reply_p95_s": round(_percentile(replies, 95), 3),
+        "reply_p99_s": round(_percentile(replies, 99), 3),
+        "db_statements_per_message": round(statements[0] / messages, 2) if messages else 0.0,
+        "llm_calls_per_message": round(llm_calls / messages, 3) if messages else 0.0,
+        "twilio_requests": twilio.requests,
+        "outbox_published": relay.published,
+    }
+
+    print(f"conversations / messages : {results['conversations']} / {messages} "
+          f"({results['webhook_errors']} webhook errors)")
+    print(f"webhook                  : {results['webhook_rps']} req/s  "
+          f"p50 {results['webhook_p50_ms']}ms  p99 {results['webhook_p99_ms']}ms")
+    print(f"end-to-end reply         : {results['replies']} replies  p50 {results['reply_p50_s']}s  "
+          f"p95 {results['reply_p95_s']}s  p99 {results['reply_p99_s']}s")
+    print(f"db statements / message  : {results['db_statements_per_message']}")
+    print(f"llm calls / message      : {results['llm_calls_per_message']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for stub in (openrouter, openai, twilio):
+        stub.stop()
+    if db_file:
+        database.engine.dispose()
+        os.unlink(db_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the external HTTP APIs used by AtendenteIA.
+
+Each stub runs a threaded HTTP/1.1 server on 127.0.0.1 in a background
+thread and counts the TCP connections and requests it receives, which lets
+the benchmarks show whether clients are reusing connections.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl
+
+
+class _CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, stub):
+        super().__init__(address, handler)
+        self.stub = stub
+
+    def process_request(self, request, client_address):
+        with self.stub.lock:
+            self.stub.connections += 1
+        super().process_request(request, client_address)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        with stub.lock:
+            stub.requests += 1
+        if stub.latency:
+            time.sleep(stub.latency)
+        status, payload = stub.handle(self.path, body)
+        if isinstance(payload, EventStream):
+            self._stream(status, payload)
+            return
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client gave up (e.g. a cancelled hedged request)
+            self.close_connection = True
+
+    def _stream(self, status, stream):
+        # Server-sent events over chunked encoding, one chunk per event
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in stream.events:
+                if stream.interval:
+                    time.sleep(stream.interval)
+                data = f"data: {event if isinstance(event, str) else json.dumps(event)}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                stream.sent += 1
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client stopped reading: the remaining events are never generated
+            self.close_connection = True
+        finally:
+            stream.on_close(stream)
+
+
+class EventStream:
+    """SSE response body: ``events`` are sent ``interval`` seconds apart."""
+
+    def __init__(self, events, interval: float = 0.0, on_close=None):
+        self.events = events
+        self.interval = interval
+        self.sent = 0
+        self.on_close = on_close or (lambda stream: None)
+
+
+class StubServer:
+    """Base stub server; subclasses implement ``handle``."""
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._server = _CountingServer(("127.0.0.1", port), _StubHandler, self)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, path: str, body: bytes):
+        raise NotImplementedError
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LLMStub(StubServer):
+    """
+    OpenAI-compatible ``/chat/completions`` stub returning a fixed extraction.
+
+    ``error_rate`` is the fraction of requests answered with HTTP 503; the
+    requested model names are kept in ``models``. Requests with
+    ``"stream": true`` get SSE deltas of ``chunk_chars`` characters every
+    ``token_interval`` seconds; ``streamed_chunks`` counts deltas actually sent.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        port: int = 0,
+        content: Optional[dict] = None,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        token_interval: float = 0.0,
+        chunk_chars: int = 4,
+    ):
+        super().__init__(latency=latency, port=port)
+        self.error_rate = error_rate
+        self.token_interval = token_interval
+        self.chunk_chars = chunk_chars
+        self.streamed_chunks = 0
+        self.models = []
+        self._random = random.Random(seed)
+        self.content = content or {
+            "name": "",
+            "service": "corte",
+            "preferred_date": "2025-01-10",
+            "preferred_time": "14:00",
+            "confidence": 90,
+            "missing_slots": [],
+        }
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    def handle(self, path, body):
+        with self.lock:
+            self.models.append(json.loads(body or b"{}").get("model"))
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 503, {"error": {"message": "Service unavailable"}}
+        if json.loads(body or b"{}").get("stream"):
+            return 200, self._event_stream()
+        return 200, {
+            "choices": [{"message": {"role": "assistant", "content": json.dumps(self.content)}}],
+            "usage": {"prompt_tokens": 150, "completion_tokens": 40, "total_tokens": 190},
+        }
+
+    def _event_stream(self) -> EventStream:
+        content = json.dumps(self.content)
+        pieces = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        events = [{"choices": [{"index": 0, "delta": {"content": piece}}]} for piece in pieces]
+        events.append({
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 150, "completion_tokens": len(pieces), "total_tokens": 150 + len(pieces)},
+        })
+        events.append("[DONE]")
+
+        def count(stream):
+            with self.lock:
+                self.streamed_chunks += min(stream.sent, len(pieces))
+
+        return EventStream(events, interval=self.token_interval, on_close=count)
+
+
+class TwilioStub(StubServer):
+    """
+    Twilio Messages API stub.
+
+    ``error_rate`` is the fraction of requests answered with HTTP 503 so
+    retry paths can be exercised; accepted messages are kept in ``messages``
+    with their arrival time (epoch seconds) in ``received_at``.
+    """
+
+    def __init__(self, latency: float = 0.0, port: int = 0, error_rate: float = 0.0, seed: int = 0):
+        super().__init__(latency=latency, port=port)
+        self.error_rate = error_rate
+        self.messages = []
+        self.received_at = []
+        self._random = random.Random(seed)
+
+    def handle(self, path, body):
+        if self.error_rate and self._random.random() < self.error_rate:
+            return 503, {"code": 20503, "message": "Service unavailable"}
+        form = dict(parse_qsl(body.decode()))
+        with self.lock:
+            self.messages.append(form)
+            self.received_at.append(time.time())
+            sid = f"SM{len(self.messages):032d}"
+        return 201, {"sid": sid, "status": "queued", "to": form.get("To"), "body": form.get("Body")}
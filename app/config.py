@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -12,12 +13,34 @@ class Settings:
     TWILIO_SID = os.getenv("TWILIO_SID", "")
     TWILIO_TOKEN = os.getenv("TWILIO_TOKEN", "")
     TWILIO_WHATSAPP = os.getenv("TWILIO_WHATSAPP", "")
+    TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+    TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", "10"))
+    # Check X-Twilio-Signature on webhooks (needs TWILIO_TOKEN); the URL Twilio
+    # signs is the public one, so set it when running behind a proxy
+    TWILIO_VALIDATE_SIGNATURE = os.getenv("TWILIO_VALIDATE_SIGNATURE", "true").lower() == "true"
+    WEBHOOK_PUBLIC_URL = os.getenv("WEBHOOK_PUBLIC_URL", "")  # e.g. https://atendente.example.com/webhook/whatsapp
+
+    # Outbound dispatch (rates in messages per second)
+    TWILIO_ACCOUNT_MPS = float(os.getenv("TWILIO_ACCOUNT_MPS", "100"))
+    TWILIO_NUMBER_MPS = float(os.getenv("TWILIO_NUMBER_MPS", "80"))
+    OUTBOUND_MAX_INFLIGHT = int(os.getenv("OUTBOUND_MAX_INFLIGHT", "50"))
+    OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+    OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))  # seconds
+    OUTBOUND_BACKOFF_CAP = float(os.getenv("OUTBOUND_BACKOFF_CAP", "30"))  # seconds
     
     # Google Config
     GOOGLE_CREDENTIALS = os.getenv("GOOGLE_CREDENTIALS", "")
     
     # Database Config
     DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://atendente:atendente@db:5432/atendente")
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")  # defaults to DATABASE_URL with asyncpg
+    DB_PROFILE = os.getenv("DB_PROFILE", "api")  # api or worker (workers switch on process init)
+    DB_API_POOL_SIZE = int(os.getenv("DB_API_POOL_SIZE", "10"))
+    DB_API_MAX_OVERFLOW = int(os.getenv("DB_API_MAX_OVERFLOW", "20"))
+    DB_WORKER_POOL_SIZE = int(os.getenv("DB_WORKER_POOL_SIZE", "2"))
+    DB_WORKER_MAX_OVERFLOW = int(os.getenv("DB_WORKER_MAX_OVERFLOW", "3"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
     
     # Redis Config
     REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -25,5 +48,146 @@ class Settings:
     # LLM Config
     LLM_MODEL = os.getenv("LLM_MODEL", "openrouter/auto")  # openrouter/auto, gpt-4, etc.
     LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openrouter")  # openrouter or openai
+    OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.io/api/v1/chat/completions")
+    OPENAI_URL = os.getenv("OPENAI_URL", "https://api.openai.com/v1/chat/completions")
+    OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openrouter/auto")
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    # Cheaper/faster models used for short messages
+    OPENROUTER_FAST_MODEL = os.getenv("OPENROUTER_FAST_MODEL", "openai/gpt-4.1-nano")
+    OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4.1-nano")
+    LLM_SHORT_MESSAGE_CHARS = int(os.getenv("LLM_SHORT_MESSAGE_CHARS", "60"))
+    # Ask providers for JSON-mode output (response_format=json_object)
+    LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+    # Stream completions (SSE); over HTTP/2 stop once the slot fields are parsed
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+    # Prompt registry (core.prompts): pinned versions per prompt, e.g. {"extract": "v3"};
+    # unpinned prompts use the latest version
+    LLM_PROMPT_VERSIONS = json.loads(os.getenv("LLM_PROMPT_VERSIONS", "{}"))
+    # Prompt tokens per call; longer inbound text is truncated to fit
+    LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "400"))
+    LLM_TOKENIZER_ENCODING = os.getenv("LLM_TOKENIZER_ENCODING", "o200k_base")  # tiktoken encoding, if installed
+
+    # Provider router: rolling stats, circuit breaker and hedged requests
+    LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))  # calls kept per provider/model
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))  # seconds, until enough samples
+    LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # seconds
+    LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "8"))  # seconds
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures to open
+    LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))  # windowed error rate to open
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # seconds before a probe
+
+    # Shared LLM HTTP client (one per worker process)
+    LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+    # Extraction cache (in-process L1 in front of Redis)
+    EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+    EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", "3600"))  # seconds
+    EXTRACTION_CACHE_L1_SIZE = int(os.getenv("EXTRACTION_CACHE_L1_SIZE", "1024"))
+    EXTRACTION_CACHE_L1_TTL = float(os.getenv("EXTRACTION_CACHE_L1_TTL", "300"))  # seconds
+    EXTRACTION_CACHE_MIN_CONFIDENCE = int(os.getenv("EXTRACTION_CACHE_MIN_CONFIDENCE", "70"))
+
+    # Lead / open conversation lookup cache (in-process L1 in front of Redis)
+    LOOKUP_CACHE_ENABLED = os.getenv("LOOKUP_CACHE_ENABLED", "true").lower() == "true"
+    LOOKUP_CACHE_TTL = int(os.getenv("LOOKUP_CACHE_TTL", "86400"))  # seconds
+    LOOKUP_CACHE_L1_SIZE = int(os.getenv("LOOKUP_CACHE_L1_SIZE", "10000"))
+    LOOKUP_CACHE_L1_TTL = float(os.getenv("LOOKUP_CACHE_L1_TTL", "60"))  # seconds
+
+    # Rule-based fast path that answers trivial messages without the LLM
+    FAST_NLU_ENABLED = os.getenv("FAST_NLU_ENABLED", "true").lower() == "true"
+    FAST_NLU_MIN_CONFIDENCE = int(os.getenv("FAST_NLU_MIN_CONFIDENCE", "80"))
+
+    # Per-conversation slot state
+    SLOT_STATE_TTL = int(os.getenv("SLOT_STATE_TTL", str(7 * 24 * 3600)))  # seconds
+
+    # Burst coalescing: wait this long for follow-up messages before analyzing
+    COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "3"))
+    COALESCE_KEY_TTL = int(os.getenv("COALESCE_KEY_TTL", "3600"))  # seconds
+
+    # Webhook/reply idempotency markers (Twilio retries arrive within minutes)
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))  # seconds
+
+    # Webhook mode: "full" stores the message before answering, "lean" only
+    # appends the event to INGEST_STREAM for workers/ingest_consumer.py
+    WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "full")
+    INGEST_STREAM = os.getenv("INGEST_STREAM", "stream:inbound")
+    INGEST_GROUP = os.getenv("INGEST_GROUP", "ingest")
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))  # events per multi-row insert
+    INGEST_CLAIM_IDLE = int(os.getenv("INGEST_CLAIM_IDLE", "60"))  # seconds before another consumer takes over
+
+    # Transactional outbox relay (workers/outbox_relay.py)
+    OUTBOX_CHANNEL = os.getenv("OUTBOX_CHANNEL", "outbox")  # Postgres NOTIFY channel
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))  # seconds between polls without NOTIFY
+    OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))  # keep published rows this long
+
+    # Asyncio worker runtime (workers/async_worker.py), fed through a Redis stream
+    ASYNC_WORKER_STREAM = os.getenv("ASYNC_WORKER_STREAM", "stream:process_message")
+    ASYNC_WORKER_GROUP = os.getenv("ASYNC_WORKER_GROUP", "async-workers")
+    ASYNC_WORKER_CONCURRENCY = int(os.getenv("ASYNC_WORKER_CONCURRENCY", "200"))  # turns processed at once
+    ASYNC_WORKER_DELAYED = os.getenv("ASYNC_WORKER_DELAYED", "stream:process_message:delayed")  # not due yet
+    ASYNC_WORKER_MAX_PENDING = int(os.getenv("ASYNC_WORKER_MAX_PENDING", "1000"))  # entries in flight
+    ASYNC_WORKER_LLM_CONCURRENCY = int(os.getenv("ASYNC_WORKER_LLM_CONCURRENCY", "100"))
+    ASYNC_WORKER_DB_CONCURRENCY = int(os.getenv("ASYNC_WORKER_DB_CONCURRENCY", "20"))  # keep <= async pool size
+    ASYNC_WORKER_MAX_RETRIES = int(os.getenv("ASYNC_WORKER_MAX_RETRIES", "3"))
+    ASYNC_WORKER_CLAIM_IDLE = int(os.getenv("ASYNC_WORKER_CLAIM_IDLE", "300"))  # seconds before redelivery
+    ASYNC_WORKER_PROMOTE_INTERVAL = float(os.getenv("ASYNC_WORKER_PROMOTE_INTERVAL", "0.5"))  # due-entry checks
+    ASYNC_WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("ASYNC_WORKER_SHUTDOWN_TIMEOUT", "30"))  # seconds
+
+    # Message history lifecycle: monthly partitions, idle closing, cold archive
+    MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "2"))  # months created in advance
+    MESSAGE_SID_RETENTION_DAYS = int(os.getenv("MESSAGE_SID_RETENTION_DAYS", "7"))  # webhook dedup window
+    CONVERSATION_IDLE_HOURS = float(os.getenv("CONVERSATION_IDLE_HOURS", "24"))  # close open conversations after
+    ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))  # archive closed conversations after
+    ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))  # conversations per archive file
+    ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+
+    # Batch re-extraction (services.batch_extraction)
+    BATCH_EXTRACTION_MESSAGES_PER_REQUEST = int(os.getenv("BATCH_EXTRACTION_MESSAGES_PER_REQUEST", "20"))
+    BATCH_EXTRACTION_TOKEN_BUDGET = int(os.getenv("BATCH_EXTRACTION_TOKEN_BUDGET", "3000"))  # prompt tokens per request
+    BATCH_EXTRACTION_MESSAGE_TOKENS = int(os.getenv("BATCH_EXTRACTION_MESSAGE_TOKENS", "200"))  # longer messages truncated
+    BATCH_EXTRACTION_PARALLELISM = int(os.getenv("BATCH_EXTRACTION_PARALLELISM", "4"))  # requests in flight
+    BATCH_EXTRACTION_FETCH_SIZE = int(os.getenv("BATCH_EXTRACTION_FETCH_SIZE", "1000"))  # rows per cursor fetch
+    BATCH_EXTRACTION_MAX_MESSAGES = int(os.getenv("BATCH_EXTRACTION_MAX_MESSAGES", "5000"))  # per task run
+
+    # Scheduling / availability
+    SCHEDULE_RESOURCES = [r.strip() for r in os.getenv("SCHEDULE_RESOURCES", "default").split(",") if r.strip()]
+    BUSINESS_OPEN = os.getenv("BUSINESS_OPEN", "09:00")
+    BUSINESS_CLOSE = os.getenv("BUSINESS_CLOSE", "18:00")
+    BUSINESS_DAYS = [int(d) for d in os.getenv("BUSINESS_DAYS", "0,1,2,3,4,5").split(",")]  # Monday=0
+    SLOT_STEP_MINUTES = int(os.getenv("SLOT_STEP_MINUTES", "30"))
+    SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "30"))
+    SCHEDULE_CHANGES_STREAM = os.getenv("SCHEDULE_CHANGES_STREAM", "schedule:changes")  # bookings/cancellations
+    SCHEDULE_CHANGES_RETENTION = int(os.getenv("SCHEDULE_CHANGES_RETENTION", "86400"))  # seconds kept in the stream
+    SCHEDULE_RELOAD_SECONDS = float(os.getenv("SCHEDULE_RELOAD_SECONDS", "3600"))  # full rebuild (edits outside the app)
+    SCHEDULE_REFRESH_SECONDS = float(os.getenv("SCHEDULE_REFRESH_SECONDS", "60"))  # full rebuild while Redis is down
+    AVAILABLE_SLOTS_COUNT = int(os.getenv("AVAILABLE_SLOTS_COUNT", "3"))
+    DEFAULT_SERVICE_DURATION = int(os.getenv("DEFAULT_SERVICE_DURATION", "60"))  # minutes
+    SERVICE_DURATIONS = json.loads(os.getenv(
+        "SERVICE_DURATIONS",
+        '{"corte": 30, "barba": 30, "manicure": 45, "pedicure": 45, "escova": 45, "sobrancelha": 30}'
+    ))
+
+    # Celery queue topology: live chats, outbound sends, background/batch jobs.
+    # Concurrency/prefetch apply to a worker started with a single -Q queue.
+    CELERY_LIVE_CONCURRENCY = int(os.getenv("CELERY_LIVE_CONCURRENCY", "4"))
+    CELERY_OUTBOUND_CONCURRENCY = int(os.getenv("CELERY_OUTBOUND_CONCURRENCY", "2"))
+    CELERY_BATCH_CONCURRENCY = int(os.getenv("CELERY_BATCH_CONCURRENCY", "2"))
+    CELERY_BATCH_PREFETCH = int(os.getenv("CELERY_BATCH_PREFETCH", "4"))
+    CELERY_BATCH_AUTOSCALE = os.getenv("CELERY_BATCH_AUTOSCALE", "8,1")  # max,min for --autoscale
+    LIVE_TASK_SOFT_TIME_LIMIT = int(os.getenv("LIVE_TASK_SOFT_TIME_LIMIT", "60"))  # seconds
+    LIVE_TASK_TIME_LIMIT = int(os.getenv("LIVE_TASK_TIME_LIMIT", "90"))  # seconds
+    CELERY_VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT", "3600"))  # seconds
+
+    # Observability: standalone Prometheus port for Celery workers (0 disables)
+    WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    SLOW_STAGE_SECONDS = float(os.getenv("SLOW_STAGE_SECONDS", "5"))  # stages logged at INFO with their message id
 
 settings = Settings()
@@ -1,10 +1,18 @@
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Appointment
-from schemas import AppointmentCreate
+from schemas import AppointmentCreate, AppointmentImport
+from core.availability import availability
+from services.appointment_import import bulk_insert_appointments, is_overlap_violation, parse_csv
+from core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_response
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -27,22 +35,145 @@ def create_appointment(payload: AppointmentCreate, db: Session = Depends(get_db)
         db.add(ap)
         db.commit()
         db.refresh(ap)
+        availability.book(ap.id, ap.resource, ap.start_at, ap.end_at)
         logger.info(f"Created appointment {ap.id} for lead {ap.lead_id}")
         return {"id": ap.id, "status": ap.status, "service": ap.service}
+    except IntegrityError as e:
+        db.rollback()
+        if is_overlap_violation(e):
+            logger.info(f"Rejected overlapping appointment on {payload.resource} at {payload.start_at}")
+            raise HTTPException(status_code=409, detail="Time slot already booked for this resource")
+        logger.error(f"Error creating appointment: {e}")
+        raise HTTPException(status_code=400, detail=str(e.orig))
     except Exception as e:
         logger.error(f"Error creating appointment: {e}")
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bulk", response_model=dict)
+async def bulk_import_appointments(request: Request, db: Session = Depends(get_db)):
+    """
+    Import many appointments at once from JSON or CSV.
+
+    Send a JSON array of appointments, or ``text/csv`` with a header row
+    (lead_id, service, resource, start_at, end_at and optional status).
+    Rows that would double-book a resource are skipped and counted.
+
+    Args:
+        request: Request with the JSON or CSV body
+        db: Database session
+
+    Returns:
+        Counts of received, inserted and skipped rows
+    """
+    content_type = request.headers.get("content-type", "")
+    try:
+        if "csv" in content_type:
+            raw_rows = parse_csv((await request.body()).decode("utf-8-sig"))
+        else:
+            raw_rows = await request.json()
+            if not isinstance(raw_rows, list):
+                raise ValueError("expected a JSON array")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid payload: {e}")
+
+    rows, errors = [], []
+    for index, raw in enumerate(raw_rows):
+        try:
+            item = AppointmentImport(**raw)
+            rows.append(item.dict())
+        except (ValidationError, TypeError) as e:
+            errors.append({"row": index, "error": str(e)})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors[:50])
+
+    try:
+        inserted = await run_in_threadpool(bulk_insert_appointments, db, rows)
+    except IntegrityError as e:
+        logger.error(f"Bulk import failed: {e}")
+        raise HTTPException(status_code=400, detail=str(e.orig))
+
+    # Imported cancellations hold no time, like cancel_appointment
+    availability.book_many(
+        (appointment_id, resource, start_at, end_at)
+        for appointment_id, resource, start_at, end_at, status in inserted
+        if status != "cancelled"
+    )
+    return {"received": len(rows), "inserted": len(inserted), "skipped_overlaps": len(rows) - len(inserted)}
+
+
+@router.post("/{appointment_id}/cancel", response_model=dict)
+def cancel_appointment(appointment_id: int, db: Session = Depends(get_db)):
+    """
+    Cancel an appointment and free its time in the availability index.
+
+    Args:
+        appointment_id: Appointment ID
+        db: Database session
+
+    Returns:
+        Cancelled appointment
+    """
+    try:
+        ap = db.query(Appointment).filter_by(id=appointment_id).first()
+        if not ap:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        ap.status = "cancelled"
+        db.commit()
+        availability.release(ap.id)
+        logger.info(f"Cancelled appointment {ap.id}")
+        return {"id": ap.id, "status": ap.status, "service": ap.service}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelling appointment {appointment_id}: {e}")
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @router.get("/")
-def list_appointments(db: Session = Depends(get_db)) -> List[dict]:
+def list_appointments(
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
     """
-    List all appointments.
+    List appointments ordered by start time.
+
+    Keyset-paginated on ``(start_at, id)``; filter by status and by a
+    ``[since, until)`` start-time range.
     """
     try:
-        appointments = db.query(Appointment).all()
-        return [{"id": a.id, "service": a.service, "status": a.status} for a in appointments]
+        stmt = select(Appointment.id, Appointment.service, Appointment.status, Appointment.start_at)
+        if status:
+            stmt = stmt.where(Appointment.status == status)
+        if since:
+            stmt = stmt.where(Appointment.start_at >= since)
+        if until:
+            stmt = stmt.where(Appointment.start_at < until)
+        if cursor:
+            last_at, last_id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(Appointment.start_at, Appointment.id) > (last_at, last_id))
+        stmt = stmt.order_by(Appointment.start_at, Appointment.id).limit(limit + 1)
+
+        rows = db.execute(stmt).all()
+        return page_response(
+            rows,
+            limit,
+            lambda a: {
+                "id": a.id,
+                "service": a.service,
+                "status": a.status,
+                "start_at": a.start_at.isoformat() if a.start_at else None,
+            },
+            lambda a: encode_cursor(a.start_at, a.id),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing appointments: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
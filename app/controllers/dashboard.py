@@ -1,61 +1,167 @@
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 from database import get_db
-from models import Conversation, Message
+from models import Conversation, ConversationArchive, Message
+from services.archive import read_archived_messages
+from core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_response
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
 @router.get("/conversations")
-def list_conversations(db: Session = Depends(get_db)) -> List[dict]:
+def list_conversations(
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
     """
-    List all active conversations.
+    List conversations, most recently active first.
+
+    Keyset-paginated on ``(last_message_at, id)``; pass the returned
+    ``next_cursor`` to fetch the following page. Conversations without
+    ``last_message_at`` come last, by id.
+
+    Args:
+        status: Only conversations with this status (open, closed, resolved)
+        since: Only conversations active at or after this time
+        until: Only conversations active before this time
+        cursor: Position returned by the previous page
+        limit: Page size
+        db: Database session
     """
     try:
-        conversations = db.query(Conversation).all()
-        return [
-            {
+        stmt = select(
+            Conversation.id, Conversation.lead_id, Conversation.status, Conversation.last_message_at
+        )
+        if status:
+            stmt = stmt.where(Conversation.status == status)
+        if since:
+            stmt = stmt.where(Conversation.last_message_at >= since)
+        if until:
+            stmt = stmt.where(Conversation.last_message_at < until)
+        last_at, last_id = decode_cursor(cursor) if cursor else (None, None)
+
+        # NULLs never satisfy a row comparison, so the dated conversations
+        # and the undated ones (NULLS LAST) are paged as two index-ordered runs
+        rows = []
+        if last_id is None or last_at is not None:
+            dated = stmt.where(Conversation.last_message_at.is_not(None))
+            if last_id is not None:
+                dated = dated.where(tuple_(Conversation.last_message_at, Conversation.id) < (last_at, last_id))
+            dated = dated.order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+            rows = db.execute(dated.limit(limit + 1)).all()
+        if len(rows) <= limit and not since and not until:
+            undated = stmt.where(Conversation.last_message_at.is_(None))
+            if last_at is None and last_id is not None:
+                undated = undated.where(Conversation.id < last_id)
+            undated = undated.order_by(Conversation.id.desc())
+            rows += db.execute(undated.limit(limit + 1 - len(rows))).all()
+        return page_response(
+            rows,
+            limit,
+            lambda c: {
                 "id": c.id,
                 "lead_id": c.lead_id,
                 "status": c.status,
-                "last_message_at": c.last_message_at.isoformat() if c.last_message_at else None
-            }
-            for c in conversations
-        ]
+                "last_message_at": _isoformat(c.last_message_at),
+            },
+            lambda c: encode_cursor(c.last_message_at, c.id),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing conversations: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+def _archived_rows(db: Session, cid: int, since, until, cursor, limit):
+    """Up to ``limit + 1`` archived messages matching the thread query, or []."""
+    entry = db.get(ConversationArchive, cid)
+    if entry is None:
+        return []
+    after = decode_cursor(cursor) if cursor else None
+    rows = []
+    for m in read_archived_messages(entry):
+        if since and m.timestamp < since:
+            continue
+        if until and m.timestamp >= until:
+            continue
+        if after and (m.timestamp, m.id) <= after:
+            continue
+        rows.append(m)
+        if len(rows) > limit:
+            break
+    return rows
+
+
 @router.get("/conversations/{cid}")
-def get_conversation(cid: int, db: Session = Depends(get_db)) -> List[dict]:
+def get_conversation(
+    cid: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
     """
-    Get all messages in a conversation.
-    
+    Get the messages of a conversation, oldest first.
+
+    Keyset-paginated on ``(timestamp, id)``. Threads of archived
+    conversations are read from the cold store on demand.
+
     Args:
         cid: Conversation ID
+        since: Only messages at or after this time
+        until: Only messages before this time
+        cursor: Position returned by the previous page
+        limit: Page size
         db: Database session
-        
+
     Returns:
-        List of messages
+        Page of messages
     """
     try:
-        messages = db.query(Message).filter_by(conversation_id=cid).all()
-        if not messages:
+        stmt = select(Message.id, Message.sender, Message.content, Message.timestamp).where(
+            Message.conversation_id == cid
+        )
+        if since:
+            stmt = stmt.where(Message.timestamp >= since)
+        if until:
+            stmt = stmt.where(Message.timestamp < until)
+        if cursor:
+            last_at, last_id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(Message.timestamp, Message.id) > (last_at, last_id))
+        stmt = stmt.order_by(Message.timestamp, Message.id).limit(limit + 1)
+
+        rows = db.execute(stmt).all()
+        if not rows:
+            rows = _archived_rows(db, cid, since, until, cursor, limit)
+        if not rows and not cursor:
             raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        return [
-            {
+
+        return page_response(
+            rows,
+            limit,
+            lambda m: {
                 "id": m.id,
                 "sender": m.sender,
                 "content": m.content,
-                "timestamp": m.timestamp.isoformat() if m.timestamp else None
-            }
-            for m in messages
-        ]
+                "timestamp": _isoformat(m.timestamp),
+            },
+            lambda m: encode_cursor(m.timestamp, m.id),
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -1,27 +1,39 @@
 import logging
+import time
 from typing import Optional
+from urllib.parse import parse_qsl
 from fastapi import APIRouter, Request, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from config import settings
 from database import get_db
-from models import Lead, Conversation, Message
-from workers.process_message import process_message
-from services.twilio_service import send_whatsapp
+from services.ingest import ingest_inbound_message
 from core.utils import clean_phone
+from core.coalesce import coalescer
+from core.idempotency import idempotency
+from core.metrics import current_message_id, observe_stage, timed
+from core.redis_client import get_async_redis
+from core.utils import valid_twilio_signature
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 @router.post("/whatsapp")
+@timed("webhook")
 async def whatsapp_webhook(request: Request, db: Session = Depends(get_db)):
     """
     Receive WhatsApp messages via Twilio webhook.
     
     This endpoint:
-    1. Extracts sender and message content
-    2. Creates or retrieves lead record
-    3. Stores message in conversation
-    4. Queues message for async processing
+    1. Extracts sender and message content; Twilio retries of a MessageSid
+       already seen are acknowledged without touching the database
+    2. Creates or retrieves lead record, open conversation and stores the
+       message in a single transaction (off the event loop)
+    3. Schedules processing after the coalescing window through an outbox
+       row in that same transaction (published by workers.outbox_relay), so
+       no broker round trip happens here and a burst of messages from one
+       lead is answered once
     """
     try:
         data = await request.form()
@@ -33,43 +45,121 @@ async def whatsapp_webhook(request: Request, db: Session = Depends(get_db)):
             logger.warning("Missing sender or text in webhook data")
             raise HTTPException(status_code=400, detail="Missing sender or message body")
         
+        # Twilio retries on timeouts; drop deliveries we already accepted
+        message_sid = (data.get("MessageSid") or data.get("SmsMessageSid") or "").strip() or None
+        if message_sid and not await run_in_threadpool(idempotency.claim, "twilio_sid", message_sid):
+            logger.info(f"Ignoring duplicate delivery of {message_sid}")
+            return {"status": "duplicate", "message_sid": message_sid}
+
         # Clean phone number
         clean_sender = clean_phone(sender)
         logger.info(f"Received message from {clean_sender}: {text[:50]}...")
         
-        # Get or create lead
-        lead = db.query(Lead).filter_by(phone=clean_sender).first()
-        if not lead:
-            lead = Lead(phone=clean_sender)
-            db.add(lead)
-            db.commit()
-            db.refresh(lead)
-            logger.info(f"Created new lead: {clean_sender}")
-        
-        # Get or create open conversation
-        conv = db.query(Conversation).filter_by(lead_id=lead.id, status="open").first()
-        if not conv:
-            conv = Conversation(lead_id=lead.id)
-            db.add(conv)
-            db.commit()
-            db.refresh(conv)
-            logger.info(f"Created new conversation for lead {lead.id}")
-        
-        # Store incoming message
-        msg = Message(conversation_id=conv.id, sender="lead", content=text)
-        db.add(msg)
-        db.commit()
-        db.refresh(msg)
-        logger.info(f"Stored message {msg.id} in conversation {conv.id}")
-        
-        # Queue async processing
-        process_message.delay(conv.id, msg.id)
-        logger.info(f"Queued message {msg.id} for processing")
+        try:
+            # Get or create lead and open conversation, store incoming message
+            result = await run_in_threadpool(ingest_inbound_message, db, clean_sender, text, message_sid)
+            current_message_id.set(result.message_id)
+            logger.info(f"Stored message {result.message_id} in conversation {result.conversation_id}")
+
+            # Processing was scheduled through the outbox in the same
+            # transaction; only open the coalescing window here
+            if not result.duplicate:
+                await run_in_threadpool(_register, result.conversation_id, result.message_id)
+        except Exception:
+            # Let Twilio's retry go through
+            if message_sid:
+                await run_in_threadpool(idempotency.release, "twilio_sid", message_sid)
+            raise
         
-        return {"status": "received", "message_id": msg.id}
+        status = "duplicate" if result.duplicate else "received"
+        return {"status": status, "message_id": result.message_id}
     
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing webhook: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _register(conversation_id: int, message_id: int):
+    """Register the message in its coalescing window."""
+    try:
+        coalescer.register(conversation_id, message_id)
+    except Exception as e:
+        logger.warning(f"Could not register message {message_id} for coalescing: {e}")
+
+
+class LeanWebhook:
+    """
+    Raw ASGI handler for the WhatsApp webhook that acknowledges immediately.
+
+    Skips FastAPI's form parsing and dependency injection: the body is split
+    with ``parse_qsl``, the Twilio signature checked, and ``From``, ``Body``
+    and ``MessageSid`` appended to INGEST_STREAM in a single XADD. Storing
+    the message, deduplicating Twilio retries and scheduling processing
+    happen in ``workers.ingest_consumer``. Enabled with WEBHOOK_MODE=lean.
+    """
+
+    def __init__(self, redis_client=None, stream: str = None, auth_token: str = None, public_url: str = None):
+        self._redis = redis_client
+        self.stream = stream or settings.INGEST_STREAM
+        self.auth_token = settings.TWILIO_TOKEN if auth_token is None else auth_token
+        self.public_url = settings.WEBHOOK_PUBLIC_URL if public_url is None else public_url
+        self.validate = settings.TWILIO_VALIDATE_SIGNATURE and bool(self.auth_token)
+        if settings.TWILIO_VALIDATE_SIGNATURE and not self.auth_token:
+            logger.warning("TWILIO_TOKEN not set, webhook signatures are not checked")
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_async_redis()
+
+    def _url(self, scope, headers) -> str:
+        if self.public_url:
+            return self.public_url
+        host = headers.get(b"host", b"").decode()
+        query = scope.get("query_string", b"").decode()
+        return f"{scope['scheme']}://{host}{scope['path']}" + (f"?{query}" if query else "")
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        params = parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)
+        headers = dict(scope["headers"])
+
+        if self.validate and not valid_twilio_signature(
+            self.auth_token, self._url(scope, headers), params, headers.get(b"x-twilio-signature", b"").decode()
+        ):
+            logger.warning("Rejected webhook with an invalid Twilio signature")
+            return await _respond(send, 403, b'{"detail":"Invalid signature"}')
+
+        fields = dict(params)
+        sender = fields.get("From", "").strip()
+        text = fields.get("Body", "").strip()
+        if not sender or not text:
+            return await _respond(send, 400, b'{"detail":"Missing sender or message body"}')
+        message_sid = (fields.get("MessageSid") or fields.get("SmsMessageSid") or "").strip()
+
+        try:
+            await self.redis.xadd(self.stream, {
+                "from": sender, "body": text, "sid": message_sid, "received_at": repr(time.time()),
+            })
+        except Exception as e:
+            # Twilio retries on errors, so the message is not lost
+            logger.error(f"Could not queue inbound message {message_sid}: {e}")
+            return await _respond(send, 500, b'{"detail":"Internal server error"}')
+        observe_stage("webhook_lean", time.perf_counter() - started)
+        await _respond(send, 200, b'{"status":"queued"}')
+
+
+async def _respond(send, status: int, body: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,442 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select
+from config import settings
+from core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+DEFAULT_RESOURCE = "default"
+
+
+def to_minutes(value: datetime) -> int:
+    """Minutes since the epoch for a naive datetime."""
+    return int((value - EPOCH) // timedelta(minutes=1))
+
+
+def from_minutes(value: int) -> datetime:
+    return EPOCH + timedelta(minutes=value)
+
+
+def _parse_hhmm(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class ResourceSchedule:
+    """
+    Busy intervals of one resource, sorted by start (in epoch minutes).
+
+    ``starts``, ``ends`` and ``ids`` are parallel arrays. Any interval that
+    overlaps ``[s, e)`` must start after ``s - max_duration``, so a conflict
+    check is two bisects plus a scan over the few intervals in between.
+    """
+
+    __slots__ = ("starts", "ends", "ids", "max_duration")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.ids: List[int] = []
+        self.max_duration = 0
+
+    def add(self, appointment_id: int, start: int, end: int):
+        index = bisect_left(self.starts, start)
+        while index < len(self.starts) and self.starts[index] == start and self.ids[index] < appointment_id:
+            index += 1
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.ids.insert(index, appointment_id)
+        self.max_duration = max(self.max_duration, end - start)
+
+    def remove(self, appointment_id: int, start: int) -> bool:
+        index = bisect_left(self.starts, start)
+        while index < len(self.starts) and self.starts[index] == start:
+            if self.ids[index] == appointment_id:
+                del self.starts[index], self.ends[index], self.ids[index]
+                return True
+            index += 1
+        return False
+
+    def first_conflict_end(self, start: int, end: int) -> Optional[int]:
+        """Return the latest end among intervals overlapping ``[start, end)``, or None if free."""
+        lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_left(self.starts, end)
+        conflict_end = None
+        for index in range(lo, hi):
+            if self.ends[index] > start:
+                conflict_end = max(conflict_end or 0, self.ends[index])
+        return conflict_end
+
+    def first_conflict_start(self, start: int, end: int) -> Optional[int]:
+        """Return the earliest start among intervals overlapping ``[start, end)``, or None if free."""
+        lo = bisect_left(self.starts, start - self.max_duration)
+        hi = bisect_left(self.starts, end)
+        for index in range(lo, hi):
+            if self.ends[index] > start:
+                return self.starts[index]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class AvailabilityEngine:
+    """
+    In-process index of busy time per resource plus business hours.
+
+    Built once from the ``appointments`` table, then kept current
+    incrementally: ``book``/``release`` update the index and append the
+    change to a Redis stream, and ``ensure_fresh`` applies the changes other
+    processes appended since. A full rebuild only happens on first use,
+    every SCHEDULE_RELOAD_SECONDS (edits made outside the app), when the
+    index fell further behind than the stream keeps, and every
+    SCHEDULE_REFRESH_SECONDS while Redis is unreachable.
+    """
+
+    def __init__(
+        self,
+        resources: Optional[Iterable[str]] = None,
+        open_time: str = None,
+        close_time: str = None,
+        business_days: Optional[Iterable[int]] = None,
+        step_minutes: int = None,
+        horizon_days: int = None,
+        service_durations: Optional[Dict[str, int]] = None,
+        default_duration: int = None,
+        changes_stream: str = None,
+        redis_client=None,
+    ):
+        self.resources = list(resources or settings.SCHEDULE_RESOURCES)
+        self.open_minute = _parse_hhmm(open_time or settings.BUSINESS_OPEN)
+        self.close_minute = _parse_hhmm(close_time or settings.BUSINESS_CLOSE)
+        self.business_days = set(settings.BUSINESS_DAYS if business_days is None else business_days)
+        self.step = step_minutes or settings.SLOT_STEP_MINUTES
+        self.horizon_days = horizon_days or settings.SCHEDULE_HORIZON_DAYS
+        self.service_durations = dict(settings.SERVICE_DURATIONS if service_durations is None else service_durations)
+        self.default_duration = default_duration or settings.DEFAULT_SERVICE_DURATION
+        self._schedules: Dict[str, ResourceSchedule] = {r: ResourceSchedule() for r in self.resources}
+        self._index: Dict[int, Tuple[str, int]] = {}
+        self.changes_stream = changes_stream or settings.SCHEDULE_CHANGES_STREAM
+        self._redis = redis_client
+        self._lock = threading.RLock()
+        self.loaded_at: Optional[float] = None
+        # Last change stream entry applied, and when the stream was last read
+        self._last_change: Optional[str] = None
+        self.synced_at: Optional[float] = None
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    def duration_for(self, service: Optional[str]) -> int:
+        """Duration in minutes for a service (default when unknown)."""
+        return self.service_durations.get((service or "").strip().lower(), self.default_duration)
+
+    def _schedule(self, resource: str) -> ResourceSchedule:
+        schedule = self._schedules.get(resource)
+        if schedule is None:
+            schedule = self._schedules[resource] = ResourceSchedule()
+            self.resources.append(resource)
+        return schedule
+
+    def add(self, appointment_id: int, resource: Optional[str], start_at: datetime, end_at: datetime):
+        """Mark ``[start_at, end_at)`` busy for a resource."""
+        resource = resource or DEFAULT_RESOURCE
+        with self._lock:
+            if appointment_id in self._index:
+                self.remove(appointment_id)
+            start = to_minutes(start_at)
+            self._schedule(resource).add(appointment_id, start, to_minutes(end_at))
+            self._index[appointment_id] = (resource, start)
+
+    def remove(self, appointment_id: int) -> bool:
+        """Free the time held by an appointment (e.g. after cancellation)."""
+        with self._lock:
+            entry = self._index.pop(appointment_id, None)
+            if entry is None:
+                return False
+            resource, start = entry
+            return self._schedules[resource].remove(appointment_id, start)
+
+    def book(self, appointment_id: int, resource: Optional[str], start_at: datetime, end_at: datetime):
+        """``add`` an appointment just stored and announce it to the other processes."""
+        self.book_many([(appointment_id, resource, start_at, end_at)])
+
+    def book_many(self, appointments: Iterable[Tuple[int, Optional[str], datetime, datetime]]):
+        """``book`` several ``(id, resource, start_at, end_at)`` appointments at once."""
+        changes = []
+        for appointment_id, resource, start_at, end_at in appointments:
+            self.add(appointment_id, resource, start_at, end_at)
+            changes.append({
+                "op": "add",
+                "id": appointment_id,
+                "resource": resource or DEFAULT_RESOURCE,
+                "start_at": start_at.isoformat(),
+                "end_at": end_at.isoformat(),
+            })
+        self._publish(changes)
+
+    def release(self, appointment_id: int):
+        """``remove`` a cancelled appointment and announce it to the other processes."""
+        self.remove(appointment_id)
+        self._publish([{"op": "remove", "id": appointment_id}])
+
+    def _publish(self, changes: List[Dict]):
+        if not changes:
+            return
+        # Entries older than the retention are trimmed; ids are epoch milliseconds
+        min_id = int((time.time() - settings.SCHEDULE_CHANGES_RETENTION) * 1000)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for change in changes:
+                pipe.xadd(self.changes_stream, change, minid=min_id, approximate=True)
+            pipe.execute()
+        except Exception as e:
+            # Other processes see it at their next full rebuild
+            logger.warning(f"Could not publish {len(changes)} schedule changes: {e}")
+
+    def sync(self) -> bool:
+        """
+        Apply the changes other processes published since the last sync.
+
+        Returns:
+            False if the change stream cannot be used (Redis unreachable, or
+            entries may have been trimmed since the last sync) and the index
+            needs a full rebuild
+        """
+        if self._last_change is None or self.synced_at is None:
+            return False
+        if time.monotonic() - self.synced_at >= settings.SCHEDULE_CHANGES_RETENTION:
+            return False
+        try:
+            while True:
+                entries = self.redis.xrange(self.changes_stream, min=f"({self._last_change}", count=500)
+                with self._lock:
+                    for entry_id, fields in entries:
+                        self._apply(fields)
+                        self._last_change = entry_id
+                if len(entries) < 500:
+                    break
+        except Exception as e:
+            logger.warning(f"Could not read schedule changes, falling back to periodic rebuilds: {e}")
+            self.synced_at = None
+            return False
+        self.synced_at = time.monotonic()
+        return True
+
+    def _apply(self, change: Dict[str, str]):
+        appointment_id = int(change["id"])
+        if change["op"] == "add":
+            self.add(
+                appointment_id,
+                change["resource"],
+                datetime.fromisoformat(change["start_at"]),
+                datetime.fromisoformat(change["end_at"]),
+            )
+        else:
+            self.remove(appointment_id)
+
+    def _stream_position(self) -> Optional[str]:
+        """Id of the newest change stream entry ("0-0" if empty), or None without Redis."""
+        try:
+            latest = self.redis.xrevrange(self.changes_stream, count=1)
+        except Exception as e:
+            logger.warning(f"Schedule change stream unavailable, falling back to periodic rebuilds: {e}")
+            return None
+        return latest[0][0] if latest else "0-0"
+
+    def clear(self):
+        with self._lock:
+            self._schedules = {r: ResourceSchedule() for r in self.resources}
+            self._index.clear()
+
+    def _align(self, minute: int) -> int:
+        """Round up to the slot grid and into business hours."""
+        day, offset = divmod(minute, 1440)
+        if offset < self.open_minute:
+            offset = self.open_minute
+        remainder = (offset - self.open_minute) % self.step
+        if remainder:
+            offset += self.step - remainder
+        if offset >= 1440:
+            # Rounded past midnight: next day's opening
+            return (day + 1) * 1440 + self.open_minute
+        return day * 1440 + offset
+
+    def _align_back(self, minute: int, duration: int) -> int:
+        """Round down to the slot grid, to a start that ends by closing time."""
+        day, offset = divmod(minute, 1440)
+        offset = min(offset, self.close_minute - duration)
+        if offset < self.open_minute:
+            day, offset = day - 1, self.close_minute - duration
+        offset = self.open_minute + (offset - self.open_minute) // self.step * self.step
+        return day * 1440 + offset
+
+    def _is_business_day(self, minute: int) -> bool:
+        return from_minutes(minute).weekday() in self.business_days
+
+    def find_resource(self, start_at: datetime, end_at: datetime) -> Optional[str]:
+        """Return a resource free during ``[start_at, end_at)``, or None."""
+        start, end = to_minutes(start_at), to_minutes(end_at)
+        with self._lock:
+            for resource in self.resources:
+                if self._schedules[resource].first_conflict_end(start, end) is None:
+                    return resource
+        return None
+
+    def next_free_slots(
+        self,
+        service: Optional[str],
+        near: datetime,
+        count: int = 3,
+        not_before: Optional[datetime] = None,
+    ) -> List[Tuple[datetime, str]]:
+        """
+        Find the free slots for a service closest to ``near``, before or after it.
+
+        Args:
+            service: Service name (sets the slot duration)
+            near: Preferred start; the search moves both ways from here
+            count: Number of slots to return
+            not_before: Never return slots before this time (defaults to now)
+
+        Returns:
+            List of ``(start, resource)`` tuples, nearest to ``near`` first
+            (a later slot wins a tie)
+        """
+        duration = self.duration_for(service)
+        floor = to_minutes(not_before or datetime.now())
+        origin = max(to_minutes(near), floor)
+        horizon = self.horizon_days * 1440
+        results: List[Tuple[datetime, str]] = []
+
+        with self._lock:
+            later = self._scan_forward(duration, origin, origin + horizon)
+            earlier = self._scan_back(duration, origin - 1, max(floor, origin - horizon))
+            next_later, next_earlier = next(later, None), next(earlier, None)
+            while len(results) < count and (next_later or next_earlier):
+                if next_earlier is None or (
+                    next_later is not None and next_later[0] - origin <= origin - next_earlier[0]
+                ):
+                    slot, next_later = next_later, next(later, None)
+                else:
+                    slot, next_earlier = next_earlier, next(earlier, None)
+                results.append((from_minutes(slot[0]), slot[1]))
+
+        return results
+
+    def _scan_forward(self, duration: int, cursor: int, limit: int) -> Iterator[Tuple[int, str]]:
+        """Yield ``(start, resource)`` of free slots from ``cursor`` onwards, earliest first."""
+        cursor = self._align(cursor)
+        while cursor < limit:
+            day, offset = divmod(cursor, 1440)
+            if not self._is_business_day(cursor) or offset + duration > self.close_minute:
+                cursor = self._align((day + 1) * 1440)
+                continue
+
+            end = cursor + duration
+            earliest_free = None
+            for resource in self.resources:
+                conflict_end = self._schedules[resource].first_conflict_end(cursor, end)
+                if conflict_end is None:
+                    yield cursor, resource
+                    break
+                earliest_free = conflict_end if earliest_free is None else min(earliest_free, conflict_end)
+            else:
+                # Every resource is busy: jump to the first time one frees up
+                cursor = self._align(max(earliest_free, cursor + 1))
+                continue
+            cursor += self.step
+
+    def _scan_back(self, duration: int, cursor: int, limit: int) -> Iterator[Tuple[int, str]]:
+        """Yield ``(start, resource)`` of free slots from ``cursor`` back to ``limit``, latest first."""
+        cursor = self._align_back(cursor, duration)
+        while cursor >= limit:
+            day, offset = divmod(cursor, 1440)
+            if not self._is_business_day(cursor) or offset < self.open_minute:
+                cursor = self._align_back(day * 1440 - 1, duration)
+                continue
+
+            end = cursor + duration
+            latest_free = None
+            for resource in self.resources:
+                conflict_start = self._schedules[resource].first_conflict_start(cursor, end)
+                if conflict_start is None:
+                    yield cursor, resource
+                    break
+                latest_free = conflict_start - duration if latest_free is None else max(
+                    latest_free, conflict_start - duration
+                )
+            else:
+                # Every resource is busy: jump to the last start that ends before one is taken
+                cursor = self._align_back(min(latest_free, cursor - 1), duration)
+                continue
+            cursor = self._align_back(cursor - 1, duration)
+
+    def load(self, db):
+        """Rebuild the index from upcoming, non-cancelled appointments."""
+        from models import Appointment
+        started = time.perf_counter()
+        # Read the stream position first: changes published while loading
+        # are applied again by the next sync (add and remove are idempotent)
+        position = self._stream_position()
+        cutoff = datetime.now() - timedelta(days=1)
+        rows = db.execute(
+            select(Appointment.id, Appointment.resource, Appointment.start_at, Appointment.end_at)
+            .where(Appointment.status != "cancelled", Appointment.end_at >= cutoff)
+        )
+        with self._lock:
+            self.clear()
+            for appointment_id, resource, start_at, end_at in rows:
+                self.add(appointment_id, resource, start_at, end_at)
+            self.loaded_at = time.monotonic()
+            self._last_change = position
+            self.synced_at = self.loaded_at if position is not None else None
+        logger.info(
+            f"Availability index loaded: {len(self._index)} appointments in {time.perf_counter() - started:.3f}s"
+        )
+
+    def ensure_fresh(self, db_factory=None):
+        """
+        Bring the index up to date before it is read.
+
+        Applies the changes published by other processes since the last
+        call; rebuilds from the database only when that is not enough (see
+        the class docstring).
+        """
+        if self.loaded_at is not None:
+            age = time.monotonic() - self.loaded_at
+            if age < settings.SCHEDULE_RELOAD_SECONDS and self.sync():
+                return
+            if self.synced_at is None and age < settings.SCHEDULE_REFRESH_SECONDS:
+                # Redis is down: the periodic rebuild is all there is
+                return
+        if db_factory is None:
+            from database import SessionLocal as db_factory
+        db = db_factory()
+        try:
+            self.load(db)
+        finally:
+            db.close()
+
+
+availability = AvailabilityEngine()
+
+
+def preferred_start(preferred_date: Optional[str], preferred_time: Optional[str]) -> datetime:
+    """Turn extracted ``YYYY-MM-DD``/``HH:MM`` slots into a search start."""
+    try:
+        day = date.fromisoformat(preferred_date) if preferred_date else date.today()
+    except ValueError:
+        day = date.today()
+    try:
+        minute = _parse_hhmm(preferred_time) if preferred_time else 0
+    except ValueError:
+        minute = 0
+    return datetime.combine(day, datetime.min.time()) + timedelta(minutes=minute)
@@ -0,0 +1,291 @@
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Optional
+from config import settings
+from core.metrics import CACHE_EVENTS
+from core.redis_client import get_async_redis, get_redis
+from core.utils import normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache with per-entry expiry."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _confidence(result: Dict[str, Any]) -> int:
+    try:
+        return int(float(result.get("confidence", 0)))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ExtractionCache:
+    """
+    Two-tier cache for LLM extraction results.
+
+    L1 is an in-process TTL LRU; L2 is Redis with a TTL (configure the Redis
+    instance with ``maxmemory-policy allkeys-lru`` to bound it). Keys combine
+    the normalized message, model, prompt version and the current date, since
+    relative dates such as "amanhã" resolve differently from day to day.
+    Errors and low-confidence results are never stored.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        ttl: int = None,
+        l1_size: int = None,
+        l1_ttl: float = None,
+        min_confidence: int = None,
+        enabled: bool = None,
+    ):
+        self._redis = redis_client
+        self.ttl = settings.EXTRACTION_CACHE_TTL if ttl is None else ttl
+        self.min_confidence = (
+            settings.EXTRACTION_CACHE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        )
+        self.enabled = settings.EXTRACTION_CACHE_ENABLED if enabled is None else enabled
+        self.l1 = TTLCache(
+            maxsize=settings.EXTRACTION_CACHE_L1_SIZE if l1_size is None else l1_size,
+            ttl=settings.EXTRACTION_CACHE_L1_TTL if l1_ttl is None else l1_ttl,
+        )
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "bypassed": 0, "errors": 0}
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_async_redis()
+
+    def key(self, text: str, model: str, prompt_version: str, context: str = "") -> str:
+        """Build the cache key for a message."""
+        raw = "\x1f".join([normalize_message(text), context, date.today().isoformat()])
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"nlu:{prompt_version}:{model}:{digest}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached extraction, or None on miss."""
+        if not self.enabled:
+            return None
+
+        value = self.l1.get(key)
+        if value is not None:
+            self.counters["l1_hits"] += 1
+            CACHE_EVENTS.labels("extraction", "l1_hit").inc()
+            return copy.deepcopy(value)
+
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning(f"Extraction cache read failed: {e}")
+            raw = None
+
+        if raw is None:
+            self.counters["misses"] += 1
+            CACHE_EVENTS.labels("extraction", "miss").inc()
+            return None
+
+        value = json.loads(raw)
+        self.l1.set(key, value)
+        self.counters["l2_hits"] += 1
+        CACHE_EVENTS.labels("extraction", "l2_hit").inc()
+        return copy.deepcopy(value)
+
+    async def set(self, key: str, result: Dict[str, Any]):
+        """Store an extraction unless it is an error or below the confidence threshold."""
+        if not self.enabled:
+            return
+        if "error" in result or "error" in (result.get("missing_slots") or []):
+            self.counters["bypassed"] += 1
+            return
+        if _confidence(result) < self.min_confidence:
+            self.counters["bypassed"] += 1
+            return
+
+        value = copy.deepcopy(result)
+        self.l1.set(key, value)
+        try:
+            await self.redis.set(key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning(f"Extraction cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the overall hit ratio."""
+        hits = self.counters["l1_hits"] + self.counters["l2_hits"]
+        lookups = hits + self.counters["misses"]
+        return {**self.counters, "hit_ratio": hits / lookups if lookups else 0.0, "l1_size": len(self.l1)}
+
+
+extraction_cache = ExtractionCache()
+
+
+class LookupCache:
+    """
+    Read-through cache of phone -> lead id and lead id -> open conversation id.
+
+    Same tiers as ExtractionCache: a short-lived in-process L1 in front of
+    Redis. A lead id never changes for a phone; the open conversation does
+    when it is closed, so ``forget_conversations`` is called on every status
+    change. Other processes may still hold the old id in their L1 for up to
+    LOOKUP_CACHE_L1_TTL, so callers must treat a cached conversation id as a
+    hint and check that it is still open (see services.ingest). Redis errors
+    are logged and count as misses.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        ttl: int = None,
+        l1_size: int = None,
+        l1_ttl: float = None,
+        enabled: bool = None,
+    ):
+        self._redis = redis_client
+        self.ttl = settings.LOOKUP_CACHE_TTL if ttl is None else ttl
+        self.enabled = settings.LOOKUP_CACHE_ENABLED if enabled is None else enabled
+        self.l1 = TTLCache(
+            maxsize=settings.LOOKUP_CACHE_L1_SIZE if l1_size is None else l1_size,
+            ttl=settings.LOOKUP_CACHE_L1_TTL if l1_ttl is None else l1_ttl,
+        )
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "stale": 0, "errors": 0}
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    def lead_id(self, phone: str, load: Callable[[], Optional[int]] = None) -> Optional[int]:
+        """Return the lead id of ``phone``, calling ``load`` on a miss."""
+        return self._get("lead", f"lookup:lead:{phone}", load)
+
+    def open_conversation_id(self, lead_id: int, load: Callable[[], Optional[int]] = None) -> Optional[int]:
+        """Return the id of the lead's open conversation, calling ``load`` on a miss."""
+        return self._get("open_conversation", f"lookup:conversation:{lead_id}", load)
+
+    def remember(self, phone: str, lead_id: int, conversation_id: Optional[int] = None):
+        """Store the lead id of ``phone`` and, if given, its open conversation."""
+        if not self.enabled:
+            return
+        values = {f"lookup:lead:{phone}": lead_id}
+        if conversation_id is not None:
+            values[f"lookup:conversation:{lead_id}"] = conversation_id
+        # Skip the Redis write when this process already knows the ids
+        values = {k: v for k, v in values.items() if self.l1.get(k) != v}
+        if values:
+            self._set(values)
+
+    def forget_conversations(self, lead_ids: Iterable[int], stale: bool = False):
+        """
+        Drop the open conversation of each lead.
+
+        Args:
+            lead_ids: Leads whose conversation was closed or replaced
+            stale: The entry was found outdated by a reader (counted as ``stale``)
+        """
+        keys = [f"lookup:conversation:{lead_id}" for lead_id in lead_ids]
+        if not keys or not self.enabled:
+            return
+        for key in keys:
+            self.l1.delete(key)
+        if stale:
+            self.counters["stale"] += len(keys)
+            CACHE_EVENTS.labels("open_conversation", "stale").inc(len(keys))
+        try:
+            self.redis.delete(*keys)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning(f"Lookup cache invalidation failed: {e}")
+
+    def _get(self, cache: str, key: str, load: Optional[Callable[[], Optional[int]]]) -> Optional[int]:
+        if not self.enabled:
+            return load() if load else None
+
+        value = self.l1.get(key)
+        if value is not None:
+            self.counters["l1_hits"] += 1
+            CACHE_EVENTS.labels(cache, "l1_hit").inc()
+            return value
+
+        try:
+            raw = self.redis.get(key)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning(f"Lookup cache read failed: {e}")
+            raw = None
+        if raw is not None:
+            value = int(raw)
+            self.l1.set(key, value)
+            self.counters["l2_hits"] += 1
+            CACHE_EVENTS.labels(cache, "l2_hit").inc()
+            return value
+
+        self.counters["misses"] += 1
+        CACHE_EVENTS.labels(cache, "miss").inc()
+        value = load() if load else None
+        if value is not None:
+            self._set({key: value})
+        return value
+
+    def _set(self, values: Dict[str, int]):
+        for key, value in values.items():
+            self.l1.set(key, value)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(key, value, ex=self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.warning(f"Lookup cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the overall hit ratio."""
+        hits = self.counters["l1_hits"] + self.counters["l2_hits"]
+        lookups = hits + self.counters["misses"]
+        return {**self.counters, "hit_ratio": hits / lookups if lookups else 0.0, "l1_size": len(self.l1)}
+
+
+lookup_cache = LookupCache()
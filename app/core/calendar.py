@@ -1,6 +1,80 @@
-def get_available_slots(nlu):
-    # mock for MVP
-    return ["2025-01-10 14:00"]
+import logging
+from datetime import datetime, timedelta
+from typing import List
+from sqlalchemy.exc import IntegrityError
+from config import settings
+from core.availability import availability, preferred_start
+from core.metrics import timed
+from services.appointment_import import is_overlap_violation
+
+logger = logging.getLogger(__name__)
+
+SLOT_FORMAT = "%Y-%m-%d %H:%M"
+
+
+@timed("get_available_slots")
+def get_available_slots(nlu) -> List[str]:
+    """
+    Return the free slots closest to the requested date and time.
+
+    Args:
+        nlu: Extraction with service, preferred_date and preferred_time
+
+    Returns:
+        Slot start times formatted as ``YYYY-MM-DD HH:MM``, nearest first
+    """
+    availability.ensure_fresh()
+    near = preferred_start(nlu.get("preferred_date"), nlu.get("preferred_time"))
+    slots = availability.next_free_slots(nlu.get("service"), near, count=settings.AVAILABLE_SLOTS_COUNT)
+    return [start.strftime(SLOT_FORMAT) for start, _ in slots]
+
 
 def create_event(slot, lead, nlu):
-    return {"status": "created", "slot": slot}
+    """
+    Book ``slot`` for the lead and add it to the availability index.
+
+    Args:
+        slot: Slot string returned by ``get_available_slots``
+        lead: Lead being booked
+        nlu: Extraction with the service
+
+    Returns:
+        Dictionary with the created appointment
+    """
+    from database import SessionLocal
+    from models import Appointment
+
+    service = nlu.get("service") or "atendimento"
+    start_at = datetime.strptime(slot, SLOT_FORMAT)
+    end_at = start_at + timedelta(minutes=availability.duration_for(service))
+    resource = availability.find_resource(start_at, end_at)
+    if resource is None:
+        raise ValueError(f"Slot {slot} is no longer available")
+
+    db = SessionLocal()
+    try:
+        appointment = Appointment(
+            lead_id=lead.id,
+            service=service,
+            resource=resource,
+            start_at=start_at,
+            end_at=end_at,
+            status="confirmed",
+        )
+        db.add(appointment)
+        db.commit()
+        availability.book(appointment.id, resource, start_at, end_at)
+        logger.info(f"Booked appointment {appointment.id} ({service}) for lead {lead.id} at {slot} on {resource}")
+        return {"status": "created", "slot": slot, "appointment_id": appointment.id, "resource": resource}
+    except IntegrityError as e:
+        db.rollback()
+        if is_overlap_violation(e):
+            # Another process booked it first; pick up its change
+            availability.sync()
+            raise ValueError(f"Slot {slot} is no longer available")
+        raise
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,146 @@
+import logging
+from typing import Iterable, List, Optional, Tuple
+from config import settings
+from core.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS: pending list, latest id
+# ARGV: message id, key TTL
+# Appends the message to the window and moves latest forward only, so
+# registrations finishing out of order never put an older id back.
+REGISTER_SCRIPT = """
+local msg_id = tonumber(ARGV[1])
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+local latest = tonumber(redis.call('GET', KEYS[2]) or '0')
+if msg_id > latest then
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+else
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+return latest
+"""
+
+# KEYS: pending list, latest id, handled id, claimed batch list
+# ARGV: message id, key TTL
+# Returns the claimed message ids, 0 if a newer message will handle the
+# batch, or -1 if the message was already handled.
+CLAIM_SCRIPT = """
+local msg_id = tonumber(ARGV[1])
+local handled = tonumber(redis.call('GET', KEYS[3]) or '0')
+if msg_id == handled then
+    return redis.call('LRANGE', KEYS[4], 0, -1)
+end
+if msg_id < handled then
+    return -1
+end
+local latest = tonumber(redis.call('GET', KEYS[2]) or '0')
+if latest > msg_id then
+    return 0
+end
+local pending = redis.call('LRANGE', KEYS[1], 0, -1)
+if #pending == 0 then
+    pending = {ARGV[1]}
+end
+redis.call('DEL', KEYS[1], KEYS[4])
+redis.call('RPUSH', KEYS[4], unpack(pending))
+redis.call('SET', KEYS[3], ARGV[1], 'EX', ARGV[2])
+redis.call('EXPIRE', KEYS[4], ARGV[2])
+return pending
+"""
+
+
+class MessageCoalescer:
+    """
+    Per-conversation debounce window for inbound messages.
+
+    The webhook registers every message and schedules ``process_message``
+    after the window. When a task runs, only the task for the newest
+    message claims the batch; earlier tasks see a newer message and exit,
+    so a burst of messages yields one analysis and one reply.
+    """
+
+    def __init__(self, redis_client=None, window: float = None, ttl: int = None, async_redis_client=None):
+        self._redis = redis_client
+        self._async_redis = async_redis_client
+        self.window = settings.COALESCE_WINDOW_SECONDS if window is None else window
+        self.ttl = settings.COALESCE_KEY_TTL if ttl is None else ttl
+        self._register = None
+        self._claim = None
+        self._claim_async = None
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    @property
+    def async_redis(self):
+        return self._async_redis if self._async_redis is not None else get_async_redis()
+
+    @staticmethod
+    def _keys(conversation_id: int) -> List[str]:
+        prefix = f"conv:{conversation_id}"
+        return [f"{prefix}:pending", f"{prefix}:latest", f"{prefix}:handled", f"{prefix}:batch"]
+
+    def _register_script(self):
+        if self._register is None:
+            self._register = self.redis.register_script(REGISTER_SCRIPT)
+        return self._register
+
+    def register(self, conversation_id: int, message_id: int):
+        """Add a message to its conversation's pending window."""
+        self._register_script()(keys=self._keys(conversation_id)[:2], args=[message_id, self.ttl])
+
+    def register_many(self, messages: Iterable[Tuple[int, int]]):
+        """Register ``(conversation_id, message_id)`` pairs in one round trip, oldest first."""
+        script = self._register_script()
+        pipe = self.redis.pipeline(transaction=False)
+        for conversation_id, message_id in messages:
+            script(keys=self._keys(conversation_id)[:2], args=[message_id, self.ttl], client=pipe)
+        pipe.execute()
+
+    def claim(self, conversation_id: int, message_id: int) -> Optional[List[int]]:
+        """
+        Claim the pending batch for a message's task.
+
+        Args:
+            conversation_id: Conversation ID
+            message_id: Message the task was queued for
+
+        Returns:
+            Message ids to process together (oldest first), or None when the
+            task is stale and should be dropped
+        """
+        try:
+            if self._claim is None:
+                self._claim = self.redis.register_script(CLAIM_SCRIPT)
+            result = self._claim(keys=self._keys(conversation_id), args=[message_id, self.ttl])
+        except Exception as e:
+            logger.warning(f"Coalescing unavailable for conversation {conversation_id}, processing alone: {e}")
+            return [message_id]
+        return self._claimed(conversation_id, message_id, result)
+
+    async def claim_async(self, conversation_id: int, message_id: int) -> Optional[List[int]]:
+        """``claim`` for code running on an event loop (asyncio Redis client)."""
+        try:
+            if self._claim_async is None:
+                self._claim_async = self.async_redis.register_script(CLAIM_SCRIPT)
+            result = await self._claim_async(keys=self._keys(conversation_id), args=[message_id, self.ttl])
+        except Exception as e:
+            logger.warning(f"Coalescing unavailable for conversation {conversation_id}, processing alone: {e}")
+            return [message_id]
+        return self._claimed(conversation_id, message_id, result)
+
+    @staticmethod
+    def _claimed(conversation_id: int, message_id: int, result) -> Optional[List[int]]:
+        if result == 0:
+            logger.info(f"Message {message_id} superseded by a newer message in conversation {conversation_id}")
+            return None
+        if result == -1:
+            logger.info(f"Message {message_id} in conversation {conversation_id} was already handled")
+            return None
+        return sorted(int(mid) for mid in result)
+
+
+coalescer = MessageCoalescer()
@@ -0,0 +1,139 @@
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from config import settings
+from core.fast_nlu import REQUIRED_SLOTS
+from core.redis_client import get_async_redis, get_redis
+from models import Conversation
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+SLOT_FIELDS = ["name", "service", "preferred_date", "preferred_time"]
+
+
+def merge_slots(state: Optional[Dict[str, Any]], extraction: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge a new extraction into the known slot state.
+
+    Non-empty values from the extraction win; slots the lead did not mention
+    again keep their previous value. ``missing_slots`` is recomputed from the
+    merged state rather than trusted from the model.
+
+    Args:
+        state: Slot state known so far (may be empty)
+        extraction: Result of ``analyze_message`` for the latest message
+
+    Returns:
+        Merged extraction in the ``analyze_message`` shape
+    """
+    merged = {slot: (state or {}).get(slot) or "" for slot in SLOT_FIELDS}
+    for slot in SLOT_FIELDS:
+        value = extraction.get(slot)
+        if isinstance(value, str) and value.strip():
+            merged[slot] = value.strip()
+    merged["missing_slots"] = [slot for slot in REQUIRED_SLOTS if not merged[slot]]
+    merged["confidence"] = extraction.get("confidence", 0)
+    if "intent" in extraction:
+        merged["intent"] = extraction["intent"]
+    return merged
+
+
+def compact_state(state: Optional[Dict[str, Any]]) -> str:
+    """Render the known slots as a short ``key=value`` string for the prompt."""
+    if not state:
+        return ""
+    return "; ".join(f"{slot}={state[slot]}" for slot in SLOT_FIELDS if state.get(slot))
+
+
+class SlotStateStore:
+    """
+    Per-conversation slot state kept in Redis with Postgres as fallback.
+
+    Reads hit Redis first and fall back to ``conversations.slot_state`` when
+    the key expired or Redis is unavailable; writes go to both.
+    """
+
+    def __init__(self, redis_client=None, ttl: int = None, async_redis_client=None):
+        self._redis = redis_client
+        self._async_redis = async_redis_client
+        self.ttl = settings.SLOT_STATE_TTL if ttl is None else ttl
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    @property
+    def async_redis(self):
+        return self._async_redis if self._async_redis is not None else get_async_redis()
+
+    @staticmethod
+    def _key(conversation_id: int) -> str:
+        return f"conv:{conversation_id}:slots"
+
+    def load(self, conv: Conversation) -> Dict[str, Any]:
+        """Return the slot state for a conversation (empty dict if none)."""
+        try:
+            raw = self.redis.get(self._key(conv.id))
+            if raw is not None:
+                return json.loads(raw)
+        except Exception as e:
+            logger.warning(f"Slot state read from Redis failed for conversation {conv.id}: {e}")
+        return dict(conv.slot_state or {})
+
+    async def load_async(self, conv: Conversation) -> Dict[str, Any]:
+        """``load`` for code running on an event loop (asyncio Redis client)."""
+        try:
+            raw = await self.async_redis.get(self._key(conv.id))
+            if raw is not None:
+                return json.loads(raw)
+        except Exception as e:
+            logger.warning(f"Slot state read from Redis failed for conversation {conv.id}: {e}")
+        return dict(conv.slot_state or {})
+
+    @staticmethod
+    def _compact(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {slot: state.get(slot, "") for slot in SLOT_FIELDS if state.get(slot)}
+
+    @staticmethod
+    def _update(conv: Conversation, compact: Dict[str, Any]):
+        # Core UPDATE so the bot's bookkeeping does not bump last_message_at
+        return (
+            update(Conversation)
+            .where(Conversation.id == conv.id)
+            .values(slot_state=compact or None, last_message_at=Conversation.last_message_at)
+        )
+
+    def save(self, db: Session, conv: Conversation, state: Dict[str, Any]):
+        """Persist the slot state to Redis and Postgres."""
+        compact = self._compact(state)
+        try:
+            self.redis.set(self._key(conv.id), json.dumps(compact), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Slot state write to Redis failed for conversation {conv.id}: {e}")
+        db.execute(self._update(conv, compact))
+        db.commit()
+        set_committed_value(conv, "slot_state", compact or None)
+
+    async def save_async(self, db: "AsyncSession", conv: Conversation, state: Dict[str, Any]):
+        """``save`` with an AsyncSession and the asyncio Redis client."""
+        compact = self._compact(state)
+        try:
+            await self.async_redis.set(self._key(conv.id), json.dumps(compact), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Slot state write to Redis failed for conversation {conv.id}: {e}")
+        await db.execute(self._update(conv, compact))
+        await db.commit()
+        set_committed_value(conv, "slot_state", compact or None)
+
+    def clear(self, db: Session, conv: Conversation):
+        """Forget the slot state, e.g. once the appointment is booked."""
+        self.save(db, conv, {})
+
+
+slot_state_store = SlotStateStore()
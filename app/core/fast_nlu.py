@@ -0,0 +1,248 @@
+import logging
+import re
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
+from core.metrics import CACHE_EVENTS
+from core.utils import normalize_message
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_SLOTS = ["service", "preferred_date", "preferred_time"]
+
+# Canonical service name -> normalized keywords that identify it
+SERVICE_LEXICON = {
+    "corte": ["corte", "cortar", "corte de cabelo", "cortar cabelo"],
+    "barba": ["barba", "fazer a barba", "aparar barba"],
+    "manicure": ["manicure", "unha", "unhas", "fazer as unhas"],
+    "pedicure": ["pedicure", "pe", "pes"],
+    "escova": ["escova", "escovinha"],
+    "coloração": ["coloracao", "pintar cabelo", "tintura", "luzes", "mechas"],
+    "hidratação": ["hidratacao"],
+    "sobrancelha": ["sobrancelha", "sobrancelhas", "design de sobrancelha"],
+    "depilação": ["depilacao"],
+    "massagem": ["massagem"],
+    "limpeza de pele": ["limpeza de pele", "limpeza"],
+    "consulta": ["consulta", "avaliacao"],
+}
+
+GREETINGS = ["oi", "oie", "ola", "opa", "e ai", "bom dia", "boa tarde", "boa noite", "tudo bem", "tudo bom"]
+CONFIRMATIONS = ["sim", "s", "claro", "pode ser", "confirmo", "confirmado", "ok", "isso", "beleza", "fechado", "perfeito"]
+DENIALS = ["nao", "n", "nao posso", "nao quero", "negativo"]
+
+# Words that carry no slot information but are typical in booking requests
+FILLER_WORDS = {
+    "quero", "queria", "gostaria", "de", "da", "do", "um", "uma", "o", "a", "os", "as", "e",
+    "marcar", "agendar", "reservar", "horario", "para", "pra", "no", "na", "dia", "hora",
+    "horas", "por", "favor", "pf", "pfv", "obrigado", "obrigada", "me", "eu", "fazer",
+    "cabelo", "feira", "proxima", "proximo", "que", "vem", "ate",
+}
+
+WEEKDAYS = {
+    "segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6,
+}
+
+
+def _alternation(phrases: List[str]) -> str:
+    # Longest first so multi-word phrases win over their prefixes
+    return "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+
+
+_SERVICE_KEYWORDS = {kw: name for name, kws in SERVICE_LEXICON.items() for kw in kws}
+SERVICE_RE = re.compile(rf"\b({_alternation(list(_SERVICE_KEYWORDS))})\b")
+GREETING_RE = re.compile(rf"\b({_alternation(GREETINGS)})\b")
+CONFIRM_RE = re.compile(rf"^({_alternation(CONFIRMATIONS)})$")
+DENY_RE = re.compile(rf"^({_alternation(DENIALS)})$")
+NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?\b")
+RELATIVE_DATE_RE = re.compile(r"\b(depois de amanha|amanha|hoje)\b")
+WEEKDAY_RE = re.compile(rf"\b({_alternation(list(WEEKDAYS))})\b")
+TIME_RE = re.compile(r"\b(?:as\s+)?(\d{1,2})(?::(\d{2})|h(\d{2})?\b|\s*horas?\b)")
+BARE_HOUR_RE = re.compile(r"\bas\s+(\d{1,2})\b")
+NOON_RE = re.compile(r"\b(meio dia|meio-dia)\b")
+
+
+def _parse_date(text: str, today: date) -> Tuple[Optional[str], List[Tuple[int, int]]]:
+    match = NUMERIC_DATE_RE.search(text)
+    if match:
+        day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        try:
+            if year:
+                year = int(year) + (2000 if len(year) == 2 else 0)
+                value = date(year, month, day)
+            else:
+                value = date(today.year, month, day)
+                if value < today:
+                    value = date(today.year + 1, month, day)
+        except ValueError:
+            return None, []
+        return value.isoformat(), [match.span()]
+
+    match = RELATIVE_DATE_RE.search(text)
+    if match:
+        offset = {"hoje": 0, "amanha": 1, "depois de amanha": 2}[match.group(1)]
+        return (today + timedelta(days=offset)).isoformat(), [match.span()]
+
+    match = WEEKDAY_RE.search(text)
+    if match:
+        ahead = (WEEKDAYS[match.group(1)] - today.weekday()) % 7
+        return (today + timedelta(days=ahead)).isoformat(), [match.span()]
+
+    return None, []
+
+
+def _parse_time(text: str) -> Tuple[Optional[str], List[Tuple[int, int]]]:
+    match = NOON_RE.search(text)
+    if match:
+        return "12:00", [match.span()]
+
+    match = TIME_RE.search(text) or BARE_HOUR_RE.search(text)
+    if not match:
+        return None, []
+    hour = int(match.group(1))
+    minute = 0
+    if match.re is TIME_RE:
+        minute = int(match.group(2) or match.group(3) or 0)
+    if hour > 23 or minute > 59:
+        return None, []
+    return f"{hour:02d}:{minute:02d}", [match.span()]
+
+
+def extract(text: str, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Extract booking slots from a Portuguese message without calling the LLM.
+
+    Recognizes greetings, yes/no answers, explicit dates ("10/01", "amanhã",
+    "sexta"), times ("14h", "15:30", "às 9") and services from the lexicon.
+    Confidence reflects how much of the message was understood: every word
+    must be a recognized entity or a filler word for a high score.
+
+    Args:
+        text: Raw message text
+        today: Reference date for relative expressions (defaults to today)
+
+    Returns:
+        Dictionary with the same shape as ``analyze_message`` plus ``intent``
+    """
+    today = today or date.today()
+    normalized = normalize_message(text)
+    result = {
+        "name": "",
+        "service": "",
+        "preferred_date": "",
+        "preferred_time": "",
+        "missing_slots": list(REQUIRED_SLOTS),
+        "confidence": 0,
+        "intent": "unknown",
+        "source": "fast_path",
+    }
+    if not normalized:
+        return result
+
+    if CONFIRM_RE.match(normalized):
+        result.update(intent="confirm", confidence=95)
+        return result
+    if DENY_RE.match(normalized):
+        result.update(intent="deny", confidence=95)
+        return result
+
+    spans: List[Tuple[int, int]] = []
+
+    preferred_date, date_spans = _parse_date(normalized, today)
+    spans += date_spans
+    preferred_time, time_spans = _parse_time(normalized)
+    spans += time_spans
+
+    service = ""
+    for match in SERVICE_RE.finditer(normalized):
+        if not service:
+            service = _SERVICE_KEYWORDS[match.group(1)]
+        spans.append(match.span())
+
+    greeting_spans = [m.span() for m in GREETING_RE.finditer(normalized)]
+    spans += greeting_spans
+
+    # Blank out recognized entities and score what is left
+    masked = list(normalized)
+    for start, end in spans:
+        masked[start:end] = " " * (end - start)
+    leftover = "".join(masked).split()
+    unknown = [word for word in leftover if word not in FILLER_WORDS]
+    total = len(normalized.split())
+    coverage = 1 - len(unknown) / total if total else 0.0
+
+    result["service"] = service
+    result["preferred_date"] = preferred_date or ""
+    result["preferred_time"] = preferred_time or ""
+    result["missing_slots"] = [slot for slot in REQUIRED_SLOTS if not result[slot]]
+    if service or preferred_date or preferred_time:
+        result["intent"] = "booking"
+    elif greeting_spans:
+        result["intent"] = "greeting"
+
+    if result["intent"] == "unknown":
+        return result
+    result["confidence"] = int(95 * coverage)
+    return result
+
+
+class FastPathStats:
+    """Hit-ratio and latency-saved counters for the fast path."""
+
+    def __init__(self, log_every: int = 100):
+        self.log_every = log_every
+        self.attempts = 0
+        self.hits = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self._lock:
+            self.attempts += 1
+            self.hits += int(hit)
+            attempts = self.attempts
+        CACHE_EVENTS.labels("fast_nlu", "hit" if hit else "miss").inc()
+        if self.log_every and attempts % self.log_every == 0:
+            logger.info(f"Fast-path NLU stats: {self.snapshot()}")
+
+    def observe_llm_latency(self, seconds: float):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return hit ratio, LLM calls avoided and estimated latency saved."""
+        with self._lock:
+            avg_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "hit_ratio": self.hits / self.attempts if self.attempts else 0.0,
+                "llm_calls_avoided": self.hits,
+                "avg_llm_latency_s": round(avg_llm, 4),
+                "estimated_latency_saved_s": round(self.hits * avg_llm, 3),
+            }
+
+
+stats = FastPathStats()
+
+
+def try_extract(text: str, min_confidence: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Run the fast path and return its result only if it is confident enough.
+
+    Args:
+        text: Raw message text
+        min_confidence: Threshold (defaults to settings.FAST_NLU_MIN_CONFIDENCE)
+
+    Returns:
+        Extraction dict, or None when the LLM should handle the message
+    """
+    if not settings.FAST_NLU_ENABLED:
+        return None
+    threshold = settings.FAST_NLU_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    result = extract(text)
+    hit = result["confidence"] >= threshold
+    stats.record(hit)
+    return result if hit else None
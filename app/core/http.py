@@ -0,0 +1,68 @@
+import logging
+import os
+from typing import Dict, Optional
+import httpx
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Long-lived clients, keyed by name and owned by the current process
+_clients: Dict[str, httpx.AsyncClient] = {}
+_owner_pid: Optional[int] = None
+
+
+def get_async_client(name: str = "llm", **options) -> httpx.AsyncClient:
+    """
+    Return the shared async HTTP client registered under ``name``.
+
+    The client is created on first use and reused for every later call in the
+    same process, so TCP/TLS connections stay warm between messages. Clients
+    inherited through ``fork`` are discarded because their sockets belong to
+    the parent process.
+
+    Args:
+        name: Client name (one pool per upstream)
+        **options: Extra ``httpx.AsyncClient`` arguments used on creation
+
+    Returns:
+        Shared httpx.AsyncClient
+    """
+    global _owner_pid
+    if _owner_pid != os.getpid():
+        _clients.clear()
+        _owner_pid = os.getpid()
+
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        kwargs = {
+            "http2": settings.LLM_HTTP2,
+            "timeout": settings.LLM_HTTP_TIMEOUT,
+            "limits": httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+            ),
+        }
+        kwargs.update(options)
+        client = httpx.AsyncClient(**kwargs)
+        _clients[name] = client
+        logger.info(f"Created shared HTTP client '{name}' (pid {os.getpid()})")
+    return client
+
+
+def get_llm_client() -> httpx.AsyncClient:
+    """Return the shared client used for LLM provider calls."""
+    return get_async_client("llm")
+
+
+async def close_async_clients():
+    """Close every shared client owned by this process."""
+    if _owner_pid != os.getpid():
+        _clients.clear()
+        return
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing HTTP client '{name}': {e}")
+    _clients.clear()
@@ -0,0 +1,67 @@
+import logging
+from config import settings
+from core.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyGuard:
+    """
+    First-writer-wins markers in Redis (``SET NX EX``).
+
+    Used to drop webhook retries before they touch Postgres and to make sure
+    a retried task never sends the same reply twice. When Redis is down the
+    guard fails open: callers proceed and rely on database constraints.
+    """
+
+    def __init__(self, redis_client=None, ttl: int = None, async_redis_client=None):
+        self._redis = redis_client
+        self._async_redis = async_redis_client
+        self.ttl = settings.IDEMPOTENCY_TTL if ttl is None else ttl
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    @property
+    def async_redis(self):
+        return self._async_redis if self._async_redis is not None else get_async_redis()
+
+    def claim(self, namespace: str, key: str, ttl: int = None) -> bool:
+        """
+        Mark ``namespace:key`` as taken.
+
+        Returns:
+            True if this caller claimed it (or Redis is unavailable), False
+            if it was already claimed
+        """
+        try:
+            return bool(self.redis.set(f"idem:{namespace}:{key}", "1", nx=True, ex=ttl or self.ttl))
+        except Exception as e:
+            logger.warning(f"Idempotency check for {namespace}:{key} failed, proceeding: {e}")
+            return True
+
+    async def claim_async(self, namespace: str, key: str, ttl: int = None) -> bool:
+        """``claim`` for code running on an event loop (asyncio Redis client)."""
+        try:
+            return bool(await self.async_redis.set(f"idem:{namespace}:{key}", "1", nx=True, ex=ttl or self.ttl))
+        except Exception as e:
+            logger.warning(f"Idempotency check for {namespace}:{key} failed, proceeding: {e}")
+            return True
+
+    def release(self, namespace: str, key: str):
+        """Drop a claim so a later retry can run (e.g. after a failed attempt)."""
+        try:
+            self.redis.delete(f"idem:{namespace}:{key}")
+        except Exception as e:
+            logger.warning(f"Could not release {namespace}:{key}: {e}")
+
+    async def release_async(self, namespace: str, key: str):
+        """``release`` for code running on an event loop (asyncio Redis client)."""
+        try:
+            await self.async_redis.delete(f"idem:{namespace}:{key}")
+        except Exception as e:
+            logger.warning(f"Could not release {namespace}:{key}: {e}")
+
+
+idempotency = IdempotencyGuard()
@@ -0,0 +1,154 @@
+import json
+import re
+from typing import Any, Dict, Tuple
+
+FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+UNQUOTED_KEY_RE = re.compile(r"([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:")
+PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+PY_LITERAL_RE = re.compile(r"\b(True|False|None)\b")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def _outermost_object(text: str) -> str:
+    # Drop prose around the JSON object ("Aqui está o JSON: {...} Espero ter ajudado")
+    start = text.find("{")
+    if start == -1:
+        return text
+    end = text.rfind("}")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _close_truncated(text: str) -> str:
+    # Close strings, arrays and objects left open by a cut-off completion
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r",\s*$", "", text.rstrip())
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def _repair(text: str) -> str:
+    text = text.translate(SMART_QUOTES)
+    if '"' not in text:
+        text = text.replace("'", '"')
+    text = UNQUOTED_KEY_RE.sub(r'\1"\2":', text)
+    text = PY_LITERAL_RE.sub(lambda m: PY_LITERALS[m.group(1)], text)
+    text = _close_truncated(text)
+    return TRAILING_COMMA_RE.sub(r"\1", text)
+
+
+def parse_llm_json(content: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Parse a JSON object from an LLM completion, repairing common defects.
+
+    Handles markdown fences, prose around the object, single or smart
+    quotes, unquoted keys, Python literals, trailing commas and output
+    truncated by ``max_tokens``.
+
+    Args:
+        content: Raw completion text
+
+    Returns:
+        ``(object, repaired)`` where ``repaired`` tells whether fixes were needed
+
+    Raises:
+        ValueError: The content does not contain a recoverable JSON object
+    """
+    text = FENCE_RE.sub("", (content or "").strip())
+    try:
+        value = json.loads(text)
+        repaired = False
+    except json.JSONDecodeError:
+        try:
+            value = json.loads(_repair(_outermost_object(text)))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Unrecoverable JSON: {e}") from e
+        repaired = True
+    if not isinstance(value, dict):
+        raise ValueError(f"Expected a JSON object, got {type(value).__name__}")
+    return value, repaired
+
+
+class IncrementalObjectParser:
+    """
+    Parse the top-level members of a JSON object as it streams in.
+
+    Each ``feed`` returns the members whose values became complete with that
+    chunk, so callers can act on early fields without waiting for the rest
+    of the object. Text before the opening brace (e.g. a fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = 0
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Append ``chunk`` and return the members completed by it."""
+        self.buffer += chunk
+        completed: Dict[str, Any] = {}
+        while self._pos < len(self.buffer) and not self.done:
+            char = self.buffer[self._pos]
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = self._pos + 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1:
+                    self._complete_member(self._pos, completed)
+                    self.done = True
+                self._depth -= 1
+            elif char == "," and self._depth == 1:
+                self._complete_member(self._pos, completed)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    def _complete_member(self, end: int, completed: Dict[str, Any]):
+        segment = self.buffer[self._member_start:end].strip()
+        if not segment:
+            return
+        try:
+            member = json.loads("{" + segment + "}")
+        except json.JSONDecodeError:
+            try:
+                member = json.loads(_repair("{" + segment + "}"))
+            except json.JSONDecodeError:
+                return
+        if isinstance(member, dict):
+            completed.update(member)
+            self.fields.update(member)
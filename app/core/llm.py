@@ -1,46 +1,87 @@
 import json
 import logging
-from typing import Optional, Dict, Any
-import httpx
+import time
+from typing import Optional, Dict, Any, List
 from config import settings
+from core.http import get_llm_client
+from core.cache import extraction_cache
+from core import fast_nlu
+from core.conversation_state import compact_state
+from schemas import ExtractionResult
+from core.json_repair import IncrementalObjectParser, parse_llm_json
+from core.metrics import LLM_JSON_PARSE, LLM_STREAMS, llm_request, record_llm_usage, timed
+from core.llm_router import LLMUnavailableError, ProviderRouter
+from core.prompts import RenderedPrompt, get_prompt
 
 logger = logging.getLogger(__name__)
 
-# OpenRouter API endpoint
-OPENROUTER_URL = "https://openrouter.io/api/v1/chat/completions"
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+# Provider API endpoints
+OPENROUTER_URL = settings.OPENROUTER_URL
+OPENAI_URL = settings.OPENAI_URL
 
+OPENROUTER_MODEL = settings.OPENROUTER_MODEL  # "openrouter/auto" selects the best available model
+OPENAI_MODEL = settings.OPENAI_MODEL
 
-async def analyze_message(text: str, use_openrouter: bool = True) -> Dict[str, Any]:
+# Registry name of the extraction prompt; its versioned key is part of the
+# cache key, so cached results are not reused across prompt versions
+EXTRACTION_PROMPT = "extract"
+BATCH_EXTRACTION_PROMPT = "extract_batch"
+
+# Fields a streamed extraction must contain before the rest can be dropped
+DECISION_FIELDS = ("name", "service", "preferred_date", "preferred_time", "confidence")
+
+
+@timed("analyze_message")
+async def analyze_message(
+    text: str, use_openrouter: bool = True, state: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
     Analyze incoming message and extract structured data using LLM.
+
+    Trivial messages (greetings, yes/no, explicit dates and times) are
+    answered by the rule-based fast path without calling the LLM. Otherwise
+    results are served from the extraction cache when the same normalized
+    message was already analyzed with the same model and prompt version.
+    LLM calls go through the provider router (failover, circuit breaker,
+    hedging and a cheaper model for short messages). With LLM_STREAMING the
+    completion is streamed; over HTTP/2 it is cut off once the slot fields
+    are known.
+
+    Only the compact slot state and the latest message are sent to the model,
+    never the conversation history, so prompt size stays flat per turn. The
+    prompt comes from the versioned registry (core.prompts) and long messages
+    are truncated to LLM_PROMPT_TOKEN_BUDGET.
     
     Args:
         text: Message text to analyze
-        use_openrouter: Whether to use OpenRouter (default) or OpenAI
+        use_openrouter: Prefer OpenRouter (default) or OpenAI as primary provider
+        state: Slots already known for this conversation
         
     Returns:
         Dictionary with extracted data (name, service, preferred_date, preferred_time, missing_slots, confidence)
     """
-    prompt = f"""Extraia em JSON estruturado a seguinte informação da mensagem do cliente:
-{{
-  "name": "nome do cliente (se mencionado)",
-  "service": "tipo de serviço desejado",
-  "preferred_date": "data preferida em YYYY-MM-DD (se mencionada)",
-  "preferred_time": "hora preferida em HH:MM (se mencionada)",
-  "missing_slots": ["lista de campos faltantes para completar o agendamento"],
-  "confidence": "nível de confiança 0-100"
-}}
-
-Mensagem: {text}
+    fast = fast_nlu.try_extract(text)
+    if fast is not None:
+        logger.debug(f"Fast-path NLU handled message ({fast['intent']})")
+        return fast
 
-Retorne APENAS JSON válido, sem markdown ou comentários."""
+    known = compact_state(state)
+    template = get_prompt(EXTRACTION_PROMPT)
+    preferred = "openrouter" if use_openrouter else "openai"
+    model = router.model_for(preferred, text)
+    cache_key = extraction_cache.key(text, model, template.key, context=known)
+    cached = await extraction_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Extraction cache hit for {cache_key}")
+        return cached
 
     try:
-        if use_openrouter:
-            return await _call_openrouter(prompt)
-        else:
-            return await _call_openai(prompt)
+        prompt = template.render(text, known)
+        started = time.perf_counter()
+        result = await router.complete(prompt, text, preferred=preferred)
+        fast_nlu.stats.observe_llm_latency(time.perf_counter() - started)
+        await extraction_cache.set(cache_key, result)
+        return result
     except Exception as e:
         logger.error(f"Error analyzing message: {e}")
         return {
@@ -53,7 +94,39 @@ Retorne APENAS JSON válido, sem markdown ou comentários."""
         }
 
 
-async def _call_openrouter(prompt: str) -> Dict[str, Any]:
+@timed("analyze_batch")
+async def analyze_batch(
+    items: List[Dict[str, Any]], use_openrouter: bool = True, prompt_version: Optional[str] = None
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Extract slots for several messages with a single LLM request.
+
+    Meant for backlog and re-analysis jobs: messages are analyzed without
+    slot context, the extraction cache and fast path are bypassed, and the
+    request goes through ``batch_router`` so slow batch calls neither skew
+    the live router's latency stats nor get hedged.
+
+    Args:
+        items: ``{"id": int, "text": str}`` entries, packed to fit the prompt
+        use_openrouter: Prefer OpenRouter (default) or OpenAI as primary provider
+        prompt_version: Batch prompt version (defaults to the configured one)
+
+    Returns:
+        Extraction per item id; items the model skipped or cut short are missing
+
+    Raises:
+        LLMUnavailableError: Every provider failed or returned an error
+    """
+    prompt = get_prompt(BATCH_EXTRACTION_PROMPT, prompt_version).render_batch(items)
+    preferred = "openrouter" if use_openrouter else "openai"
+    result = await batch_router.complete(prompt, "", preferred=preferred)
+    if "error" in result:
+        raise LLMUnavailableError(f"Batch extraction failed: {result['error']}")
+    return result["results"]
+
+
+@timed("llm_request")
+async def _call_openrouter(prompt: RenderedPrompt, model: str = OPENROUTER_MODEL) -> Dict[str, Any]:
     """Call OpenRouter API for LLM inference."""
     if not settings.OPENROUTER_API_KEY:
         logger.warning("OpenRouter API key not configured, returning empty response")
@@ -66,32 +139,11 @@ async def _call_openrouter(prompt: str) -> Dict[str, Any]:
         "X-Title": "AtendenteIA"
     }
     
-    payload = {
-        "model": "openrouter/auto",  # Auto-selects best available model
-        "messages": [
-            {"role": "system", "content": "Você é um especialista em extração de dados para agendamentos. Responda APENAS em JSON válido."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 500
-    }
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(OPENROUTER_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract JSON from response
-        content = data["choices"][0]["message"]["content"]
-        try:
-            result = json.loads(content)
-            return result
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse JSON response: {content}")
-            return {"error": "Invalid JSON from API", "raw": content}
+    return await _complete("openrouter", model, OPENROUTER_URL, headers, prompt)
 
 
-async def _call_openai(prompt: str) -> Dict[str, Any]:
+@timed("llm_request")
+async def _call_openai(prompt: RenderedPrompt, model: str = OPENAI_MODEL) -> Dict[str, Any]:
     """Call OpenAI API for LLM inference (modern API, not deprecated)."""
     if not settings.OPENAI_API_KEY:
         logger.warning("OpenAI API key not configured, returning empty response")
@@ -102,29 +154,170 @@ async def _call_openai(prompt: str) -> Dict[str, Any]:
         "Content-Type": "application/json"
     }
     
+    return await _complete("openai", model, OPENAI_URL, headers, prompt)
+
+
+def _chat_payload(prompt: RenderedPrompt, model: str) -> Dict[str, Any]:
+    """Chat completion request body for a rendered prompt."""
     payload = {
-        "model": "gpt-4o-mini",  # Modern model that exists
-        "messages": [
-            {"role": "system", "content": "Você é um especialista em extração de dados para agendamentos. Responda APENAS em JSON válido."},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.3,
-        "max_tokens": 500
+        "model": model,
+        "messages": prompt.messages,
+        "temperature": prompt.temperature,
+        "max_tokens": prompt.max_tokens,
     }
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        response = await client.post(OPENAI_URL, json=payload, headers=headers)
+    if settings.LLM_JSON_MODE:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+def _record_usage(provider: str, model: str, prompt: RenderedPrompt, usage: Optional[Dict[str, Any]]):
+    """Export provider token usage and log it next to the local estimate."""
+    record_llm_usage(provider, model, usage)
+    usage = usage or {}
+    logger.info(
+        f"LLM call {provider}/{model} {prompt.key}: prompt_tokens={usage.get('prompt_tokens', '?')} "
+        f"(estimated {prompt.prompt_tokens}), completion_tokens={usage.get('completion_tokens', '?')} "
+        f"(max {prompt.max_tokens}){' truncated input' if prompt.truncated else ''}"
+    )
+
+
+async def _complete(provider: str, model: str, url: str, headers: Dict[str, str], prompt: RenderedPrompt) -> Dict[str, Any]:
+    """Send a chat completion and parse the extraction (streamed if enabled)."""
+    payload = _chat_payload(prompt, model)
+    if settings.LLM_STREAMING and not prompt.batch_size:
+        return await _stream_extraction(provider, model, url, headers, payload, prompt)
+
+    client = get_llm_client()
+    with llm_request(provider, model):
+        response = await client.post(url, json=payload, headers=headers)
         response.raise_for_status()
-        data = response.json()
-        
-        # Extract JSON from response
-        content = data["choices"][0]["message"]["content"]
+    data = response.json()
+    _record_usage(provider, model, prompt, data.get("usage"))
+    content = data["choices"][0]["message"]["content"]
+    return _parse_batch(content) if prompt.batch_size else _parse_extraction(content)
+
+
+def has_decision_fields(fields: Dict[str, Any]) -> bool:
+    """
+    True once a streamed extraction holds everything process_message uses.
+
+    ``missing_slots`` is recomputed by ``merge_slots``, so the stream can be
+    cut as soon as the slots and the confidence (needed for caching) arrived.
+    """
+    return all(field in fields for field in DECISION_FIELDS)
+
+
+async def _stream_extraction(
+    provider: str, model: str, url: str, headers: Dict[str, str], payload: Dict[str, Any], prompt: RenderedPrompt
+) -> Dict[str, Any]:
+    """
+    Stream a completion over SSE, stopping once the decision fields are in.
+
+    Only HTTP/2 streams are cut short: cancelling one stream keeps the
+    connection, and the provider stops generating (and billing) the
+    remaining tokens. Leaving an HTTP/1.1 response unread closes its pooled
+    connection, so those are read to the end.
+    """
+    client = get_llm_client()
+    parser = IncrementalObjectParser()
+    usage = None
+    chunks = 0
+    stopped_early = False
+    body = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+
+    with llm_request(provider, model):
+        async with client.stream("POST", url, json=body, headers=headers) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                response.raise_for_status()
+            can_stop_early = response.http_version == "HTTP/2"
+            async for line in response.aiter_lines():
+                # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    # Keep reading up to the end of the body (the last chunk)
+                    continue
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                for choice in event.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        chunks += 1
+                        parser.feed(delta)
+                if can_stop_early and has_decision_fields(parser.fields):
+                    stopped_early = not parser.done
+                    break
+
+    # Without a usage block (stream cut short) count deltas as output tokens
+    _record_usage(provider, model, prompt, usage or {"completion_tokens": chunks})
+    LLM_STREAMS.labels(provider, "early_stop" if stopped_early else "complete").inc()
+    if has_decision_fields(parser.fields):
+        LLM_JSON_PARSE.labels("valid").inc()
+        return ExtractionResult(**parser.fields).dict()
+    return _parse_extraction(parser.buffer)
+
+
+def _parse_extraction(content: str) -> Dict[str, Any]:
+    """
+    Parse and coerce a completion into the extraction shape.
+
+    Fenced or slightly malformed JSON is repaired locally instead of failing
+    the call, so a bad completion does not cost a retry and a second request.
+    """
+    try:
+        raw, repaired = parse_llm_json(content)
+        result = ExtractionResult(**raw).dict()
+    except ValueError as e:  # includes pydantic ValidationError
+        LLM_JSON_PARSE.labels("failed").inc()
+        logger.error(f"Failed to parse JSON response ({e}): {content}")
+        return {"error": "Invalid JSON from API", "raw": content}
+    LLM_JSON_PARSE.labels("repaired" if repaired else "valid").inc()
+    if repaired:
+        logger.info(f"Repaired malformed JSON from LLM: {content[:200]}")
+    return result
+
+
+def _parse_batch(content: str) -> Dict[str, Any]:
+    """
+    Parse a batch completion into ``{"results": {id: extraction}}``.
+
+    Items lacking an id or a decision field (e.g. the last one of an output
+    cut by ``max_tokens``) are dropped so the job retries them later.
+    """
+    try:
+        raw, repaired = parse_llm_json(content)
+    except ValueError as e:
+        LLM_JSON_PARSE.labels("failed").inc()
+        logger.error(f"Failed to parse batch JSON response ({e}): {content[:500]}")
+        return {"error": "Invalid JSON from API", "raw": content}
+    LLM_JSON_PARSE.labels("repaired" if repaired else "valid").inc()
+
+    results = {}
+    for item in raw.get("results") or []:
+        if not isinstance(item, dict) or not has_decision_fields(item):
+            continue
         try:
-            result = json.loads(content)
-            return result
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse JSON response: {content}")
-            return {"error": "Invalid JSON from API", "raw": content}
+            results[int(item.pop("id"))] = ExtractionResult(**item).dict()
+        except (KeyError, TypeError, ValueError) as e:  # includes pydantic ValidationError
+            logger.warning(f"Skipping malformed batch item ({e}): {item}")
+    return {"results": results}
+
+
+router = ProviderRouter(
+    providers={"openrouter": _call_openrouter, "openai": _call_openai},
+    models={"openrouter": OPENROUTER_MODEL, "openai": OPENAI_MODEL},
+    fast_models={"openrouter": settings.OPENROUTER_FAST_MODEL, "openai": settings.OPENAI_FAST_MODEL},
+)
+
+# Batch jobs: full models only, no hedging (a duplicate batch costs as much
+# as the original) and separate latency stats and circuit breakers
+batch_router = ProviderRouter(
+    providers={"openrouter": _call_openrouter, "openai": _call_openai},
+    models={"openrouter": OPENROUTER_MODEL, "openai": OPENAI_MODEL},
+    hedge_enabled=False,
+)
 
 
 def generate_reply(intent: str, data: Any) -> str:
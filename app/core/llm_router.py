@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import settings
+from core.metrics import LLM_HEDGES
+from core.prompts import RenderedPrompt
+
+logger = logging.getLogger(__name__)
+
+ProviderCall = Callable[[RenderedPrompt, str], Awaitable[Dict[str, Any]]]
+
+
+class LLMUnavailableError(Exception):
+    """Raised when every provider is failing or has its circuit open."""
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A provider/model pair the router can send an extraction to."""
+
+    provider: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+class RollingStats:
+    """Latency and error rate over the last ``window`` calls of one endpoint."""
+
+    def __init__(self, window: int = 100):
+        self._samples = deque(maxlen=window)  # (seconds, ok)
+
+    def record(self, seconds: float, ok: bool):
+        self._samples.append((seconds, ok))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile of successful calls, or None without samples."""
+        latencies = sorted(seconds for seconds, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "calls": len(self._samples),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after repeated failures, half-open after ``cooldown``.
+
+    While half-open a single probe request is let through; its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """True if a request may be sent now (without reserving the probe)."""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        if self.state == "half_open":
+            return not self._probing
+        return True
+
+    def acquire(self) -> bool:
+        """Reserve a request slot; in half-open state only one probe gets one."""
+        if not self.available():
+            return False
+        if self.state == "open":
+            self.state = "half_open"
+            logger.info(f"Circuit for {self.name} half-open, sending probe")
+        if self.state == "half_open":
+            self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def release(self):
+        """Give back a probe slot whose request was cancelled."""
+        self._probing = False
+
+    def trip(self):
+        if self.state != "open":
+            logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+
+
+class ProviderRouter:
+    """
+    Route extraction prompts across LLM providers.
+
+    The preferred provider is tried first; providers whose circuit is open are
+    skipped. If the primary has not answered within its rolling p95 latency a
+    hedged request goes to the next provider and the first good answer wins,
+    the other request being cancelled. Short messages use each provider's
+    cheaper model.
+
+    State is confined to the worker event loop, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, ProviderCall],
+        models: Dict[str, str],
+        fast_models: Optional[Dict[str, str]] = None,
+        short_message_chars: int = None,
+        window: int = None,
+        hedge_enabled: bool = None,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        hedge_default_delay: float = None,
+        hedge_min_delay: float = None,
+        hedge_max_delay: float = None,
+        breaker_failures: int = None,
+        breaker_error_rate: float = None,
+        breaker_cooldown: float = None,
+    ):
+        self.providers = providers
+        self.models = models
+        self.fast_models = fast_models or {}
+        self.short_message_chars = settings.LLM_SHORT_MESSAGE_CHARS if short_message_chars is None else short_message_chars
+        self.window = settings.LLM_ROUTER_WINDOW if window is None else window
+        self.hedge_enabled = settings.LLM_HEDGE_ENABLED if hedge_enabled is None else hedge_enabled
+        self.hedge_percentile = settings.LLM_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile
+        self.hedge_min_samples = settings.LLM_HEDGE_MIN_SAMPLES if hedge_min_samples is None else hedge_min_samples
+        self.hedge_default_delay = settings.LLM_HEDGE_DEFAULT_DELAY if hedge_default_delay is None else hedge_default_delay
+        self.hedge_min_delay = settings.LLM_HEDGE_MIN_DELAY if hedge_min_delay is None else hedge_min_delay
+        self.hedge_max_delay = settings.LLM_HEDGE_MAX_DELAY if hedge_max_delay is None else hedge_max_delay
+        self.breaker_error_rate = settings.LLM_BREAKER_ERROR_RATE if breaker_error_rate is None else breaker_error_rate
+        failures = settings.LLM_BREAKER_FAILURES if breaker_failures is None else breaker_failures
+        cooldown = settings.LLM_BREAKER_COOLDOWN if breaker_cooldown is None else breaker_cooldown
+        self.breakers = {name: CircuitBreaker(name, failures, cooldown) for name in providers}
+        self._stats: Dict[str, RollingStats] = {}
+
+    def stats_for(self, endpoint: Endpoint) -> RollingStats:
+        stats = self._stats.get(endpoint.name)
+        if stats is None:
+            stats = self._stats[endpoint.name] = RollingStats(self.window)
+        return stats
+
+    def plan(self, text: str, preferred: Optional[str] = None) -> List[Endpoint]:
+        """
+        Endpoints to try for ``text``, best first.
+
+        Args:
+            text: Message being analyzed (its length selects the model tier)
+            preferred: Provider to try first when it is healthy
+
+        Returns:
+            Endpoints whose circuit currently admits requests
+        """
+        order = sorted(self.providers, key=lambda name: name != preferred)
+        endpoints = [Endpoint(name, self.model_for(name, text)) for name in order]
+        return [e for e in endpoints if self.breakers[e.provider].available()]
+
+    def model_for(self, provider: str, text: str) -> str:
+        """Model of ``provider`` for ``text``: the fast tier for short messages."""
+        if len(text) <= self.short_message_chars and self.fast_models.get(provider):
+            return self.fast_models[provider]
+        return self.models[provider]
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        """Seconds to wait for ``endpoint`` before hedging: its rolling p95."""
+        stats = self.stats_for(endpoint)
+        p95 = stats.percentile(self.hedge_percentile)
+        if p95 is None or len(stats) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, p95))
+
+    async def _attempt(self, endpoint: Endpoint, prompt: RenderedPrompt) -> Dict[str, Any]:
+        breaker = self.breakers[endpoint.provider]
+        started = time.perf_counter()
+        try:
+            result = await self.providers[endpoint.provider](prompt, endpoint.model)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            self._record(endpoint, time.perf_counter() - started, ok=False)
+            raise
+        ok = "error" not in result
+        self._record(endpoint, time.perf_counter() - started, ok=ok)
+        return result
+
+    def _record(self, endpoint: Endpoint, seconds: float, ok: bool):
+        stats = self.stats_for(endpoint)
+        stats.record(seconds, ok)
+        breaker = self.breakers[endpoint.provider]
+        if ok:
+            breaker.record_success()
+            return
+        breaker.record_failure()
+        if len(stats) >= self.hedge_min_samples and stats.error_rate() >= self.breaker_error_rate:
+            breaker.trip()
+
+    def _start(self, endpoint: Endpoint, prompt: RenderedPrompt) -> Optional[asyncio.Task]:
+        if not self.breakers[endpoint.provider].acquire():
+            return None
+        task = asyncio.get_running_loop().create_task(self._attempt(endpoint, prompt))
+        task.endpoint = endpoint
+        return task
+
+    async def complete(self, prompt: RenderedPrompt, text: str, preferred: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run ``prompt`` on the best available provider, hedging slow calls.
+
+        Args:
+            prompt: Rendered extraction prompt
+            text: Original message (selects the model tier)
+            preferred: Provider to try first
+
+        Returns:
+            Parsed extraction from the first provider that answered without
+            error, or the last error result if every provider returned one
+
+        Raises:
+            LLMUnavailableError: No provider is available
+            Exception: The last provider error when every attempt raised
+        """
+        candidates = self.plan(text, preferred)
+        pending: List[asyncio.Task] = []
+        last_result: Optional[Dict[str, Any]] = None
+        last_error: Optional[BaseException] = None
+        hedged = False
+
+        def launch_next() -> bool:
+            while candidates:
+                task = self._start(candidates.pop(0), prompt)
+                if task is not None:
+                    pending.append(task)
+                    return True
+            return False
+
+        if not launch_next():
+            raise LLMUnavailableError("No LLM provider available (all circuits open)")
+
+        try:
+            while pending:
+                timeout = None
+                if self.hedge_enabled and len(pending) == 1 and candidates:
+                    timeout = self.hedge_delay(pending[0].endpoint)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Primary is slower than its p95: race the next provider
+                    slow = pending[0].endpoint
+                    if launch_next():
+                        hedged = True
+                        LLM_HEDGES.labels(slow.provider, "sent").inc()
+                        logger.info(f"Hedging {slow.name} after {timeout:.2f}s with {pending[-1].endpoint.name}")
+                    continue
+
+                for task in done:
+                    pending.remove(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        logger.warning(f"LLM call to {task.endpoint.name} failed: {last_error}")
+                        continue
+                    result = task.result()
+                    if "error" not in result:
+                        if hedged:
+                            LLM_HEDGES.labels(task.endpoint.provider, "won").inc()
+                        return result
+                    last_result = result
+                    logger.warning(f"LLM call to {task.endpoint.name} returned {result.get('error')}")
+
+                # Everything in flight failed: fail over to the next provider
+                if not pending:
+                    launch_next()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if last_result is not None:
+            return last_result
+        raise last_error or LLMUnavailableError("No LLM provider available")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Rolling stats per endpoint and circuit state per provider."""
+        return {
+            "endpoints": {name: stats.snapshot() for name, stats in self._stats.items()},
+            "circuits": {name: breaker.state for name, breaker in self.breakers.items()},
+        }
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+import httpx
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Message id of the inbound message being handled; used to correlate stage
+# timings in logs across the API and the worker
+current_message_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_message_id", default=None
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "atendente_stage_duration_seconds",
+    "Time spent in each stage of handling an inbound message",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "atendente_stage_errors_total",
+    "Stage executions that raised",
+    ["stage"],
+)
+LLM_TOKENS = Counter(
+    "atendente_llm_tokens_total",
+    "LLM tokens reported by the provider",
+    ["provider", "model", "kind"],
+)
+LLM_REQUESTS = Counter(
+    "atendente_llm_requests_total",
+    "LLM requests by provider and outcome (ok, error, timeout)",
+    ["provider", "model", "outcome"],
+)
+LLM_JSON_PARSE = Counter(
+    "atendente_llm_json_parse_total",
+    "LLM completions by JSON parse result (valid, repaired, failed)",
+    ["result"],
+)
+LLM_STREAMS = Counter(
+    "atendente_llm_streams_total",
+    "Streamed LLM completions by outcome (early_stop, complete)",
+    ["provider", "outcome"],
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "atendente_llm_prompt_tokens",
+    "Prompt tokens per LLM call, counted locally before sending",
+    ["prompt"],
+    buckets=(50, 100, 150, 200, 300, 400, 600, 800, 1200, 2000),
+)
+LLM_PROMPT_TRUNCATIONS = Counter(
+    "atendente_llm_prompt_truncations_total",
+    "Inbound messages truncated to fit the prompt token budget",
+    ["prompt"],
+)
+LLM_HEDGES = Counter(
+    "atendente_llm_hedges_total",
+    "Hedged LLM requests: 'sent' per slow provider, 'won' per provider that answered first",
+    ["provider", "outcome"],
+)
+QUEUE_LAG = Gauge(
+    "atendente_queue_lag_seconds",
+    "Delay between a task becoming ready and a worker starting it (last observed)",
+    ["queue"],
+    multiprocess_mode="max",
+)
+CACHE_EVENTS = Counter(
+    "atendente_cache_events_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+
+
+@contextmanager
+def stage_timer(stage: str, message_id: Optional[int] = None):
+    """
+    Time a stage, record it in the stage histogram and log it.
+
+    Args:
+        stage: Stage name (webhook, process_message, analyze_message, ...)
+        message_id: Message to correlate with (defaults to current_message_id)
+    """
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        if failed:
+            STAGE_ERRORS.labels(stage).inc()
+        mid = message_id if message_id is not None else current_message_id.get()
+        _log_stage(stage, elapsed, mid, failed)
+
+
+def timed(stage: str):
+    """Decorator form of ``stage_timer`` for sync and async functions."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration measured elsewhere (e.g. end-to-end latency)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    _log_stage(stage, seconds, current_message_id.get())
+
+
+def _log_stage(stage: str, seconds: float, message_id: Optional[int], failed: bool = False):
+    # Every stage is traced at DEBUG; slow ones also at INFO so the message
+    # behind a latency spike can be found with production log levels
+    level = logging.INFO if seconds >= settings.SLOW_STAGE_SECONDS else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(
+            level,
+            f"{'slow stage' if level == logging.INFO else 'trace'} message_id={message_id} "
+            f"stage={stage} duration_ms={seconds * 1000:.1f} failed={failed}",
+        )
+
+
+def observe_queue_lag(queue: str, ready_at: Optional[float]):
+    """Record how long a task waited after it became ready to run."""
+    if ready_at is None:
+        return
+    lag = max(0.0, time.time() - ready_at)
+    QUEUE_LAG.labels(queue).set(lag)
+    observe_stage("queue_wait", lag)
+
+
+@contextmanager
+def llm_request(provider: str, model: str):
+    """
+    Count an LLM request in ``LLM_REQUESTS`` by outcome.
+
+    ``timeout`` for httpx timeouts, ``error`` for any other exception
+    (connection errors, ``raise_for_status``), ``ok`` otherwise. Requests
+    cancelled by the hedge are not counted (see ``LLM_HEDGES``).
+    """
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except httpx.TimeoutException:
+        LLM_REQUESTS.labels(provider, model, "timeout").inc()
+        raise
+    except Exception:
+        LLM_REQUESTS.labels(provider, model, "error").inc()
+        raise
+    LLM_REQUESTS.labels(provider, model, "ok").inc()
+
+
+def record_llm_usage(provider: str, model: str, usage: Optional[Dict[str, Any]]):
+    """Count prompt/completion tokens from an OpenAI-compatible ``usage`` block."""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind)
+        if isinstance(value, (int, float)) and value > 0:
+            LLM_TOKENS.labels(provider, model, kind.replace("_tokens", "")).inc(value)
+
+
+def _registry():
+    # With PROMETHEUS_MULTIPROC_DIR set (gunicorn / prefork workers), aggregate
+    # the per-process files instead of exposing only this process
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """Return ``(body, content_type)`` for a Prometheus scrape."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int):
+    """Expose /metrics on a standalone port (used by the Celery worker)."""
+    from prometheus_client import start_http_server
+    start_http_server(port, registry=_registry())
+    logger.info(f"Metrics server listening on :{port}")
+
+
+def mark_process_dead(pid: int):
+    """Drop live gauges of an exited worker child in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
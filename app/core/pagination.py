@@ -0,0 +1,62 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Iterator, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort_value: Optional[datetime], row_id: int) -> str:
+    """Encode a ``(timestamp, id)`` keyset position as an opaque string."""
+    raw = f"{sort_value.isoformat() if sort_value else ''}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """
+    Decode a cursor produced by ``encode_cursor``.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_raw, id_raw = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return (datetime.fromisoformat(sort_raw) if sort_raw else None), int(id_raw)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _iter_page(rows: Sequence[Any], serialize: Callable[[Any], dict], next_cursor: Optional[str]) -> Iterator[bytes]:
+    yield b'{"items":['
+    for index, row in enumerate(rows):
+        if index:
+            yield b","
+        yield json.dumps(serialize(row), ensure_ascii=False).encode("utf-8")
+    yield b'],"next_cursor":' + json.dumps(next_cursor).encode() + b"}"
+
+
+def page_response(
+    rows: Sequence[Any],
+    limit: int,
+    serialize: Callable[[Any], dict],
+    cursor_of: Callable[[Any], str],
+) -> StreamingResponse:
+    """
+    Stream one keyset page as ``{"items": [...], "next_cursor": ...}``.
+
+    Args:
+        rows: Up to ``limit + 1`` rows; the extra row only signals more pages
+        limit: Page size requested
+        serialize: Row -> JSON-able dict
+        cursor_of: Row -> cursor string for the position after that row
+
+    Returns:
+        StreamingResponse that serializes rows one at a time
+    """
+    page = rows[:limit]
+    next_cursor = cursor_of(page[-1]) if len(rows) > limit and page else None
+    return StreamingResponse(_iter_page(page, serialize, next_cursor), media_type="application/json")
@@ -0,0 +1,230 @@
+import json
+import logging
+import math
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+from config import settings
+from core.metrics import LLM_PROMPT_TOKENS, LLM_PROMPT_TRUNCATIONS
+from core.tokens import count_message_tokens, count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Room left for formatting differences (pretty-printed JSON, spacing) on
+# top of the example answer when sizing max_tokens
+OUTPUT_TOKEN_FACTOR = 1.5
+OUTPUT_TOKEN_MARGIN = 16
+# Never squeeze the message below this, even with a large slot context
+MIN_MESSAGE_TOKENS = 32
+
+
+@dataclass
+class RenderedPrompt:
+    """Chat messages ready to send, with their token accounting."""
+
+    key: str
+    messages: List[Dict[str, str]]
+    max_tokens: int
+    temperature: float
+    prompt_tokens: int
+    truncated: bool = False
+    batch_size: int = 0  # items in a render_batch() prompt, 0 for a single message
+
+
+@dataclass
+class PromptTemplate:
+    """
+    One version of a prompt.
+
+    ``user`` is a format string with ``{context}`` and ``{text}``
+    placeholders; ``context_format`` wraps the known slots and is
+    left out when there are none. ``output_example`` is the longest answer
+    expected and sets ``max_tokens``.
+    """
+
+    name: str
+    version: str
+    system: str
+    user: str
+    output_example: Dict[str, Any]
+    context_format: str = "{known}\n"
+    temperature: float = 0.0
+
+    @property
+    def key(self) -> str:
+        """Identifier used in cache keys and logs, e.g. ``extract-v4``."""
+        return f"{self.name}-{self.version}"
+
+    @cached_property
+    def output_tokens(self) -> int:
+        """Completion tokens allowed for one answer like ``output_example``."""
+        example = json.dumps(self.output_example, ensure_ascii=False)
+        return math.ceil(count_tokens(example) * OUTPUT_TOKEN_FACTOR)
+
+    @property
+    def max_tokens(self) -> int:
+        return self.output_tokens + OUTPUT_TOKEN_MARGIN
+
+    def overhead_tokens(self, known: str = "") -> int:
+        """Prompt tokens of the template itself, without the message."""
+        context = self.context_format.format(known=known) if known else ""
+        return count_message_tokens(self._messages(context, ""))
+
+    def render(self, text: str, known: str = "", budget: Optional[int] = None) -> RenderedPrompt:
+        """
+        Fill in the template, truncating ``text`` to fit the token budget.
+
+        Args:
+            text: Inbound message(s) to analyze
+            known: Compact slot state already collected
+            budget: Prompt token budget (defaults to settings.LLM_PROMPT_TOKEN_BUDGET)
+
+        Returns:
+            RenderedPrompt with messages, max_tokens and the prompt token count
+        """
+        budget = settings.LLM_PROMPT_TOKEN_BUDGET if budget is None else budget
+        context = self.context_format.format(known=known) if known else ""
+        allowed = max(budget - self.overhead_tokens(known), MIN_MESSAGE_TOKENS)
+        message = truncate_to_tokens(text, allowed)
+        truncated = message != text
+        if truncated:
+            LLM_PROMPT_TRUNCATIONS.labels(self.key).inc()
+            logger.info(f"Truncated message from {count_tokens(text)} to {allowed} tokens for {self.key}")
+
+        messages = self._messages(context, message)
+        prompt_tokens = count_message_tokens(messages)
+        LLM_PROMPT_TOKENS.labels(self.key).observe(prompt_tokens)
+        return RenderedPrompt(
+            key=self.key,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            prompt_tokens=prompt_tokens,
+            truncated=truncated,
+        )
+
+    def render_batch(self, items: List[Dict[str, Any]]) -> RenderedPrompt:
+        """
+        Fill in the template with a JSON array of ``{"id", "text"}`` items.
+
+        Items are not truncated here, as cutting the array would break it;
+        the caller packs them to fit (see services.batch_extraction).
+        ``output_example`` is the answer for one item, so ``max_tokens``
+        grows with the number of items.
+        """
+        text = json.dumps(items, ensure_ascii=False, separators=(",", ":"))
+        messages = self._messages("", text)
+        prompt_tokens = count_message_tokens(messages)
+        LLM_PROMPT_TOKENS.labels(self.key).observe(prompt_tokens)
+        return RenderedPrompt(
+            key=self.key,
+            messages=messages,
+            max_tokens=self.output_tokens * len(items) + OUTPUT_TOKEN_MARGIN,
+            temperature=self.temperature,
+            prompt_tokens=prompt_tokens,
+            batch_size=len(items),
+        )
+
+    def _messages(self, context: str, text: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(context=context, text=text)},
+        ]
+
+
+_registry: Dict[Tuple[str, str], PromptTemplate] = {}
+
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    """Add a prompt version to the registry."""
+    _registry[(template.name, template.version)] = template
+    return template
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """
+    Return a registered prompt.
+
+    Args:
+        name: Prompt name, e.g. "extract"
+        version: Version to use; defaults to the one pinned in
+            settings.LLM_PROMPT_VERSIONS, else the last registered
+
+    Raises:
+        KeyError: Unknown prompt or version
+    """
+    version = version or settings.LLM_PROMPT_VERSIONS.get(name)
+    if version is None:
+        versions = [v for n, v in _registry if n == name]
+        if not versions:
+            raise KeyError(f"Unknown prompt '{name}'")
+        version = versions[-1]
+    return _registry[(name, version)]
+
+
+EXTRACTION_EXAMPLE = {
+    "name": "Maria Aparecida da Silva",
+    "service": "coloração e hidratação",
+    "preferred_date": "2026-12-31",
+    "preferred_time": "14:30",
+    "confidence": 100,
+    "missing_slots": ["service", "preferred_date", "preferred_time"],
+}
+
+# Original verbose extraction prompt, kept so it can be pinned back and
+# compared against. Without slot context it renders byte for byte as the
+# prompt it replaced; do not edit it, register a new version instead. Its
+# field order (missing_slots before confidence) means streamed answers are
+# read to the end.
+register(PromptTemplate(
+    name="extract",
+    version="v3",
+    system="Você é um especialista em extração de dados para agendamentos. Responda APENAS em JSON válido.",
+    user="""Extraia em JSON estruturado a seguinte informação da mensagem do cliente:
+{{
+  "name": "nome do cliente (se mencionado)",
+  "service": "tipo de serviço desejado",
+  "preferred_date": "data preferida em YYYY-MM-DD (se mencionada)",
+  "preferred_time": "hora preferida em HH:MM (se mencionada)",
+  "missing_slots": ["lista de campos faltantes para completar o agendamento"],
+  "confidence": "nível de confiança 0-100"
+}}
+
+{context}Mensagem: {text}
+
+Retorne APENAS JSON válido, sem markdown ou comentários.""",
+    output_example=EXTRACTION_EXAMPLE,
+    context_format="Dados já conhecidos: {known}\n\n",
+    temperature=0.3,
+))
+
+# Same fields in the same order (confidence before missing_slots, see
+# llm.DECISION_FIELDS) in a fraction of the tokens
+register(PromptTemplate(
+    name="extract",
+    version="v4",
+    system="Extraia dados de agendamento da mensagem. Responda só JSON.",
+    user=(
+        'Formato: {{"name":"","service":"","preferred_date":"AAAA-MM-DD","preferred_time":"HH:MM",'
+        '"confidence":0-100,"missing_slots":[]}}\n'
+        'Campos não mencionados: ""\n'
+        "{context}Mensagem: {text}"
+    ),
+    output_example=EXTRACTION_EXAMPLE,
+    context_format="Já sabemos: {known}\n",
+))
+
+# Several messages per request for backlog and re-analysis jobs; each item
+# is analyzed on its own, without slot context
+register(PromptTemplate(
+    name="extract_batch",
+    version="v1",
+    system="Extraia dados de agendamento de cada mensagem. Responda só JSON.",
+    user=(
+        'Para cada item, extraia {{"id":<id>,"name":"","service":"","preferred_date":"AAAA-MM-DD",'
+        '"preferred_time":"HH:MM","confidence":0-100,"missing_slots":[]}}\n'
+        'Campos não mencionados: "". Responda {{"results":[...]}} com um resultado por id.\n'
+        "{context}Mensagens: {text}"
+    ),
+    output_example={"id": 1234567, **EXTRACTION_EXAMPLE},
+))
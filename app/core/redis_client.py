@@ -0,0 +1,57 @@
+import logging
+import os
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_sync_client: Optional[redis.Redis] = None
+_async_client: Optional[aioredis.Redis] = None
+_owner_pid: Optional[int] = None
+_overridden = False
+
+
+def _check_pid():
+    global _sync_client, _async_client, _owner_pid
+    if _owner_pid != os.getpid() and not _overridden:
+        _sync_client = None
+        _async_client = None
+        _owner_pid = os.getpid()
+
+
+def get_redis() -> redis.Redis:
+    """Return the process-wide synchronous Redis client."""
+    global _sync_client
+    _check_pid()
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _sync_client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """
+    Return the process-wide asyncio Redis client.
+
+    Must be used from a single event loop (the persistent worker loop in
+    Celery processes, the server loop in the API).
+    """
+    global _async_client
+    _check_pid()
+    if _async_client is None:
+        _async_client = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
+
+
+def set_redis(sync_client=None, async_client=None):
+    """
+    Replace the shared clients, e.g. with fakeredis in tests and benchmarks.
+
+    Passing no arguments restores the clients built from ``settings.REDIS_URL``.
+    """
+    global _sync_client, _async_client, _overridden, _owner_pid
+    _sync_client = sync_client
+    _async_client = async_client
+    _overridden = sync_client is not None or async_client is not None
+    _owner_pid = os.getpid()
@@ -0,0 +1,122 @@
+import logging
+import math
+import re
+import time
+from typing import Dict, List
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# tiktoken is a requirement; without it (or without its encoding files,
+# which it downloads on first use) counts are an estimate and prompt
+# budgets only approximate.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+    logger.warning("tiktoken is not installed, estimating token counts")
+
+# Heuristic pieces: words (about four characters per token in BPE
+# vocabularies, Portuguese included) and single punctuation marks
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+
+# Chat formatting overhead per message and for priming the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Seconds to estimate before trying to load the encoding again after a
+# failure (e.g. its files could not be downloaded yet)
+ENCODING_RETRY_SECONDS = 300
+
+_loaded_encoding = None
+_encoding_retry_at = 0.0
+
+
+def _encoding():
+    """The tiktoken encoding, or None (estimate) while it cannot be loaded."""
+    global _loaded_encoding, _encoding_retry_at
+    if _loaded_encoding is not None or tiktoken is None:
+        return _loaded_encoding
+    if time.monotonic() < _encoding_retry_at:
+        return None
+    try:
+        _loaded_encoding = tiktoken.get_encoding(settings.LLM_TOKENIZER_ENCODING)
+    except Exception as e:
+        _encoding_retry_at = time.monotonic() + ENCODING_RETRY_SECONDS
+        logger.warning(
+            f"Tokenizer {settings.LLM_TOKENIZER_ENCODING} unavailable, estimating token counts "
+            f"for {ENCODING_RETRY_SECONDS}s: {e}"
+        )
+    return _loaded_encoding
+
+
+def _piece_tokens(piece: str) -> int:
+    return max(1, math.ceil(len(piece) / CHARS_PER_TOKEN))
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of ``text`` locally.
+
+    Uses tiktoken when it is installed, otherwise a word/punctuation
+    estimate that stays within a few percent for short chat messages.
+    """
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(_piece_tokens(piece) for piece in _PIECE_RE.findall(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt tokens of a chat completion request, formatting included."""
+    return REPLY_OVERHEAD_TOKENS + sum(
+        MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"]) for message in messages
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " [...] ") -> str:
+    """
+    Shorten ``text`` to about ``max_tokens`` tokens.
+
+    Keeps the first third and the last two thirds of the budget: names are
+    usually given up front, while the latest lines of a burst carry the date
+    and time the lead settled on.
+
+    Args:
+        text: Text to shorten
+        max_tokens: Token budget for the result
+        marker: Inserted where text was cut
+
+    Returns:
+        ``text`` unchanged if it fits, otherwise its head and tail
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(marker))
+    head_budget = budget // 3
+    tail_budget = budget - head_budget
+
+    encoding = _encoding()
+    if encoding is not None:
+        ids = encoding.encode(text)
+        head = encoding.decode(ids[:head_budget])
+        tail = encoding.decode(ids[len(ids) - tail_budget:]) if tail_budget else ""
+        return head + marker + tail
+
+    pieces = list(_PIECE_RE.finditer(text))
+    head_end, used = 0, 0
+    for match in pieces:
+        used += _piece_tokens(match.group())
+        if used > head_budget:
+            break
+        head_end = match.end()
+    tail_start, used = len(text), 0
+    for match in reversed(pieces):
+        used += _piece_tokens(match.group())
+        if used > tail_budget or match.start() < head_end:
+            break
+        tail_start = match.start()
+    return text[:head_end].rstrip() + marker + text[tail_start:].lstrip()
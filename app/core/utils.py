@@ -1,2 +1,45 @@
+import base64
+import hashlib
+import hmac
+import re
+import unicodedata
+from typing import Iterable, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s:/]")
+_WHITESPACE = re.compile(r"\s+")
+
+
 def clean_phone(phone: str):
     return phone.replace("whatsapp:", "").strip()
+
+
+def normalize_message(text: str) -> str:
+    """
+    Normalize message text so trivially different messages compare equal.
+
+    Lowercases, strips accents and punctuation (keeping ``:`` and ``/`` used
+    in times and dates) and collapses whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def twilio_signature(auth_token: str, url: str, params: Iterable[Tuple[str, str]]) -> str:
+    """
+    Compute the ``X-Twilio-Signature`` of a webhook request.
+
+    HMAC-SHA1 (keyed with the account auth token) over the full request URL
+    followed by every POST parameter name and value, sorted by name.
+    """
+    payload = url + "".join(key + value for key, value in sorted(params))
+    digest = hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def valid_twilio_signature(auth_token: str, url: str, params: Iterable[Tuple[str, str]], signature: str) -> bool:
+    """True if ``signature`` matches the request (constant-time comparison)."""
+    if not signature:
+        return False
+    return hmac.compare_digest(twilio_signature(auth_token, url, params), signature)
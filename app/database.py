@@ -1,17 +1,153 @@
 import logging
-from sqlalchemy import create_engine, pool
+import threading
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Pool sizing per process type. The API serves many concurrent requests from
+# one process; each prefork worker child runs one task at a time.
+ENGINE_PROFILES = {
+    "api": {
+        "pool_size": settings.DB_API_POOL_SIZE,
+        "max_overflow": settings.DB_API_MAX_OVERFLOW,
+    },
+    "worker": {
+        "pool_size": settings.DB_WORKER_POOL_SIZE,
+        "max_overflow": settings.DB_WORKER_MAX_OVERFLOW,
+    },
+}
+
+
+class PoolMetrics:
+    """Checkout counters and wait times for one connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            self.timeouts += int(timed_out)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - started, timed_out)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _connect_args(url: str) -> Dict[str, Any]:
+    if make_url(url).get_backend_name() == "postgresql":
+        return {"connect_timeout": 10}
+    return {}
+
+
+def create_profile_engine(profile: str, url: Optional[str] = None) -> Engine:
+    """
+    Create a pooled engine for a process profile ("api" or "worker").
+
+    Args:
+        profile: Key of ENGINE_PROFILES
+        url: Database URL (defaults to settings.DATABASE_URL)
+
+    Returns:
+        SQLAlchemy Engine
+    """
+    url = url or settings.DATABASE_URL
+    options = ENGINE_PROFILES[profile]
+    new_engine = create_engine(
+        url,
+        echo=False,
+        poolclass=InstrumentedQueuePool,
+        pool_size=options["pool_size"],
+        max_overflow=options["max_overflow"],
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=_connect_args(url),
+    )
+
+    @event.listens_for(new_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics(new_engine).record_checkout()
+
+    @event.listens_for(new_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        pool_metrics(new_engine).record_checkin()
+
+    new_engine.profile = profile
+    return new_engine
+
+
+def pool_metrics(target: Optional[Engine] = None) -> PoolMetrics:
+    """Return the metrics object of an engine's pool (current engine by default)."""
+    return (target or engine).pool.metrics
+
+
+def pool_stats(target: Optional[Engine] = None) -> Dict[str, Any]:
+    """Return current pool occupancy plus checkout and wait metrics."""
+    target = target or engine
+    pool = target.pool
+    return {
+        "profile": getattr(target, "profile", None),
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "idle": pool.checkedin(),
+        **pool.metrics.snapshot(),
+    }
+
+
 # Create engine with connection pooling
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    poolclass=pool.NullPool,  # Use NullPool to avoid connection issues in Celery
-    connect_args={"connect_timeout": 10}
-)
+engine = create_profile_engine(settings.DB_PROFILE)
 
 # Create session factory
 SessionLocal = sessionmaker(
@@ -24,13 +160,29 @@ SessionLocal = sessionmaker(
 # Create base class for models
 Base = declarative_base()
 
-logger.info("Database engine initialized")
+logger.info(f"Database engine initialized ({settings.DB_PROFILE} profile)")
+
+
+def configure_engine(profile: str):
+    """
+    Switch this process to another engine profile.
+
+    Called from ``worker_process_init`` in each Celery child: connections
+    inherited from the parent through fork are dropped without being closed
+    (closing them would break the parent's sockets), then a fresh pool is
+    created and bound to SessionLocal.
+    """
+    global engine
+    engine.dispose(close=False)
+    engine = create_profile_engine(profile)
+    SessionLocal.configure(bind=engine)
+    logger.info(f"Database engine reconfigured ({profile} profile)")
 
 
 def get_db():
     """
     Dependency for FastAPI to provide database sessions.
-    
+
     Yields:
         SQLAlchemy Session
     """
@@ -43,3 +195,63 @@ def get_db():
         raise
     finally:
         db.close()
+
+
+# Optional asyncpg engine for async routes, created on first use
+_async_engine = None
+_async_sessionmaker = None
+
+
+def _async_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def get_async_engine():
+    """Return the process-wide async engine (requires asyncpg)."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        _async_engine = create_async_engine(
+            _async_url(),
+            pool_size=ENGINE_PROFILES[settings.DB_PROFILE]["pool_size"],
+            max_overflow=ENGINE_PROFILES[settings.DB_PROFILE]["max_overflow"],
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+        _async_sessionmaker = async_sessionmaker(_async_engine, expire_on_commit=False)
+        logger.info("Async database engine initialized")
+    return _async_engine
+
+
+async def dispose_async_engine():
+    """Close the async engine's pooled connections, if it was created."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_sessionmaker = None
+
+
+def AsyncSessionLocal():
+    """Create a new AsyncSession bound to the async engine."""
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def get_async_db():
+    """
+    Dependency for async FastAPI routes to provide database sessions.
+
+    Yields:
+        SQLAlchemy AsyncSession
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            await db.rollback()
+            raise
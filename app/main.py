@@ -1,8 +1,12 @@
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from config import settings
 from controllers import whatsapp, appointments, dashboard
-from database import Base, engine
+from database import Base, engine, pool_stats
+from core.metrics import render_metrics
+from services.partitions import ensure_message_partitions
+from services.schema import upgrade_schema
 
 # Configure logging
 logging.basicConfig(
@@ -27,11 +31,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create database tables
+# Create database tables, bring existing ones up to date and create the
+# current monthly message partitions
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+ensure_message_partitions(engine)
 logger.info("Database tables created/verified")
 
-# Include routers
+# Include routers; in lean mode the raw ASGI webhook takes the route first
+if settings.WEBHOOK_MODE == "lean":
+    app.router.add_route("/webhook/whatsapp", whatsapp.LeanWebhook(), methods=["POST"], include_in_schema=False)
+    logger.info("Lean webhook mode: inbound messages are stored by workers.ingest_consumer")
 app.include_router(whatsapp.router, prefix="/webhook", tags=["webhooks"])
 app.include_router(appointments.router, prefix="/appointments", tags=["appointments"])
 app.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
@@ -55,10 +65,18 @@ def health():
     return {
         "status": "healthy",
         "database": "connected",
+        "database_pool": pool_stats(),
         "service": "ready"
     }
 
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint (stage latencies, LLM tokens, queue lag)."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
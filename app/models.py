@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, ForeignKey, Text, JSON, Index, DDL, event, func, text
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -23,24 +24,81 @@ class Conversation(Base):
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False, index=True)
     last_message_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    status = Column(String, default="open", index=True)  # open, closed, resolved
+    status = Column(String, default="open", index=True)  # open, closed, resolved (see services.archive)
+    slot_state = Column(JSON, nullable=True)  # slots collected so far, see core.conversation_state
 
     lead = relationship("Lead", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # At most one open conversation per lead; arbiter for the ingest upsert
+        Index(
+            "uq_conversations_lead_open",
+            "lead_id",
+            unique=True,
+            postgresql_where=text("status = 'open'"),
+            sqlite_where=text("status = 'open'"),
+        ),
+        # Dashboard listing: filter by status, keyset on (last_message_at, id)
+        Index("ix_conversations_status_last_message_at", "status", "last_message_at"),
+    )
+
 
 class Message(Base):
-    """Represents a message in a conversation."""
+    """
+    Represents a message in a conversation.
+
+    On Postgres the table is range-partitioned by month on ``timestamp``
+    (partitions are managed by services.partitions), so its primary key is
+    ``(id, timestamp)`` there; ``id`` alone stays unique through its sequence.
+    """
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
     sender = Column(String, nullable=False)  # 'lead', 'bot', 'human'
     content = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    message_sid = Column(String(64), nullable=True)  # Twilio MessageSid, deduplicated through MessageSid
 
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        # Thread reads: keyset on (timestamp, id) within one conversation
+        Index("ix_messages_conversation_timestamp", "conversation_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class MessageSid(Base):
+    """
+    Twilio MessageSids already stored, used to drop webhook retries.
+
+    Kept outside ``messages`` because a unique constraint on a partitioned
+    table must include the partition key. Rows are pruned after
+    MESSAGE_SID_RETENTION_DAYS.
+    """
+    __tablename__ = "message_sids"
+
+    sid = Column(String(64), primary_key=True)
+    message_id = Column(Integer, nullable=False)
+    conversation_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class ConversationArchive(Base):
+    """Location of an archived conversation's messages in the cold store."""
+    __tablename__ = "conversation_archives"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    path = Column(String, nullable=False)  # relative to settings.ARCHIVE_DIR
+    offset = Column(BigInteger, nullable=False)  # zstd frame holding the JSONL thread
+    length = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    first_message_at = Column(DateTime, nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 
 class Appointment(Base):
     """Represents a scheduled appointment."""
@@ -49,7 +107,96 @@ class Appointment(Base):
     id = Column(Integer, primary_key=True, index=True)
     lead_id = Column(Integer, ForeignKey("leads.id"), nullable=False, index=True)
     service = Column(String, nullable=False)
+    resource = Column(String, nullable=False, default="default", index=True)  # professional/room booked
     start_at = Column(DateTime, nullable=False, index=True)
     end_at = Column(DateTime, nullable=False)
     status = Column(String, default="pending", index=True)  # pending, confirmed, completed, cancelled
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # No two active appointments may overlap on the same resource
+        ExcludeConstraint(
+            (resource, "="),
+            (func.tsrange(start_at, end_at), "&&"),
+            name="appointments_no_overlap",
+            using="gist",
+            where=text("status <> 'cancelled'"),
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+
+class OutboxEvent(Base):
+    """Task handoff written in the same transaction as the data it refers to."""
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)  # Celery task name
+    payload = Column(JSON, nullable=False)  # task keyword arguments
+    available_at = Column(DateTime, nullable=False)  # task must not run before this
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    published_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # Relay scan: pending rows in id order
+        Index(
+            "ix_outbox_pending",
+            "id",
+            postgresql_where=text("published_at IS NULL"),
+            sqlite_where=text("published_at IS NULL"),
+        ),
+    )
+
+
+class MessageExtraction(Base):
+    """Slot extraction of a lead message, written by batch re-extraction jobs."""
+    __tablename__ = "message_extractions"
+
+    # No foreign key: messages is keyed on (id, timestamp) on Postgres
+    message_id = Column(Integer, primary_key=True)
+    conversation_id = Column(Integer, nullable=False, index=True)
+    prompt = Column(String, nullable=False)  # prompt registry key, e.g. extract_batch-v1
+    result = Column(JSON, nullable=False)  # ExtractionResult fields
+    extracted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class BatchCheckpoint(Base):
+    """Progress of a resumable batch job (see services.batch_extraction)."""
+    __tablename__ = "batch_checkpoints"
+
+    job = Column(String, primary_key=True)
+    prompt = Column(String, nullable=False)  # prompt registry key the job runs with
+    last_message_id = Column(Integer, nullable=False, default=0)  # every message up to this id is done
+    until_message_id = Column(Integer, nullable=False)  # upper bound, fixed when the job starts
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)  # messages the model returned no result for
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# btree_gist provides the "=" operator class the exclusion constraint needs
+event.listen(
+    Appointment.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+
+# Partitioned tables need the partition key in the primary key. SQLite and
+# the ORM keep ``id`` as the key; on Postgres it becomes (id, timestamp) and
+# a default partition catches rows outside the monthly partitions.
+Message.__table__.primary_key.ddl_if(
+    callable_=lambda ddl, target, bind, dialect, **kw: dialect.name != "postgresql"
+)
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL("ALTER TABLE messages ADD PRIMARY KEY (id, timestamp)").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL("CREATE TABLE messages_default PARTITION OF messages DEFAULT").execute_if(dialect="postgresql"),
+)
@@ -1,3 +1,4 @@
+import re
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
 from typing import Optional, List
@@ -20,6 +21,7 @@ class AppointmentCreate(BaseModel):
     """Schema for creating an appointment."""
     lead_id: int = Field(..., gt=0)
     service: str = Field(..., min_length=1, max_length=100)
+    resource: str = Field("default", min_length=1, max_length=100)
     start_at: datetime
     end_at: datetime
 
@@ -30,11 +32,24 @@ class AppointmentCreate(BaseModel):
         return v
 
 
+class AppointmentImport(AppointmentCreate):
+    """Schema for one row of a bulk appointment import."""
+    status: str = "confirmed"
+
+    @validator("status")
+    def validate_status(cls, v):
+        allowed = ["pending", "confirmed", "completed", "cancelled"]
+        if v.lower() not in allowed:
+            raise ValueError(f"status must be one of {allowed}")
+        return v.lower()
+
+
 class AppointmentResponse(BaseModel):
     """Schema for appointment responses."""
     id: int
     lead_id: int
     service: str
+    resource: str
     status: str
     start_at: datetime
     end_at: datetime
@@ -65,3 +80,61 @@ class ConversationResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ExtractionResult(BaseModel):
+    """Typed slot extraction returned by the LLM, with lenient coercion."""
+    name: str = ""
+    service: str = ""
+    preferred_date: str = ""
+    preferred_time: str = ""
+    missing_slots: List[str] = []
+    confidence: int = 0
+
+    @validator("name", "service", "preferred_date", "preferred_time", pre=True)
+    def coerce_text(cls, v):
+        if v is None:
+            return ""
+        v = str(v).strip()
+        # Models sometimes echo placeholders for unknown fields
+        return "" if v.lower() in ("null", "none", "n/a", "-", "desconhecido") else v
+
+    @validator("preferred_date")
+    def normalize_date(cls, v):
+        if not v:
+            return v
+        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"):
+            try:
+                return datetime.strptime(v, fmt).date().isoformat()
+            except ValueError:
+                continue
+        return ""
+
+    @validator("preferred_time")
+    def normalize_time(cls, v):
+        match = re.match(r"^(\d{1,2})(?:[:h](\d{2})?)?(?::\d{2})?$", v.lower()) if v else None
+        if not match or int(match.group(1)) > 23 or int(match.group(2) or 0) > 59:
+            return ""
+        return f"{int(match.group(1)):02d}:{match.group(2) or '00'}"
+
+    @validator("missing_slots", pre=True)
+    def coerce_slots(cls, v):
+        if v is None:
+            return []
+        if isinstance(v, str):
+            v = v.split(",")
+        return [str(slot).strip() for slot in v if str(slot).strip()]
+
+    @validator("confidence", pre=True)
+    def coerce_confidence(cls, v):
+        if isinstance(v, str):
+            match = re.search(r"\d+(?:[.,]\d+)?", v)
+            v = float(match.group().replace(",", ".")) if match else 0
+        try:
+            v = float(v or 0)
+        except (TypeError, ValueError):
+            return 0
+        # Some models answer on a 0-1 scale
+        if 0 < v < 1:
+            v *= 100
+        return int(max(0, min(100, v)))
@@ -0,0 +1,112 @@
+import csv
+import io
+import logging
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Appointment
+
+logger = logging.getLogger(__name__)
+
+EXCLUSION_VIOLATION = "23P01"
+
+IMPORT_COLUMNS = ["lead_id", "service", "resource", "start_at", "end_at", "status"]
+
+STAGE_SQL = """
+CREATE TEMP TABLE appointments_import (
+    lead_id integer, service text, resource text,
+    start_at timestamp, end_at timestamp, status text
+) ON COMMIT DROP
+"""
+
+COPY_SQL = "COPY appointments_import (lead_id, service, resource, start_at, end_at, status) FROM STDIN WITH (FORMAT csv)"
+
+# Rows overlapping an existing booking (or an earlier row of the same import)
+# are skipped by the exclusion constraint instead of failing the whole batch
+MERGE_SQL = """
+INSERT INTO appointments (lead_id, service, resource, start_at, end_at, status, created_at)
+SELECT lead_id, service, resource, start_at, end_at, status, %(now)s
+FROM appointments_import
+ORDER BY start_at
+ON CONFLICT DO NOTHING
+RETURNING id, resource, start_at, end_at, status
+"""
+
+
+def is_overlap_violation(error: Exception) -> bool:
+    """True if an IntegrityError comes from the appointments overlap constraint."""
+    orig = getattr(error, "orig", None)
+    code = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    return isinstance(error, IntegrityError) and code == EXCLUSION_VIOLATION
+
+
+def _copy_rows(cursor, rows: Sequence[Dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in IMPORT_COLUMNS])
+    buffer.seek(0)
+
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(COPY_SQL, buffer)
+    else:  # psycopg 3
+        with cursor.copy(COPY_SQL) as copy:
+            copy.write(buffer.getvalue())
+
+
+def bulk_insert_appointments(db: Session, rows: Sequence[Dict]) -> List[Tuple[int, str, datetime, datetime, str]]:
+    """
+    Insert many appointments in one transaction.
+
+    On Postgres the rows are streamed with COPY into a temporary staging
+    table and merged with a single ``INSERT ... SELECT``; rows that would
+    double-book a resource are skipped. Other dialects use an executemany.
+
+    Args:
+        db: Database session
+        rows: Validated rows with the IMPORT_COLUMNS keys
+
+    Returns:
+        ``(id, resource, start_at, end_at, status)`` of every inserted appointment
+    """
+    if not rows:
+        return []
+    now = datetime.utcnow()
+
+    if db.get_bind().dialect.name != "postgresql":
+        result = db.execute(
+            insert(Appointment).returning(
+                Appointment.id, Appointment.resource, Appointment.start_at, Appointment.end_at, Appointment.status
+            ),
+            [{**row, "created_at": now} for row in rows],
+        )
+        inserted = [tuple(r) for r in result]
+        db.commit()
+        return inserted
+
+    dbapi = db.get_bind().dialect.dbapi
+    connection = db.connection().connection.dbapi_connection
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(STAGE_SQL)
+            _copy_rows(cursor, rows)
+            cursor.execute(MERGE_SQL, {"now": now})
+            inserted = [tuple(r) for r in cursor.fetchall()]
+        db.commit()
+    except dbapi.IntegrityError as e:
+        db.rollback()
+        # Raw cursor errors are not wrapped by SQLAlchemy; match the ORM path
+        raise IntegrityError(MERGE_SQL, None, e) from e
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Bulk imported {len(inserted)} of {len(rows)} appointments")
+    return inserted
+
+
+def parse_csv(payload: str) -> List[Dict]:
+    """Parse a CSV export with a header row into raw appointment dicts."""
+    reader = csv.DictReader(io.StringIO(payload))
+    return [{k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k} for row in reader]
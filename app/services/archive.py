@@ -0,0 +1,204 @@
+import itertools
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import zstandard
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.orm import Session
+from config import settings
+from core.cache import lookup_cache
+from models import Conversation, ConversationArchive, Message
+
+logger = logging.getLogger(__name__)
+
+# Cold store layout: one file per archive run under ARCHIVE_DIR/YYYY/MM/,
+# holding one zstd frame per conversation. Each frame decompresses to the
+# conversation's messages as JSON lines, and conversation_archives records
+# the frame's offset and length so a single thread is read without
+# decompressing the whole file.
+
+
+@dataclass
+class ArchivedMessage:
+    id: int
+    sender: str
+    content: str
+    timestamp: Optional[datetime]
+    message_sid: Optional[str] = None
+
+
+def close_idle_conversations(db: Session, idle_hours: float = None, now: Optional[datetime] = None) -> int:
+    """
+    Close open conversations without messages for ``idle_hours``.
+
+    The lead's next message then starts a new conversation, and the closed
+    one becomes eligible for archiving. The leads' open conversations are
+    dropped from the lookup cache once the change is committed.
+
+    Args:
+        db: Database session
+        idle_hours: Inactivity threshold (defaults to settings.CONVERSATION_IDLE_HOURS)
+        now: Reference time (defaults to utcnow)
+
+    Returns:
+        Number of conversations closed
+    """
+    idle_hours = settings.CONVERSATION_IDLE_HOURS if idle_hours is None else idle_hours
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=idle_hours)
+    lead_ids = db.execute(
+        update(Conversation)
+        .where(Conversation.status == "open", Conversation.last_message_at < cutoff)
+        # Keep last_message_at: its onupdate would otherwise reset the idle clock
+        .values(status="closed", last_message_at=Conversation.last_message_at)
+        .returning(Conversation.lead_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    if lead_ids:
+        lookup_cache.forget_conversations(lead_ids)
+        logger.info(f"Closed {len(lead_ids)} idle conversations")
+    return len(lead_ids)
+
+
+def _thread_frame(compressor: zstandard.ZstdCompressor, messages: List[Message]) -> bytes:
+    lines = (
+        json.dumps(
+            {
+                "id": m.id,
+                "sender": m.sender,
+                "content": m.content,
+                "timestamp": m.timestamp.isoformat() if m.timestamp else None,
+                "message_sid": m.message_sid,
+            },
+            ensure_ascii=False,
+        )
+        for m in messages
+    )
+    return compressor.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def archive_conversations(
+    db: Session,
+    older_than_days: float = None,
+    batch_size: int = None,
+    archive_dir: str = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    Move the messages of one batch of old, non-open conversations to the cold store.
+
+    The archive file is written and fsynced before the transaction that
+    records the frame locations and deletes the rows commits, so a crash
+    leaves at worst an orphaned file and the batch is archived again.
+
+    Args:
+        db: Database session
+        older_than_days: Minimum age of the last message (defaults to settings.ARCHIVE_AFTER_DAYS)
+        batch_size: Conversations per archive file (defaults to settings.ARCHIVE_BATCH_SIZE)
+        archive_dir: Cold store root (defaults to settings.ARCHIVE_DIR)
+        now: Reference time (defaults to utcnow)
+
+    Returns:
+        Dictionary with conversations and messages archived and the file path
+    """
+    older_than_days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    archive_dir = archive_dir or settings.ARCHIVE_DIR
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+
+    try:
+        conversation_ids = db.execute(
+            select(Conversation.id)
+            .where(
+                Conversation.status != "open",
+                Conversation.last_message_at < cutoff,
+                ~exists().where(ConversationArchive.conversation_id == Conversation.id),
+            )
+            .order_by(Conversation.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not conversation_ids:
+            db.rollback()
+            return {"conversations": 0, "messages": 0, "path": None}
+
+        relative_path = os.path.join(
+            f"{now:%Y}", f"{now:%m}", f"messages-{now:%Y%m%dT%H%M%S}-{conversation_ids[0]}.jsonl.zst"
+        )
+        path = os.path.join(archive_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        rows = db.execute(
+            select(Message)
+            .where(Message.conversation_id.in_(conversation_ids))
+            .order_by(Message.conversation_id, Message.timestamp, Message.id)
+            .execution_options(yield_per=1000)
+        ).scalars()
+        threads = {cid: list(group) for cid, group in itertools.groupby(rows, key=lambda m: m.conversation_id)}
+
+        compressor = zstandard.ZstdCompressor(level=settings.ARCHIVE_ZSTD_LEVEL)
+        entries = []
+        message_count = 0
+        with open(path + ".tmp", "wb") as f:
+            for cid in conversation_ids:
+                messages = threads.get(cid, [])
+                frame = _thread_frame(compressor, messages) if messages else b""
+                entries.append(ConversationArchive(
+                    conversation_id=cid,
+                    path=relative_path,
+                    offset=f.tell(),
+                    length=len(frame),
+                    message_count=len(messages),
+                    first_message_at=messages[0].timestamp if messages else None,
+                    last_message_at=messages[-1].timestamp if messages else None,
+                    archived_at=now,
+                ))
+                f.write(frame)
+                message_count += len(messages)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        db.add_all(entries)
+        db.execute(delete(Message).where(Message.conversation_id.in_(conversation_ids)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"Archived {len(conversation_ids)} conversations ({message_count} messages) to {relative_path}")
+    return {"conversations": len(conversation_ids), "messages": message_count, "path": relative_path}
+
+
+def read_archived_messages(entry: ConversationArchive, archive_dir: str = None) -> List[ArchivedMessage]:
+    """
+    Load an archived conversation's messages from the cold store.
+
+    Args:
+        entry: Archive location of the conversation
+        archive_dir: Cold store root (defaults to settings.ARCHIVE_DIR)
+
+    Returns:
+        Messages ordered by timestamp and id
+    """
+    if not entry.length:
+        return []
+    with open(os.path.join(archive_dir or settings.ARCHIVE_DIR, entry.path), "rb") as f:
+        f.seek(entry.offset)
+        frame = f.read(entry.length)
+    messages = []
+    for line in zstandard.ZstdDecompressor().decompress(frame).decode("utf-8").splitlines():
+        record = json.loads(line)
+        timestamp = record.get("timestamp")
+        messages.append(ArchivedMessage(
+            id=record["id"],
+            sender=record["sender"],
+            content=record["content"],
+            timestamp=datetime.fromisoformat(timestamp) if timestamp else None,
+            message_sid=record.get("message_sid"),
+        ))
+    return messages
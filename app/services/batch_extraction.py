@@ -0,0 +1,240 @@
+import json
+import logging
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from config import settings
+from core.llm import BATCH_EXTRACTION_PROMPT, analyze_batch
+from core.prompts import PromptTemplate, get_prompt
+from core.tokens import count_tokens, truncate_to_tokens
+from models import BatchCheckpoint, Message, MessageExtraction
+from workers.event_loop import submit_async
+
+logger = logging.getLogger(__name__)
+
+# Messages as read from the cursor: (id, conversation_id, content)
+MessageRow = Tuple[int, int, str]
+
+
+@dataclass
+class Chunk:
+    """Consecutive messages sent to the LLM in one request."""
+
+    items: List[Dict[str, Any]] = field(default_factory=list)  # {"id", "text"} in id order
+    conversations: Dict[int, int] = field(default_factory=dict)  # message id -> conversation id
+    tokens: int = 0
+
+    @property
+    def last_id(self) -> int:
+        return self.items[-1]["id"]
+
+
+def start_job(
+    db: Session, job: str, since_id: int = 0, until_id: Optional[int] = None, prompt_version: Optional[str] = None
+) -> BatchCheckpoint:
+    """
+    Return the checkpoint of ``job``, creating it on first use.
+
+    A new job covers lead messages after ``since_id`` up to ``until_id``
+    (defaults to the newest message now), so messages arriving while it runs
+    do not extend it. An existing job keeps its range and prompt version.
+
+    Args:
+        db: Database session
+        job: Job name, e.g. "reextract-2026-10"
+        since_id: Start after this message id
+        until_id: Last message id to cover
+        prompt_version: Batch prompt version (defaults to the configured one)
+    """
+    checkpoint = db.get(BatchCheckpoint, job)
+    if checkpoint is not None:
+        return checkpoint
+    if until_id is None:
+        until_id = db.execute(select(func.max(Message.id))).scalar() or 0
+    checkpoint = BatchCheckpoint(
+        job=job,
+        prompt=get_prompt(BATCH_EXTRACTION_PROMPT, prompt_version).key,
+        last_message_id=since_id,
+        until_message_id=until_id,
+        processed=0,
+        failed=0,
+    )
+    db.add(checkpoint)
+    db.commit()
+    logger.info(f"Started batch extraction job {job} over messages {since_id + 1}..{until_id}")
+    return checkpoint
+
+
+def stream_lead_messages(
+    conn: Connection, after_id: int, until_id: int, fetch_size: int = None
+) -> Iterator[MessageRow]:
+    """
+    Stream lead messages in id order through a server-side cursor.
+
+    Only ``fetch_size`` rows are held in memory at a time, whatever the
+    size of the range.
+    """
+    fetch_size = fetch_size or settings.BATCH_EXTRACTION_FETCH_SIZE
+    result = conn.execution_options(stream_results=True, yield_per=fetch_size).execute(
+        select(Message.id, Message.conversation_id, Message.content)
+        .where(Message.sender == "lead", Message.id > after_id, Message.id <= until_id)
+        .order_by(Message.id)
+    )
+    for row in result:
+        yield tuple(row)
+
+
+def pack_messages(
+    rows: Iterable[MessageRow],
+    template: PromptTemplate,
+    max_items: int = None,
+    token_budget: int = None,
+    message_tokens: int = None,
+) -> Iterator[Chunk]:
+    """
+    Group consecutive messages into chunks that fit one batch prompt.
+
+    A chunk closes at ``max_items`` messages or when the next one would push
+    the prompt over ``token_budget``. Messages longer than ``message_tokens``
+    are truncated first, so a single message always fits.
+    """
+    max_items = max_items or settings.BATCH_EXTRACTION_MESSAGES_PER_REQUEST
+    token_budget = token_budget or settings.BATCH_EXTRACTION_TOKEN_BUDGET
+    message_tokens = message_tokens or settings.BATCH_EXTRACTION_MESSAGE_TOKENS
+    available = token_budget - template.overhead_tokens()
+
+    chunk = Chunk()
+    for message_id, conversation_id, content in rows:
+        item = {"id": message_id, "text": truncate_to_tokens(content, message_tokens)}
+        tokens = count_tokens(json.dumps(item, ensure_ascii=False, separators=(",", ":"))) + 1
+        if chunk.items and (len(chunk.items) >= max_items or chunk.tokens + tokens > available):
+            yield chunk
+            chunk = Chunk()
+        chunk.items.append(item)
+        chunk.conversations[message_id] = conversation_id
+        chunk.tokens += tokens
+    if chunk.items:
+        yield chunk
+
+
+def save_extractions(db: Session, prompt: str, conversations: Dict[int, int], results: Dict[int, Dict[str, Any]]):
+    """Upsert extractions with one multi-row ``INSERT ... ON CONFLICT``."""
+    now = datetime.utcnow()
+    # Ids the model made up (not in the chunk) are ignored
+    rows = [
+        {
+            "message_id": message_id,
+            "conversation_id": conversations[message_id],
+            "prompt": prompt,
+            "result": result,
+            "extracted_at": now,
+        }
+        for message_id, result in results.items()
+        if message_id in conversations
+    ]
+    if not rows:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(MessageExtraction).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[MessageExtraction.message_id],
+        set_={"prompt": stmt.excluded.prompt, "result": stmt.excluded.result, "extracted_at": stmt.excluded.extracted_at},
+    ))
+
+
+def _finish_chunk(db: Session, checkpoint: BatchCheckpoint, chunk: Chunk, future: Future):
+    # Results and checkpoint commit together, so a crash never skips or
+    # double-counts a chunk
+    results = future.result()
+    save_extractions(db, checkpoint.prompt, chunk.conversations, results)
+    returned = len(results.keys() & chunk.conversations.keys())
+    checkpoint.last_message_id = chunk.last_id
+    checkpoint.processed += returned
+    checkpoint.failed += len(chunk.items) - returned
+    db.commit()
+
+
+def run_batch_extraction(
+    db: Session,
+    job: str,
+    since_id: int = 0,
+    until_id: Optional[int] = None,
+    prompt_version: Optional[str] = None,
+    max_messages: int = None,
+    parallelism: int = None,
+    use_openrouter: bool = True,
+) -> Dict[str, Any]:
+    """
+    Re-extract slots for lead messages, resuming from the job's checkpoint.
+
+    Messages are streamed with a server-side cursor and packed several per
+    LLM request. Up to ``parallelism`` requests run at once on the worker
+    event loop. Chunks are written back in id order, each with a multi-row
+    upsert into message_extractions and a checkpoint advance in the same
+    commit. Messages the model returned no result for are counted as failed
+    and skipped. A request that fails outright stops the run and leaves the
+    checkpoint before it, so the next run retries it.
+
+    Args:
+        db: Database session for results and the checkpoint
+        job: Job name; reuse it to resume
+        since_id: Start after this message id (new jobs only)
+        until_id: Last message id to cover (new jobs only, defaults to the newest)
+        prompt_version: Batch prompt version (new jobs only)
+        max_messages: Messages to process in this run (defaults to settings.BATCH_EXTRACTION_MAX_MESSAGES)
+        parallelism: LLM requests in flight (defaults to settings.BATCH_EXTRACTION_PARALLELISM)
+        use_openrouter: Prefer OpenRouter (default) or OpenAI as primary provider
+
+    Returns:
+        Checkpoint summary with ``done`` telling whether the job finished
+
+    Raises:
+        Exception: The error of the failed LLM request or database write
+    """
+    max_messages = max_messages or settings.BATCH_EXTRACTION_MAX_MESSAGES
+    parallelism = parallelism or settings.BATCH_EXTRACTION_PARALLELISM
+    in_flight: Deque[Tuple[Chunk, Future]] = deque()
+    try:
+        checkpoint = start_job(db, job, since_id, until_id, prompt_version)
+        if checkpoint.finished_at is None:
+            version = checkpoint.prompt.rsplit("-", 1)[1]
+            template = get_prompt(BATCH_EXTRACTION_PROMPT, version)
+            read = 0
+            # Separate connection: commits on the session must not close the cursor
+            with db.get_bind().connect() as conn:
+                rows = islice(
+                    stream_lead_messages(conn, checkpoint.last_message_id, checkpoint.until_message_id), max_messages
+                )
+                for chunk in pack_messages(rows, template):
+                    read += len(chunk.items)
+                    future = submit_async(analyze_batch(chunk.items, use_openrouter, prompt_version=version))
+                    in_flight.append((chunk, future))
+                    if len(in_flight) >= parallelism:
+                        _finish_chunk(db, checkpoint, *in_flight.popleft())
+            while in_flight:
+                _finish_chunk(db, checkpoint, *in_flight.popleft())
+            if read < max_messages:
+                checkpoint.finished_at = datetime.utcnow()
+                db.commit()
+                logger.info(f"Batch extraction job {job} finished")
+        return {
+            "job": job,
+            "prompt": checkpoint.prompt,
+            "last_message_id": checkpoint.last_message_id,
+            "until_message_id": checkpoint.until_message_id,
+            "processed": checkpoint.processed,
+            "failed": checkpoint.failed,
+            "done": checkpoint.finished_at is not None,
+        }
+    except Exception:
+        for _, future in in_flight:
+            future.cancel()
+        db.rollback()
+        raise
@@ -0,0 +1,401 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+from sqlalchemy import delete, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config import settings
+from core.cache import lookup_cache
+from models import Lead, Conversation, Message, MessageSid, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Get-or-create lead, get-or-create open conversation and insert the message
+# in one statement. The no-op DO UPDATE makes RETURNING yield the existing
+# row on conflict, which also serializes concurrent messages from one phone.
+# The message id is drawn up front so the Twilio SID can be claimed in
+# message_sids; a SID that is already stored inserts no message, so the
+# statement returns no row. The processing task is handed off through an
+# outbox row in the same transaction; NOTIFY wakes the relay on commit.
+INGEST_SQL = text("""
+WITH lead_row AS (
+    INSERT INTO leads (phone, created_at)
+    VALUES (:phone, :now)
+    ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
+    RETURNING id, (xmax = 0) AS created
+),
+conversation_row AS (
+    INSERT INTO conversations (lead_id, status, last_message_at)
+    SELECT id, 'open', :now FROM lead_row
+    ON CONFLICT (lead_id) WHERE status = 'open'
+    DO UPDATE SET last_message_at = EXCLUDED.last_message_at
+    RETURNING id, lead_id, (xmax = 0) AS created
+),
+message_id AS (
+    SELECT nextval('messages_id_seq') AS id
+),
+sid_row AS (
+    INSERT INTO message_sids (sid, message_id, conversation_id, created_at)
+    SELECT :message_sid, message_id.id, conversation_row.id, :now FROM message_id, conversation_row
+    WHERE CAST(:message_sid AS VARCHAR) IS NOT NULL
+    ON CONFLICT (sid) DO NOTHING
+    RETURNING sid
+),
+message_row AS (
+    INSERT INTO messages (id, conversation_id, sender, content, timestamp, message_sid)
+    SELECT message_id.id, conversation_row.id, 'lead', :content, :now, :message_sid
+    FROM message_id, conversation_row
+    WHERE CAST(:message_sid AS VARCHAR) IS NULL OR EXISTS (SELECT 1 FROM sid_row)
+    RETURNING id, conversation_id
+),
+outbox_row AS (
+    INSERT INTO outbox (topic, payload, available_at, created_at, attempts)
+    SELECT :topic, json_build_object('conversation_id', conversation_id, 'message_id', id), :available_at, :now, 0
+    FROM message_row
+    RETURNING id
+)
+SELECT
+    conversation_row.lead_id,
+    conversation_row.id AS conversation_id,
+    message_row.id AS message_id,
+    lead_row.created AS lead_created,
+    conversation_row.created AS conversation_created
+FROM lead_row, conversation_row, message_row, outbox_row, pg_notify(:channel, '')
+""")
+
+# INGEST_SQL for a lead whose open conversation is known from the lookup
+# cache: touches only that conversation, so the lead row is neither locked
+# nor rewritten. No row comes back when the conversation is no longer open
+# (the caller falls back to INGEST_SQL); a NULL message_id means the SID
+# was already stored.
+OPEN_CONVERSATION_INGEST_SQL = text("""
+WITH conversation_row AS (
+    UPDATE conversations SET last_message_at = :now
+    WHERE id = :conversation_id AND lead_id = :lead_id AND status = 'open'
+    RETURNING id, lead_id
+),
+message_id AS (
+    SELECT nextval('messages_id_seq') AS id
+),
+sid_row AS (
+    INSERT INTO message_sids (sid, message_id, conversation_id, created_at)
+    SELECT :message_sid, message_id.id, conversation_row.id, :now FROM message_id, conversation_row
+    WHERE CAST(:message_sid AS VARCHAR) IS NOT NULL
+    ON CONFLICT (sid) DO NOTHING
+    RETURNING sid
+),
+message_row AS (
+    INSERT INTO messages (id, conversation_id, sender, content, timestamp, message_sid)
+    SELECT message_id.id, conversation_row.id, 'lead', :content, :now, :message_sid
+    FROM message_id, conversation_row
+    WHERE CAST(:message_sid AS VARCHAR) IS NULL OR EXISTS (SELECT 1 FROM sid_row)
+    RETURNING id, conversation_id
+),
+outbox_row AS (
+    INSERT INTO outbox (topic, payload, available_at, created_at, attempts)
+    SELECT :topic, json_build_object('conversation_id', conversation_id, 'message_id', id), :available_at, :now, 0
+    FROM message_row
+    RETURNING id
+),
+notified AS (
+    SELECT pg_notify(:channel, '') FROM outbox_row
+)
+SELECT conversation_row.lead_id, conversation_row.id AS conversation_id, message_row.id AS message_id
+FROM conversation_row
+LEFT JOIN message_row ON true
+LEFT JOIN notified ON true
+""")
+
+# Multi-row variant of INGEST_SQL for workers.ingest_consumer: the batch is
+# passed as parallel arrays and unnested, leads and open conversations are
+# upserted once per phone, and each message gets its id, SID claim and
+# outbox row in the same statement. Message ids follow the input order.
+BATCH_INGEST_SQL = text("""
+WITH input AS (
+    SELECT * FROM unnest(
+        CAST(:phones AS varchar[]), CAST(:contents AS text[]),
+        CAST(:sids AS varchar[]), CAST(:received AS timestamp[])
+    ) WITH ORDINALITY AS t(phone, content, sid, received_at, ord)
+),
+lead_rows AS (
+    INSERT INTO leads (phone, created_at)
+    SELECT phone, min(received_at) FROM input GROUP BY phone
+    ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
+    RETURNING id, phone
+),
+conversation_rows AS (
+    INSERT INTO conversations (lead_id, status, last_message_at)
+    SELECT lead_rows.id, 'open', max(input.received_at)
+    FROM input JOIN lead_rows USING (phone)
+    GROUP BY lead_rows.id
+    ON CONFLICT (lead_id) WHERE status = 'open'
+    DO UPDATE SET last_message_at = GREATEST(conversations.last_message_at, EXCLUDED.last_message_at)
+    RETURNING id, lead_id
+),
+numbered AS (
+    SELECT input.*, conversation_rows.id AS conversation_id, conversation_rows.lead_id,
+           nextval('messages_id_seq') AS message_id
+    FROM input
+    JOIN lead_rows USING (phone)
+    JOIN conversation_rows ON conversation_rows.lead_id = lead_rows.id
+    ORDER BY input.ord
+),
+sid_rows AS (
+    INSERT INTO message_sids (sid, message_id, conversation_id, created_at)
+    SELECT sid, message_id, conversation_id, received_at FROM numbered
+    WHERE sid IS NOT NULL
+    ON CONFLICT (sid) DO NOTHING
+    RETURNING message_id
+),
+message_rows AS (
+    INSERT INTO messages (id, conversation_id, sender, content, timestamp, message_sid)
+    SELECT message_id, conversation_id, 'lead', content, received_at, sid FROM numbered
+    WHERE sid IS NULL OR message_id IN (SELECT message_id FROM sid_rows)
+    RETURNING id, conversation_id, timestamp
+),
+outbox_rows AS (
+    INSERT INTO outbox (topic, payload, available_at, created_at, attempts)
+    SELECT :topic, json_build_object('conversation_id', conversation_id, 'message_id', id),
+           timestamp + make_interval(secs => :window), :now, 0
+    FROM message_rows
+    RETURNING id
+)
+SELECT numbered.lead_id, message_rows.conversation_id, message_rows.id
+FROM message_rows
+JOIN numbered ON numbered.message_id = message_rows.id, pg_notify(:channel, '')
+ORDER BY message_rows.id
+""")
+
+PROCESS_MESSAGE_TOPIC = "workers.process_message.process_message"
+
+
+@dataclass
+class IngestResult:
+    lead_id: int
+    conversation_id: int
+    message_id: int
+    lead_created: bool = False
+    conversation_created: bool = False
+    duplicate: bool = False
+
+
+@dataclass
+class InboundEvent:
+    """Inbound message queued by the lean webhook, not stored yet."""
+    phone: str
+    content: str
+    message_sid: Optional[str]
+    received_at: datetime
+
+
+def ingest_inbound_message(db: Session, phone: str, content: str, message_sid: Optional[str] = None) -> IngestResult:
+    """
+    Store an inbound WhatsApp message in a single transaction.
+
+    On Postgres this is one ``INSERT ... ON CONFLICT ... RETURNING`` statement
+    plus the commit, or a lighter statement that skips the lead upsert when
+    the lead and its open conversation are in the lookup cache. Other
+    dialects (SQLite in benchmarks) use an ORM path that flushes inside one
+    transaction and reads the ids through the same cache.
+
+    A message whose ``message_sid`` was already stored is not inserted
+    again; the existing row is returned with ``duplicate=True``. New
+    messages get an outbox row scheduling ``process_message`` after the
+    coalescing window, published by ``workers.outbox_relay``.
+
+    Args:
+        db: Database session
+        phone: Cleaned sender phone number
+        content: Message body
+        message_sid: Twilio MessageSid of the inbound message
+
+    Returns:
+        IngestResult with the lead, conversation and message ids
+    """
+    now = datetime.utcnow()
+    available_at = now + timedelta(seconds=settings.COALESCE_WINDOW_SECONDS)
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            result = _ingest_postgres(db, phone, content, now, available_at, message_sid)
+        else:
+            result = _ingest_orm(db, phone, content, now, available_at, message_sid)
+        if result is None:
+            db.rollback()
+            return _existing_message(db, message_sid)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # Lost a race with a concurrent delivery of the same message?
+        existing = _existing_message(db, message_sid) if message_sid else None
+        if existing is None:
+            raise
+        return existing
+    except Exception:
+        db.rollback()
+        raise
+
+    # Only committed ids are cached
+    lookup_cache.remember(phone, result.lead_id, result.conversation_id)
+    if result.lead_created:
+        logger.info(f"Created new lead: {phone}")
+    if result.conversation_created:
+        logger.info(f"Created new conversation for lead {result.lead_id}")
+    return result
+
+
+def ingest_inbound_batch(db: Session, events: Sequence[InboundEvent]) -> List[IngestResult]:
+    """
+    Store a batch of inbound messages in one transaction.
+
+    On Postgres this is a single multi-row statement (BATCH_INGEST_SQL);
+    other dialects store the events one by one. Messages keep the time the
+    webhook received them. Events whose ``message_sid`` is already stored,
+    including repeats within the batch, are skipped.
+
+    Args:
+        db: Database session
+        events: Events with cleaned phone numbers, oldest first
+
+    Returns:
+        IngestResult of each message stored, in message id order
+    """
+    if not events:
+        return []
+    if db.get_bind().dialect.name != "postgresql":
+        results = [ingest_inbound_message(db, e.phone, e.content, e.message_sid) for e in events]
+        return [r for r in results if not r.duplicate]
+
+    params = {
+        "phones": [e.phone for e in events],
+        "contents": [e.content for e in events],
+        "sids": [e.message_sid for e in events],
+        "received": [e.received_at for e in events],
+        "topic": PROCESS_MESSAGE_TOPIC,
+        "window": settings.COALESCE_WINDOW_SECONDS,
+        "now": datetime.utcnow(),
+        "channel": settings.OUTBOX_CHANNEL,
+    }
+    try:
+        rows = db.execute(BATCH_INGEST_SQL, params).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if len(rows) < len(events):
+        logger.info(f"Skipped {len(events) - len(rows)} duplicate deliveries in a batch of {len(events)}")
+    return [IngestResult(*row) for row in rows]
+
+
+def _existing_message(db: Session, message_sid: str) -> Optional[IngestResult]:
+    row = (
+        db.query(Conversation.lead_id, MessageSid.conversation_id, MessageSid.message_id)
+        .join(Conversation, Conversation.id == MessageSid.conversation_id)
+        .filter(MessageSid.sid == message_sid)
+        .one_or_none()
+    )
+    if row is None:
+        return None
+    logger.info(f"Duplicate delivery of {message_sid} (message {row.message_id})")
+    return IngestResult(*row, duplicate=True)
+
+
+def _ingest_postgres(
+    db: Session, phone: str, content: str, now: datetime, available_at: datetime, message_sid: Optional[str] = None
+) -> Optional[IngestResult]:
+    params = {
+        "phone": phone,
+        "content": content,
+        "now": now,
+        "message_sid": message_sid,
+        "topic": PROCESS_MESSAGE_TOPIC,
+        "available_at": available_at,
+        "channel": settings.OUTBOX_CHANNEL,
+    }
+    lead_id = lookup_cache.lead_id(phone)
+    conversation_id = lookup_cache.open_conversation_id(lead_id) if lead_id is not None else None
+    if conversation_id is not None:
+        row = db.execute(
+            OPEN_CONVERSATION_INGEST_SQL, {**params, "lead_id": lead_id, "conversation_id": conversation_id}
+        ).one_or_none()
+        if row is not None:
+            return IngestResult(*row) if row.message_id is not None else None
+        # Closed since it was cached: nothing was written, take the full path
+        lookup_cache.forget_conversations([lead_id], stale=True)
+
+    row = db.execute(INGEST_SQL, params).one_or_none()
+    return IngestResult(*row) if row is not None else None
+
+
+def _ingest_orm(
+    db: Session, phone: str, content: str, now: datetime, available_at: datetime, message_sid: Optional[str] = None
+) -> Optional[IngestResult]:
+    if message_sid and db.get(MessageSid, message_sid):
+        return None
+    lead_created = conversation_created = False
+
+    lead_id = lookup_cache.lead_id(phone, load=lambda: db.query(Lead.id).filter_by(phone=phone).scalar())
+    if lead_id is None:
+        lead = Lead(phone=phone, created_at=now)
+        db.add(lead)
+        db.flush()
+        lead_id = lead.id
+        lead_created = True
+
+    def load_open_conversation():
+        return db.query(Conversation.id).filter_by(lead_id=lead_id, status="open").scalar()
+
+    conversation_id = None
+    if not lead_created:
+        conversation_id = lookup_cache.open_conversation_id(lead_id, load=load_open_conversation)
+    if conversation_id is not None and not _touch_open_conversation(db, conversation_id, lead_id, now):
+        lookup_cache.forget_conversations([lead_id], stale=True)
+        conversation_id = load_open_conversation()
+        if conversation_id is not None:
+            _touch_open_conversation(db, conversation_id, lead_id, now)
+    if conversation_id is None:
+        conv = Conversation(lead_id=lead_id, status="open", last_message_at=now)
+        db.add(conv)
+        db.flush()
+        conversation_id = conv.id
+        conversation_created = True
+
+    msg = Message(conversation_id=conversation_id, sender="lead", content=content, timestamp=now, message_sid=message_sid)
+    db.add(msg)
+    db.flush()
+    if message_sid:
+        db.add(MessageSid(sid=message_sid, message_id=msg.id, conversation_id=conversation_id, created_at=now))
+    db.add(OutboxEvent(
+        topic=PROCESS_MESSAGE_TOPIC,
+        payload={"conversation_id": conversation_id, "message_id": msg.id},
+        available_at=available_at,
+        created_at=now,
+    ))
+    return IngestResult(lead_id, conversation_id, msg.id, lead_created, conversation_created)
+
+
+def _touch_open_conversation(db: Session, conversation_id: int, lead_id: int, now: datetime) -> bool:
+    """Bump the conversation's last_message_at if it is still the lead's open one."""
+    result = db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id, Conversation.lead_id == lead_id, Conversation.status == "open")
+        .values(last_message_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def purge_message_sids(db: Session, older_than: timedelta = None) -> int:
+    """
+    Forget Twilio SIDs stored more than ``older_than`` ago.
+
+    Twilio retries a webhook within minutes, so SIDs only need to be kept
+    for a few days (settings.MESSAGE_SID_RETENTION_DAYS).
+
+    Returns:
+        Number of rows deleted
+    """
+    cutoff = datetime.utcnow() - (older_than or timedelta(days=settings.MESSAGE_SID_RETENTION_DAYS))
+    result = db.execute(delete(MessageSid).where(MessageSid.created_at < cutoff))
+    db.commit()
+    return result.rowcount
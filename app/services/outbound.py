@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import httpx
+from config import settings
+from core.http import get_async_client
+from core.metrics import current_message_id, timed
+from core.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# KEYS: bucket hash
+# ARGV: rate (tokens per second), capacity
+# Reserves one token and returns the seconds until it is available (0 when
+# one was in the bucket). Tokens may go negative: callers queue up behind
+# each other instead of polling. Returned as a string since Lua numbers are
+# truncated to integers on the way out. Uses the Redis clock, so hosts
+# with skewed clocks still share one schedule.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', string.format('%.6f', tokens), 'updated', string.format('%.6f', now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+if tokens >= 0 then
+    return '0'
+end
+return string.format('%.6f', -tokens / rate)
+"""
+
+
+class TokenBucket:
+    """In-process asyncio token bucket: ``rate`` tokens per second, bursting up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared by every process through Redis.
+
+    Each prefork child, Celery host and async worker draws from the same
+    bucket, so the rate holds for the whole deployment. When Redis is
+    unreachable the bucket falls back to an in-process TokenBucket: sending
+    slows to a local allowance instead of stopping.
+    """
+
+    def __init__(self, key: str, rate: float, capacity: Optional[float] = None, redis_client=None):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._redis = redis_client
+        self._script = None
+        self._fallback: Optional[TokenBucket] = None
+        self._degraded = False
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_async_redis()
+
+    async def acquire(self):
+        try:
+            if self._script is None:
+                self._script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+            wait = float(await self._script(keys=[self.key], args=[self.rate, self.capacity]))
+        except Exception as e:
+            if not self._degraded:
+                logger.warning(f"Rate limiter {self.key} unavailable, limiting per process: {e}")
+                self._degraded = True
+            if self._fallback is None:
+                self._fallback = TokenBucket(self.rate, self.capacity)
+            await self._fallback.acquire()
+            return
+        if self._degraded:
+            logger.info(f"Rate limiter {self.key} is shared again")
+            self._degraded = False
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class OutboundError(Exception):
+    """Raised when Twilio rejects a message or retries are exhausted."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+
+@dataclass
+class OutboundMessage:
+    to: str
+    body: str
+    key: str
+    future: Future = field(default_factory=Future)
+    attempts: int = 0
+    message_id: Optional[int] = None
+
+
+def _whatsapp_address(number: str) -> str:
+    return number if number.startswith("whatsapp:") else f"whatsapp:{number}"
+
+
+@timed("send_whatsapp")
+async def post_twilio_message(to: str, body: str, from_: Optional[str] = None) -> dict:
+    """
+    Send one message through the Twilio Messages REST API.
+
+    Args:
+        to: Recipient number (with or without the ``whatsapp:`` prefix)
+        body: Message text
+        from_: Sender number (defaults to settings.TWILIO_WHATSAPP)
+
+    Returns:
+        Twilio message resource as a dict
+    """
+    client = get_async_client(
+        "twilio",
+        base_url=settings.TWILIO_API_BASE,
+        auth=(settings.TWILIO_SID, settings.TWILIO_TOKEN),
+        timeout=settings.TWILIO_HTTP_TIMEOUT,
+        http2=False,
+    )
+    data = {
+        "From": _whatsapp_address(from_ or settings.TWILIO_WHATSAPP),
+        "To": _whatsapp_address(to),
+        "Body": body,
+    }
+    try:
+        response = await client.post(f"/2010-04-01/Accounts/{settings.TWILIO_SID}/Messages.json", data=data)
+    except httpx.TransportError as e:
+        raise OutboundError(f"Twilio transport error: {e}")
+
+    if response.status_code >= 400:
+        retry_after = response.headers.get("Retry-After")
+        raise OutboundError(
+            f"Twilio returned {response.status_code}: {response.text[:200]}",
+            status_code=response.status_code,
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+    return response.json()
+
+
+class OutboundDispatcher:
+    """
+    Outbound WhatsApp queue running on the worker event loop.
+
+    Messages are queued per conversation ("lane") and each lane is drained in
+    order, so retries never reorder replies to the same lead, while different
+    conversations are sent concurrently. Every send waits on the account and
+    sender-number token buckets, kept in Redis so the caps hold across all
+    worker processes and hosts.
+    """
+
+    def __init__(
+        self,
+        account_rate: float = None,
+        number_rate: float = None,
+        max_inflight: int = None,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_cap: float = None,
+        redis_client=None,
+    ):
+        self.account_rate = settings.TWILIO_ACCOUNT_MPS if account_rate is None else account_rate
+        self.number_rate = settings.TWILIO_NUMBER_MPS if number_rate is None else number_rate
+        self.max_inflight = settings.OUTBOUND_MAX_INFLIGHT if max_inflight is None else max_inflight
+        self.max_retries = settings.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = settings.OUTBOUND_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_cap = settings.OUTBOUND_BACKOFF_CAP if backoff_cap is None else backoff_cap
+        self._redis = redis_client
+        self._lanes: Dict[str, asyncio.Queue] = {}
+        self._lane_tasks: Dict[str, asyncio.Task] = {}
+        self._account_bucket: Optional[RedisTokenBucket] = None
+        self._number_buckets: Dict[str, RedisTokenBucket] = {}
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _ensure_started(self):
+        # Asyncio primitives must be created on the loop that uses them
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._account_bucket = RedisTokenBucket(
+                f"ratelimit:twilio:account:{settings.TWILIO_SID}", self.account_rate, redis_client=self._redis
+            )
+
+    def _number_bucket(self, number: str) -> RedisTokenBucket:
+        bucket = self._number_buckets.get(number)
+        if bucket is None:
+            bucket = self._number_buckets[number] = RedisTokenBucket(
+                f"ratelimit:twilio:number:{number}", self.number_rate, redis_client=self._redis
+            )
+        return bucket
+
+    async def enqueue(self, item: OutboundMessage):
+        """Append a message to its conversation lane (must run on the loop)."""
+        self._ensure_started()
+        lane = self._lanes.get(item.key)
+        if lane is None:
+            lane = self._lanes[item.key] = asyncio.Queue()
+        lane.put_nowait(item)
+        task = self._lane_tasks.get(item.key)
+        if task is None or task.done():
+            self._lane_tasks[item.key] = asyncio.get_running_loop().create_task(self._drain(item.key))
+
+    async def _drain(self, key: str):
+        lane = self._lanes[key]
+        try:
+            while not lane.empty():
+                item = lane.get_nowait()
+                try:
+                    result = await self._send_with_retries(item)
+                    if not item.future.done():
+                        item.future.set_result(result)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Giving up on message to {item.to} after {item.attempts} attempts: {e}")
+                    if not item.future.done():
+                        item.future.set_exception(e)
+        finally:
+            if lane.empty():
+                self._lanes.pop(key, None)
+                self._lane_tasks.pop(key, None)
+
+    async def _send_with_retries(self, item: OutboundMessage) -> dict:
+        from_number = settings.TWILIO_WHATSAPP
+        current_message_id.set(item.message_id)
+        while True:
+            item.attempts += 1
+            await self._account_bucket.acquire()
+            await self._number_bucket(from_number).acquire()
+            try:
+                async with self._inflight:
+                    result = await post_twilio_message(item.to, item.body, from_number)
+                self.sent += 1
+                return result
+            except OutboundError as e:
+                if not e.retryable or item.attempts > self.max_retries:
+                    raise
+                # Full jitter, but never sooner than Twilio asked for
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (item.attempts - 1)))
+                if e.retry_after:
+                    delay = max(delay, e.retry_after)
+                self.retried += 1
+                logger.warning(f"Retrying message to {item.to} in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def submit(self, loop: asyncio.AbstractEventLoop, to: str, body: str, key: Optional[str] = None) -> Future:
+        """
+        Queue a message from synchronous code without waiting for delivery.
+
+        Args:
+            loop: Event loop running the dispatcher
+            to: Recipient number
+            body: Message text
+            key: Ordering key, normally the conversation id (defaults to ``to``)
+
+        Returns:
+            Future resolved with the Twilio message resource
+        """
+        item = OutboundMessage(
+            to=to, body=body, key=str(key if key is not None else to), message_id=current_message_id.get()
+        )
+        asyncio.run_coroutine_threadsafe(self.enqueue(item), loop)
+        return item.future
+
+    async def send(self, to: str, body: str, key: Optional[str] = None) -> Future:
+        """
+        Queue a message from a coroutine running on the dispatcher's loop.
+
+        Args:
+            to: Recipient number
+            body: Message text
+            key: Ordering key, normally the conversation id (defaults to ``to``)
+
+        Returns:
+            Future resolved with the Twilio message resource
+        """
+        item = OutboundMessage(
+            to=to, body=body, key=str(key if key is not None else to), message_id=current_message_id.get()
+        )
+        await self.enqueue(item)
+        return item.future
+
+    async def flush(self):
+        """Wait until every queued message was sent or given up."""
+        while self._lane_tasks:
+            await asyncio.gather(*list(self._lane_tasks.values()), return_exceptions=True)
+
+
+dispatcher = OutboundDispatcher()
@@ -0,0 +1,377 @@
+import argparse
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+from config import settings
+import database
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME_RE = re.compile(r"^messages_p(\d{4})(\d{2})$")
+
+# DDL on the parent queues behind open transactions and every insert then
+# queues behind the DDL; give up quickly and retry on the next run instead.
+DDL_LOCK_TIMEOUT = "5s"
+
+# Databases created before partitioning have a plain ``messages`` table,
+# which create_all never converts. migrate_messages_to_partitions moves it
+# over while the app keeps running (``python -m services.partitions
+# migrate``):
+#
+#   1. build messages_new, partitioned by month over the existing data
+#   2. copy rows in id-ordered batches, one transaction each (resumable)
+#   3. catch up on rows committed out of id order and on messages deleted
+#      by archiving meanwhile, first without locks, then under a short
+#      ACCESS EXCLUSIVE lock that swaps the table names
+#
+# The old table is kept as messages_legacy; drop it once checked.
+MIGRATION_TABLE = "messages_new"
+LEGACY_TABLE = "messages_legacy"
+# Rows can commit with a lower id than rows already copied (concurrent
+# inserts) or with the webhook's receive time (batched ingest); catch-up
+# rescans this far back from when copying started.
+MIGRATION_CATCH_UP_MARGIN = timedelta(hours=1)
+
+
+def _month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Name of the ``messages`` partition holding ``month``."""
+    return f"messages_p{month:%Y%m}"
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    """Names of the tables currently attached to ``messages``."""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass('messages')
+        ORDER BY child.relname
+    """))
+    return [name for (name,) in rows]
+
+
+def _create_partition(conn: Connection, name: str, start: date, end: date):
+    # Built detached and attached afterwards so rows that landed in the
+    # default partition for this month can be moved in first; ATTACH
+    # rejects a range the default partition still has rows for.
+    conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS)"))
+    moved = conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM messages_default
+            WHERE timestamp >= :start AND timestamp < :end
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), {"start": start, "end": end}).rowcount
+    conn.execute(text(
+        f"ALTER TABLE messages ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if moved:
+        logger.warning(f"Moved {moved} messages from messages_default into {name}")
+
+
+def ensure_message_partitions(
+    engine: Optional[Engine] = None, months_ahead: int = None, today: Optional[date] = None
+) -> List[str]:
+    """
+    Create the monthly ``messages`` partitions that do not exist yet.
+
+    Covers the current month and ``months_ahead`` following ones, so inserts
+    never have to fall back to the default partition. A no-op on databases
+    other than Postgres and on an unpartitioned legacy table (see
+    migrate_messages_to_partitions).
+
+    Args:
+        engine: Engine to use (defaults to database.engine)
+        months_ahead: Future months to prepare (defaults to settings.MESSAGE_PARTITIONS_AHEAD)
+        today: Reference date (defaults to today, UTC)
+
+    Returns:
+        Names of the partitions created
+    """
+    engine = engine or database.engine
+    if engine.dialect.name != "postgresql":
+        return []
+    months_ahead = settings.MESSAGE_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    current = _month_start(today or datetime.utcnow().date())
+
+    with engine.connect() as conn:
+        if not _is_partitioned(conn):
+            logger.warning(
+                "messages is not partitioned yet; run `python -m services.partitions migrate` to convert it"
+            )
+            return []
+        existing = set(list_partitions(conn))
+
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _add_months(current, offset)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        # One transaction per partition keeps the parent locked briefly
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+                _create_partition(conn, name, start, _add_months(start, 1))
+        except OperationalError as e:
+            logger.warning(f"Could not create message partition {name}, will retry: {e}")
+            continue
+        created.append(name)
+        logger.info(f"Created message partition {name}")
+    return created
+
+
+def drop_empty_partitions(engine: Optional[Engine] = None, today: Optional[date] = None) -> List[str]:
+    """
+    Drop past monthly partitions that no longer hold any message.
+
+    Archiving removes the messages of old conversations, which eventually
+    empties whole months; dropping them is cheaper than vacuuming. The
+    current month and partitions that still have rows are kept.
+
+    Returns:
+        Names of the partitions dropped
+    """
+    engine = engine or database.engine
+    if engine.dialect.name != "postgresql":
+        return []
+    current = _month_start(today or datetime.utcnow().date())
+
+    dropped = []
+    with engine.connect() as conn:
+        if not _is_partitioned(conn):
+            return []
+        names = list_partitions(conn)
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if not match or date(int(match.group(1)), int(match.group(2)), 1) >= current:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+                if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+                    continue
+                conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+        except OperationalError as e:
+            logger.warning(f"Could not drop message partition {name}, will retry: {e}")
+            continue
+        dropped.append(name)
+        logger.info(f"Dropped empty message partition {name}")
+    return dropped
+
+
+def _table_exists(conn: Connection, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def _index_names(conn: Connection, table: str) -> List[str]:
+    rows = conn.execute(text("""
+        SELECT index_class.relname
+        FROM pg_index
+        JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+        WHERE pg_index.indrelid = to_regclass(:table)
+    """), {"table": table})
+    return [name for (name,) in rows]
+
+
+def _create_migration_table(conn: Connection, months_ahead: int, today: date) -> datetime:
+    from models import Message
+
+    started_at = conn.execute(text("SELECT timezone('UTC', now())")).scalar()
+    oldest = conn.execute(text("SELECT min(timestamp) FROM messages")).scalar()
+    first = _month_start((oldest or started_at).date())
+    last = _add_months(_month_start(today), months_ahead)
+
+    conn.execute(text(
+        f"CREATE TABLE {MIGRATION_TABLE} (LIKE messages INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+    ))
+    conn.execute(text(f"ALTER TABLE {MIGRATION_TABLE} ADD CONSTRAINT {MIGRATION_TABLE}_pkey PRIMARY KEY (id, timestamp)"))
+    for index in Message.__table__.indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        conn.execute(text(f"CREATE INDEX {index.name}_new ON {MIGRATION_TABLE} ({columns})"))
+    month = first
+    while month <= last:
+        end = _add_months(month, 1)
+        conn.execute(text(
+            f"CREATE TABLE {partition_name(month)} PARTITION OF {MIGRATION_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        month = end
+    conn.execute(text(f"CREATE TABLE messages_default PARTITION OF {MIGRATION_TABLE} DEFAULT"))
+    # Survives an interrupted run, so a resumed copy catches up from the start
+    conn.execute(text(f"COMMENT ON TABLE {MIGRATION_TABLE} IS '{started_at.isoformat()}'"))
+    logger.info(f"Created {MIGRATION_TABLE} with monthly partitions {first:%Y-%m}..{last:%Y-%m}")
+    return started_at
+
+
+def _copy_batch(conn: Connection, after_id: int, batch_size: int) -> Optional[int]:
+    return conn.execute(text(f"""
+        WITH copied AS (
+            INSERT INTO {MIGRATION_TABLE}
+            SELECT * FROM messages WHERE id > :after ORDER BY id LIMIT :limit
+            RETURNING id
+        )
+        SELECT max(id) FROM copied
+    """), {"after": after_id, "limit": batch_size}).scalar()
+
+
+def _catch_up(conn: Connection, since: datetime) -> int:
+    """Copy rows added since ``since`` that are missing and drop rows archived since."""
+    copied = conn.execute(text(f"""
+        INSERT INTO {MIGRATION_TABLE}
+        SELECT * FROM messages old
+        WHERE old.timestamp >= :since
+          AND NOT EXISTS (
+              SELECT 1 FROM {MIGRATION_TABLE} new WHERE new.id = old.id AND new.timestamp = old.timestamp
+          )
+    """), {"since": since}).rowcount
+    if not _table_exists(conn, "conversation_archives"):
+        return copied
+    # Archiving deletes every message of the conversations it records
+    removed = conn.execute(text(f"""
+        DELETE FROM {MIGRATION_TABLE} new
+        USING conversation_archives archive
+        WHERE new.conversation_id = archive.conversation_id AND archive.archived_at >= :since
+    """), {"since": since}).rowcount
+    return copied + removed
+
+
+def _swap_tables(conn: Connection):
+    conn.execute(text("ALTER TABLE messages ALTER COLUMN id DROP DEFAULT"))
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('messages', 'id')")).scalar()
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {MIGRATION_TABLE}.id"))
+    for name in _index_names(conn, "messages"):
+        conn.execute(text(f"ALTER INDEX {name} RENAME TO {name}_legacy"))
+    fkey = conn.execute(text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = 'messages'::regclass AND contype = 'f'
+    """)).scalars().all()
+    for name in fkey:
+        conn.execute(text(f"ALTER TABLE messages RENAME CONSTRAINT {name} TO {name}_legacy"))
+    conn.execute(text(f"ALTER TABLE messages RENAME TO {LEGACY_TABLE}"))
+    conn.execute(text(f"ALTER TABLE {MIGRATION_TABLE} RENAME TO messages"))
+    conn.execute(text(f"ALTER INDEX {MIGRATION_TABLE}_pkey RENAME TO messages_pkey"))
+    for name in _index_names(conn, "messages"):
+        if name.endswith("_new"):
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {name[:-len('_new')]}"))
+    conn.execute(text("COMMENT ON TABLE messages IS NULL"))
+
+
+def migrate_messages_to_partitions(
+    engine: Optional[Engine] = None, batch_size: int = 10000, months_ahead: int = None, today: Optional[date] = None
+) -> bool:
+    """
+    Convert an unpartitioned ``messages`` table into the monthly partitioned layout.
+
+    Runs online: inserts keep going to the old table during the copy and
+    are only blocked while the names are swapped. Safe to interrupt and run
+    again; it resumes after the last copied id. Archiving may keep running.
+
+    Args:
+        engine: Engine to use (defaults to database.engine)
+        batch_size: Rows copied per transaction
+        months_ahead: Future months to prepare (defaults to settings.MESSAGE_PARTITIONS_AHEAD)
+        today: Reference date (defaults to today, UTC)
+
+    Returns:
+        True if the table was converted, False if it already was partitioned
+
+    Raises:
+        OperationalError: The swap could not take its lock within
+            DDL_LOCK_TIMEOUT; run it again
+    """
+    engine = engine or database.engine
+    if engine.dialect.name != "postgresql":
+        return False
+    months_ahead = settings.MESSAGE_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    today = today or datetime.utcnow().date()
+
+    with engine.begin() as conn:
+        if _is_partitioned(conn):
+            logger.info("messages is already partitioned")
+            return False
+        if _table_exists(conn, MIGRATION_TABLE):
+            comment = conn.execute(text(f"SELECT obj_description(to_regclass('{MIGRATION_TABLE}'), 'pg_class')")).scalar()
+            started_at = datetime.fromisoformat(comment)
+        else:
+            started_at = _create_migration_table(conn, months_ahead, today)
+        last_id = conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {MIGRATION_TABLE}")).scalar()
+
+    copied = 0
+    while True:
+        with engine.begin() as conn:
+            batch_last = _copy_batch(conn, last_id, batch_size)
+        if batch_last is None:
+            break
+        copied += 1
+        last_id = batch_last
+        if copied % 100 == 0:
+            logger.info(f"Copied messages up to id {last_id}")
+
+    # Constraint checks scan the table: outside the lock
+    with engine.begin() as conn:
+        fkeys = conn.execute(text(
+            f"SELECT count(*) FROM pg_constraint WHERE conrelid = '{MIGRATION_TABLE}'::regclass AND contype = 'f'"
+        )).scalar()
+        if not fkeys:
+            conn.execute(text(
+                f"ALTER TABLE {MIGRATION_TABLE} ADD CONSTRAINT messages_conversation_id_fkey "
+                f"FOREIGN KEY (conversation_id) REFERENCES conversations (id)"
+            ))
+
+    with engine.begin() as conn:
+        checked_at = conn.execute(text("SELECT timezone('UTC', now())")).scalar()
+        changed = _catch_up(conn, started_at - MIGRATION_CATCH_UP_MARGIN)
+    logger.info(f"Caught up {changed} rows changed while copying")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+        conn.execute(text("LOCK TABLE messages IN ACCESS EXCLUSIVE MODE"))
+        _catch_up(conn, checked_at - MIGRATION_CATCH_UP_MARGIN)
+        _swap_tables(conn)
+    logger.info(f"messages is now partitioned by month; the old table was kept as {LEGACY_TABLE}")
+    return True
+
+
+def main():
+    """Partition maintenance from the command line: ``python -m services.partitions migrate``."""
+    parser = argparse.ArgumentParser(description="Manage the monthly partitions of the messages table")
+    parser.add_argument("command", choices=["migrate", "ensure"])
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows copied per transaction (migrate)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.command == "migrate":
+        # messages_new copies the columns of messages: add the missing ones first
+        from services.schema import upgrade_schema
+        upgrade_schema()
+        migrate_messages_to_partitions(batch_size=args.batch_size)
+    else:
+        ensure_message_partitions()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import logging
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import AddConstraint
+from core.availability import DEFAULT_RESOURCE
+import database
+from models import Appointment, Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+# create_all only creates missing tables; it never adds a column or a
+# constraint to a table that already exists. Databases created before one
+# was introduced are brought up to date by the steps below, which run at
+# startup right after create_all (or by hand: ``python -m services.schema``).
+# Every step checks the catalog first, so running them again is a no-op.
+
+# ALTER TABLE waits for an ACCESS EXCLUSIVE lock and every query on the
+# table then waits behind it; give up quickly and retry on the next run.
+DDL_LOCK_TIMEOUT = "5s"
+
+# Active appointments that already overlap on a resource; the exclusion
+# constraint cannot be built while any are left
+OVERLAPPING_APPOINTMENTS_SQL = """
+    SELECT a.id, b.id
+    FROM appointments a
+    JOIN appointments b
+      ON b.resource = a.resource AND b.id > a.id
+     AND b.start_at < a.end_at AND a.start_at < b.end_at
+    WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+      AND a.start_at < a.end_at AND b.start_at < b.end_at
+    LIMIT 20
+"""
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> bool:
+    """Add ``column`` to ``table`` unless it is there already; True if added."""
+    if not inspect(conn).has_table(table) or _has_column(conn, table, column):
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def _has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(i["name"] == name for i in inspect(conn).get_indexes(table))
+
+
+def _create_index(conn: Connection, table, name: str) -> bool:
+    """Create the model index ``name`` of ``table`` unless it exists; True if created."""
+    if _has_index(conn, table.name, name):
+        return False
+    next(i for i in table.indexes if i.name == name).create(conn)
+    return True
+
+
+def _conversation_slot_state(conn: Connection) -> bool:
+    """conversations.slot_state: slots collected so far (core.conversation_state)."""
+    return _add_column(conn, "conversations", "slot_state", "JSON")
+
+
+def _message_sid(conn: Connection) -> bool:
+    """
+    messages.message_sid: Twilio MessageSid of inbound messages.
+
+    Nullable: older rows and bot messages have none, and webhook retries
+    are deduplicated through the message_sids table (created by create_all),
+    so nothing needs backfilling.
+    """
+    return _add_column(conn, "messages", "message_sid", "VARCHAR(64) NULL")
+
+
+def _appointment_resource(conn: Connection) -> bool:
+    """
+    appointments.resource: professional/room booked (core.availability).
+
+    Existing appointments go to the default resource; a constant default is
+    a catalog-only change on Postgres, so the table is not rewritten.
+    """
+    added = _add_column(conn, "appointments", "resource", f"VARCHAR NOT NULL DEFAULT '{DEFAULT_RESOURCE}'")
+    if added:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_appointments_resource ON appointments (resource)"))
+    return added
+
+
+def _appointment_overlap_guard(conn: Connection) -> bool:
+    """
+    appointments_no_overlap: no two active appointments may overlap on a resource.
+
+    Postgres only. Appointments that already overlap would make the
+    constraint fail to build; they are logged for someone to resolve and the
+    step is retried on the next run.
+    """
+    if conn.dialect.name != "postgresql":
+        return False
+    constraint = next(c for c in Appointment.__table__.constraints if c.name == "appointments_no_overlap")
+    if conn.execute(text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": constraint.name}).scalar():
+        return False
+    overlapping = conn.execute(text(OVERLAPPING_APPOINTMENTS_SQL)).all()
+    if overlapping:
+        pairs = ", ".join(f"{a}/{b}" for a, b in overlapping)
+        logger.error(
+            f"Cannot add {constraint.name}: active appointments overlap ({pairs}); "
+            f"cancel or move them and run `python -m services.schema`"
+        )
+        return False
+    # btree_gist provides the "=" operator class for resource
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    conn.execute(AddConstraint(constraint))
+    return True
+
+
+def _one_open_conversation_per_lead(conn: Connection) -> bool:
+    """
+    uq_conversations_lead_open: at most one open conversation per lead.
+
+    It is the arbiter of the ingest upsert (``ON CONFLICT (lead_id) WHERE
+    status = 'open'``). Leads with several open conversations keep the
+    newest one open; the others are closed first so the index can be built.
+    """
+    if _has_index(conn, "conversations", "uq_conversations_lead_open"):
+        return False
+    closed = conn.execute(text("""
+        UPDATE conversations SET status = 'closed'
+        WHERE status = 'open' AND id NOT IN (
+            SELECT max(id) FROM conversations WHERE status = 'open' GROUP BY lead_id
+        )
+    """)).rowcount
+    if closed:
+        logger.warning(f"Closed {closed} extra open conversations before adding uq_conversations_lead_open")
+    return _create_index(conn, Conversation.__table__, "uq_conversations_lead_open")
+
+
+def _keyset_indexes(conn: Connection) -> bool:
+    """Indexes matching the keyset order of the dashboard listings (controllers.dashboard)."""
+    conversations = _create_index(conn, Conversation.__table__, "ix_conversations_status_last_message_at")
+    messages = _create_index(conn, Message.__table__, "ix_messages_conversation_timestamp")
+    return conversations or messages
+
+
+# (name, step) in the order they were introduced; a step returns True when
+# it changed the schema
+UPGRADES: List[Tuple[str, Callable[[Connection], bool]]] = [
+    ("conversations.slot_state", _conversation_slot_state),
+    ("messages.message_sid", _message_sid),
+    ("appointments.resource", _appointment_resource),
+    ("appointments_no_overlap", _appointment_overlap_guard),
+    ("uq_conversations_lead_open", _one_open_conversation_per_lead),
+    ("dashboard keyset indexes", _keyset_indexes),
+]
+
+
+def upgrade_schema(engine: Optional[Engine] = None) -> List[str]:
+    """
+    Apply the schema upgrades an existing database is missing.
+
+    Each step runs in its own transaction; a step that fails (e.g. on the
+    lock timeout) is logged and retried on the next run without blocking
+    the others.
+
+    Args:
+        engine: Engine to use (defaults to database.engine)
+
+    Returns:
+        Names of the upgrades applied
+    """
+    engine = engine or database.engine
+    applied = []
+    for name, step in UPGRADES:
+        try:
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{DDL_LOCK_TIMEOUT}'"))
+                changed = step(conn)
+        except SQLAlchemyError as e:
+            logger.error(f"Schema upgrade {name} failed, will retry on the next run: {e}")
+            continue
+        if changed:
+            applied.append(name)
+            logger.info(f"Applied schema upgrade {name}")
+    return applied
+
+
+def main():
+    """Apply pending schema upgrades: ``python -m services.schema``."""
+    argparse.ArgumentParser(description="Bring an existing database schema up to date").parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    applied = upgrade_schema()
+    logger.info(f"Applied {len(applied)} schema upgrades" if applied else "Schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
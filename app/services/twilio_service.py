@@ -1,11 +1,48 @@
-from twilio.rest import Client
-from config import settings
+import logging
+from concurrent.futures import Future
+from typing import Optional
+from services.outbound import dispatcher
+from workers.event_loop import get_loop, run_async
 
-client = Client(settings.TWILIO_SID, settings.TWILIO_TOKEN)
+logger = logging.getLogger(__name__)
 
-def send_whatsapp(to, message):
-    client.messages.create(
-        from_=f"whatsapp:{settings.TWILIO_WHATSAPP}",
-        body=message,
-        to=to
-    )
+
+def send_whatsapp(to, message, conversation_id: Optional[int] = None) -> Future:
+    """
+    Queue a WhatsApp message for asynchronous delivery.
+
+    The call returns immediately; delivery, rate limiting and retries happen
+    on the worker event loop. Messages sharing a ``conversation_id`` are
+    delivered in the order they were queued.
+
+    Args:
+        to: Recipient phone number
+        message: Message text
+        conversation_id: Ordering key for the reply (defaults to the number)
+
+    Returns:
+        Future resolved with the Twilio message resource
+    """
+    future = dispatcher.submit(get_loop(), to, message, key=conversation_id)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+async def send_whatsapp_async(to, message, conversation_id: Optional[int] = None) -> Future:
+    """
+    ``send_whatsapp`` for coroutines already running on the event loop
+    (the asyncio worker runtime), where the dispatcher lives on that loop.
+    """
+    future = await dispatcher.send(to, message, key=conversation_id)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future: Future):
+    if future.exception() is not None:
+        logger.error(f"WhatsApp delivery failed: {future.exception()}")
+
+
+def flush_outbound(timeout: float = 30.0):
+    """Block until queued outbound messages are delivered (used on shutdown)."""
+    run_async(dispatcher.flush(), timeout=timeout)
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+
+# Modules import each other flat from app/, and settings are read at import
+# time: point the app at a throwaway SQLite file before anything imports it
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+_DB_FILE = os.path.join(tempfile.mkdtemp(prefix="atendente-tests-"), "test.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB_FILE}")
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def redis_server():
+    """Shared clients (core.redis_client) backed by a fresh fakeredis server."""
+    from core.redis_client import set_redis
+    server = fakeredis.FakeServer()
+    set_redis(
+        sync_client=fakeredis.FakeRedis(server=server, decode_responses=True),
+        async_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True),
+    )
+    yield server
+    set_redis()
+
+
+@pytest.fixture
+def redis_client(redis_server):
+    from core.redis_client import get_redis
+    return get_redis()
+
+
+@pytest.fixture
+def db():
+    """Session on an empty SQLite schema."""
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401  (registers the tables)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from controllers import appointments
+from core.availability import AvailabilityEngine
+from database import get_db
+from models import Lead
+
+
+@pytest.fixture
+def index(monkeypatch, redis_server):
+    engine = AvailabilityEngine(resources=["ana"])
+    monkeypatch.setattr(appointments, "availability", engine)
+    return engine
+
+
+@pytest.fixture
+def client(db, index):
+    db.add(Lead(id=1, phone="+5511999990000"))
+    db.commit()
+    app = FastAPI()
+    app.include_router(appointments.router, prefix="/appointments")
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def _row(hour, status):
+    return {
+        "lead_id": 1,
+        "service": "corte",
+        "resource": "ana",
+        "start_at": f"2030-01-07T{hour:02d}:00:00",
+        "end_at": f"2030-01-07T{hour + 1:02d}:00:00",
+        "status": status,
+    }
+
+
+def test_bulk_import_keeps_cancelled_rows_out_of_the_index(client, index):
+    response = client.post("/appointments/bulk", json=[_row(10, "confirmed"), _row(14, "cancelled")])
+
+    assert response.json() == {"received": 2, "inserted": 2, "skipped_overlaps": 0}
+    assert index.find_resource(datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 11)) is None
+    assert index.find_resource(datetime(2030, 1, 7, 14), datetime(2030, 1, 7, 15)) == "ana"
@@ -0,0 +1,116 @@
+import asyncio
+import inspect
+import json
+import time
+
+from services.ingest import PROCESS_MESSAGE_TOPIC
+from workers import async_worker
+from workers.async_worker import AsyncWorker
+
+
+def _entry(message_id, ready_at, attempts=0):
+    return {
+        "topic": PROCESS_MESSAGE_TOPIC,
+        "payload": json.dumps({"conversation_id": 10, "message_id": message_id}),
+        "ready_at": repr(ready_at),
+        "attempts": attempts,
+    }
+
+
+def _worker(monkeypatch, process):
+    async def no_clients():
+        pass
+
+    monkeypatch.setattr(async_worker, "_close_clients", no_clients)
+    worker = AsyncWorker(concurrency=4, promote_interval=0.05, shutdown_timeout=1, consumer="test")
+    worker.process = process
+    return worker
+
+
+async def _until(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        met = condition()
+        if inspect.isawaitable(met):
+            met = await met
+        if met:
+            return
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_entry_not_due_waits_in_the_delayed_set(monkeypatch, redis_server):
+    done = {}
+
+    async def process(conversation_id, message_id, ready_at=None, attempts=0):
+        done[message_id] = time.time()
+
+    worker = _worker(monkeypatch, process)
+
+    async def scenario():
+        redis = worker.redis
+        run = asyncio.create_task(worker.run())
+        ready_at = time.time() + 0.5
+        await redis.xadd(worker.stream, _entry(1, ready_at))
+        await _until(lambda: redis.zcard(worker.delayed))
+        await asyncio.sleep(0.1)
+        # Parked, not in flight and not pending in the consumer group
+        parked = await redis.zcard(worker.delayed)
+        pending = (await redis.xpending(worker.stream, worker.group))["pending"]
+        in_flight = len(worker._tasks)
+        await _until(lambda: 1 in done)
+        worker.stop()
+        await run
+        return ready_at, parked, pending, in_flight, await redis.zcard(worker.delayed)
+
+    ready_at, parked, pending, in_flight, left = asyncio.run(scenario())
+    assert (parked, pending, in_flight) == (1, 0, 0)
+    assert done[1] >= ready_at
+    assert left == 0
+    assert worker.processed == 1
+
+
+def test_failed_turn_is_retried_after_the_backoff(monkeypatch, redis_server):
+    async def process(conversation_id, message_id, ready_at=None, attempts=0):
+        raise RuntimeError("database is down")
+
+    worker = _worker(monkeypatch, process)
+
+    async def scenario():
+        redis = worker.redis
+        run = asyncio.create_task(worker.run())
+        await redis.xadd(worker.stream, _entry(1, time.time()))
+        await _until(lambda: redis.zcard(worker.delayed))
+        worker.stop()
+        await run
+        delayed = await redis.zrange(worker.delayed, 0, -1, withscores=True)
+        return delayed, (await redis.xpending(worker.stream, worker.group))["pending"]
+
+    started = time.time()
+    delayed, pending = asyncio.run(scenario())
+    assert pending == 0
+    [(member, score)] = delayed
+    fields = json.loads(member)
+    assert fields["attempts"] == "1"
+    assert started + 60 <= score <= time.time() + 60
+    assert float(fields["ready_at"]) == score
+
+
+def test_due_entries_are_promoted_once(monkeypatch, redis_server):
+    worker = _worker(monkeypatch, None)
+
+    async def scenario():
+        redis = worker.redis
+        worker._promote = redis.register_script(async_worker.PROMOTE_SCRIPT)
+        now = time.time()
+        await redis.zadd(worker.delayed, {
+            json.dumps({"topic": PROCESS_MESSAGE_TOPIC, "ready_at": repr(now - 1)}): now - 1,
+            json.dumps({"topic": PROCESS_MESSAGE_TOPIC, "ready_at": repr(now + 60)}): now + 60,
+        })
+        moved = await asyncio.gather(worker._promote_due(), worker._promote_due())
+        return moved, await redis.xrange(worker.stream), await redis.zcard(worker.delayed)
+
+    moved, entries, left = asyncio.run(scenario())
+    assert sorted(moved) == [0, 1]
+    assert [fields["topic"] for _, fields in entries] == [PROCESS_MESSAGE_TOPIC]
+    assert left == 1
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+from config import settings
+from core.availability import AvailabilityEngine
+
+MONDAY = datetime(2025, 1, 6)
+
+
+def _engine():
+    return AvailabilityEngine(
+        resources=["ana"],
+        open_time="09:00",
+        close_time="18:00",
+        business_days=[0, 1, 2, 3, 4],
+        step_minutes=30,
+        horizon_days=7,
+        service_durations={"corte": 60},
+    )
+
+
+def _starts(slots):
+    return [start.strftime("%a %H:%M") for start, _ in slots]
+
+
+def test_slots_before_the_preferred_time_are_offered_too():
+    engine = _engine()
+    engine.add(1, "ana", datetime(2025, 1, 7, 13, 0), datetime(2025, 1, 7, 18, 0))
+
+    slots = engine.next_free_slots("corte", datetime(2025, 1, 7, 14, 0), count=3, not_before=MONDAY)
+
+    # Nearest first: 12:00 ends when the booking starts, the next free day is further away
+    assert _starts(slots) == ["Tue 12:00", "Tue 11:30", "Tue 11:00"]
+
+
+def test_backward_search_skips_busy_blocks_and_closed_days():
+    engine = _engine()
+    engine.add(1, "ana", datetime(2025, 1, 13, 9, 0), datetime(2025, 1, 13, 18, 0))
+    engine.add(2, "ana", datetime(2025, 1, 14, 9, 0), datetime(2025, 1, 14, 18, 0))
+    engine.add(3, "ana", datetime(2025, 1, 15, 9, 0), datetime(2025, 1, 15, 18, 0))
+
+    slots = engine.next_free_slots("corte", datetime(2025, 1, 13, 12, 0), count=2, not_before=MONDAY)
+
+    # Monday to Wednesday are full and the weekend is closed: the Friday before is nearer than Thursday
+    assert _starts(slots) == ["Fri 17:00", "Fri 16:30"]
+
+
+def test_never_offers_slots_before_not_before():
+    engine = _engine()
+
+    slots = engine.next_free_slots("corte", MONDAY, count=2, not_before=datetime(2025, 1, 6, 16, 10))
+
+    assert _starts(slots) == ["Mon 16:30", "Mon 17:00"]
+
+
+def test_late_search_rolls_over_to_the_next_opening():
+    engine = _engine()
+    late = datetime(2025, 1, 6, 23, 43)
+
+    slots = engine.next_free_slots("corte", late, count=1, not_before=late)
+
+    assert _starts(slots) == ["Tue 09:00"]
+
+
+class _Sessions:
+    """db_factory counting the full rebuilds."""
+
+    def __init__(self):
+        self.opened = 0
+
+    def __call__(self):
+        from database import SessionLocal
+        self.opened += 1
+        return SessionLocal()
+
+
+def test_bookings_and_cancellations_reach_other_processes_without_a_rebuild(db, redis_server):
+    here, there = _engine(), _engine()
+    sessions = _Sessions()
+    here.ensure_fresh(sessions)
+    there.ensure_fresh(sessions)
+    start, end = datetime(2025, 1, 7, 10, 0), datetime(2025, 1, 7, 11, 0)
+
+    here.book(1, "ana", start, end)
+    there.ensure_fresh(sessions)
+    assert there.find_resource(start, end) is None
+
+    here.release(1)
+    there.ensure_fresh(sessions)
+    assert there.find_resource(start, end) == "ana"
+    assert sessions.opened == 2
+
+
+def test_index_is_rebuilt_periodically_when_redis_is_down(db):
+    from redis.exceptions import ConnectionError
+
+    class DownRedis:
+        def __getattr__(self, name):
+            raise ConnectionError("Redis unavailable")
+
+    engine = AvailabilityEngine(resources=["ana"], redis_client=DownRedis())
+    sessions = _Sessions()
+    engine.ensure_fresh(sessions)
+    engine.ensure_fresh(sessions)
+    assert sessions.opened == 1
+
+    engine.loaded_at -= settings.SCHEDULE_REFRESH_SECONDS
+    engine.ensure_fresh(sessions)
+    assert sessions.opened == 2
@@ -0,0 +1,58 @@
+from concurrent.futures import Future
+
+from models import BatchCheckpoint, MessageExtraction
+from services.batch_extraction import Chunk, _finish_chunk, save_extractions
+
+RESULT = {"service": "corte", "date": "2026-10-20", "time": "15:00", "missing_slots": [], "confidence": 90}
+
+
+def _checkpoint(db):
+    checkpoint = BatchCheckpoint(
+        job="job", prompt="extract_batch-v1", last_message_id=0, until_message_id=100, processed=0, failed=0
+    )
+    db.add(checkpoint)
+    db.commit()
+    return checkpoint
+
+
+def _chunk(*message_ids):
+    chunk = Chunk()
+    for message_id in message_ids:
+        chunk.items.append({"id": message_id, "text": "oi"})
+        chunk.conversations[message_id] = 1
+    return chunk
+
+
+def _done(results):
+    future = Future()
+    future.set_result(results)
+    return future
+
+
+def test_save_extractions_ignores_unknown_ids(db):
+    save_extractions(db, "extract_batch-v1", {1: 1, 2: 1}, {2: RESULT, 99: RESULT})
+    db.commit()
+    assert [e.message_id for e in db.query(MessageExtraction).all()] == [2]
+
+
+def test_chunk_with_only_unknown_ids_still_advances(db):
+    checkpoint = _checkpoint(db)
+
+    _finish_chunk(db, checkpoint, _chunk(1, 2, 3), _done({98: RESULT, 99: RESULT}))
+
+    db.refresh(checkpoint)
+    assert checkpoint.last_message_id == 3
+    assert checkpoint.processed == 0
+    assert checkpoint.failed == 3
+    assert db.query(MessageExtraction).count() == 0
+
+
+def test_chunk_results_are_upserted(db):
+    checkpoint = _checkpoint(db)
+
+    _finish_chunk(db, checkpoint, _chunk(1, 2), _done({1: RESULT}))
+    _finish_chunk(db, checkpoint, _chunk(3), _done({3: RESULT, 1: {**RESULT, "service": "barba"}}))
+
+    db.refresh(checkpoint)
+    assert (checkpoint.last_message_id, checkpoint.processed, checkpoint.failed) == (3, 2, 1)
+    assert {e.message_id: e.result["service"] for e in db.query(MessageExtraction).all()} == {1: "corte", 3: "corte"}
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from core.cache import ExtractionCache, TTLCache
+from core.redis_client import get_async_redis
+
+RESULT = {"service": "corte", "date": "2026-10-20", "time": "15:00", "missing_slots": [], "confidence": 90}
+
+
+def test_miss_then_l1_then_l2_hit(redis_server):
+    async def scenario():
+        cache = ExtractionCache(ttl=3600, l1_ttl=60)
+        key = cache.key("Quero um corte amanhã", "gpt-4o-mini", "extract-v4")
+        assert await cache.get(key) is None
+        await cache.set(key, RESULT)
+        assert await cache.get(key) == RESULT
+
+        # Another process: empty L1, same Redis
+        other = ExtractionCache(ttl=3600, l1_ttl=60)
+        assert await other.get(key) == RESULT
+        assert await other.get(key) == RESULT
+        return cache.stats(), other.stats()
+
+    first, second = asyncio.run(scenario())
+    assert (first["misses"], first["l1_hits"], first["l2_hits"]) == (1, 1, 0)
+    assert (second["misses"], second["l1_hits"], second["l2_hits"]) == (0, 1, 1)
+    assert second["hit_ratio"] == 1.0
+
+
+def test_keys_normalize_text_and_separate_prompt_versions():
+    cache = ExtractionCache(enabled=True)
+    assert cache.key("Quero um  CORTE", "m", "v4") == cache.key("quero um corte", "m", "v4")
+    assert cache.key("quero um corte", "m", "v4") != cache.key("quero um corte", "m", "v5")
+
+
+def test_entries_expire(redis_server):
+    async def scenario():
+        cache = ExtractionCache(ttl=120, l1_ttl=0.05)
+        key = cache.key("corte amanhã", "m", "v4")
+        await cache.set(key, RESULT)
+        redis_ttl = await get_async_redis().ttl(key)
+        await asyncio.sleep(0.1)
+        # L1 expired: served from Redis again
+        assert await cache.get(key) == RESULT
+        await get_async_redis().delete(key)
+        await asyncio.sleep(0.1)
+        assert await cache.get(key) is None
+        return redis_ttl, cache.stats()
+
+    redis_ttl, stats = asyncio.run(scenario())
+    assert 0 < redis_ttl <= 120
+    assert (stats["l2_hits"], stats["misses"]) == (1, 1)
+
+
+def test_low_confidence_and_errors_are_not_cached(redis_server):
+    async def scenario():
+        cache = ExtractionCache(min_confidence=70)
+        low = cache.key("talvez", "m", "v4")
+        failed = cache.key("erro", "m", "v4")
+        await cache.set(low, {**RESULT, "confidence": 40})
+        await cache.set(failed, {**RESULT, "error": "timeout"})
+        return await cache.get(low), await cache.get(failed), await get_async_redis().keys("nlu:*"), cache.stats()
+
+    low, failed, keys, stats = asyncio.run(scenario())
+    assert low is None and failed is None
+    assert keys == []
+    assert stats["bypassed"] == 2
+
+
+def test_cached_results_are_copies(redis_server):
+    async def scenario():
+        cache = ExtractionCache()
+        key = cache.key("corte", "m", "v4")
+        await cache.set(key, RESULT)
+        (await cache.get(key))["missing_slots"].append("time")
+        return await cache.get(key)
+
+    assert asyncio.run(scenario())["missing_slots"] == []
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
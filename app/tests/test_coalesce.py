@@ -0,0 +1,44 @@
+from core.coalesce import MessageCoalescer
+
+
+def test_burst_is_claimed_once_by_the_newest_message(redis_server):
+    coalescer = MessageCoalescer()
+    for message_id in (1, 2, 3):
+        coalescer.register(10, message_id)
+
+    assert coalescer.claim(10, 1) is None
+    assert coalescer.claim(10, 2) is None
+    assert coalescer.claim(10, 3) == [1, 2, 3]
+    # Redelivered task for the same message gets the same batch
+    assert coalescer.claim(10, 3) == [1, 2, 3]
+
+
+def test_out_of_order_registration_keeps_the_newest_id(redis_client):
+    coalescer = MessageCoalescer()
+    coalescer.register(10, 5)
+    coalescer.register(10, 4)  # finished after the newer message
+
+    assert redis_client.get("conv:10:latest") == "5"
+    assert coalescer.claim(10, 4) is None
+    assert coalescer.claim(10, 5) == [4, 5]
+
+
+def test_register_many_keeps_the_newest_id_per_conversation(redis_client):
+    coalescer = MessageCoalescer()
+    coalescer.register_many([(10, 7), (11, 8), (10, 6)])
+
+    assert redis_client.get("conv:10:latest") == "7"
+    assert redis_client.get("conv:11:latest") == "8"
+    assert coalescer.claim(10, 6) is None
+    assert coalescer.claim(10, 7) == [6, 7]
+    assert coalescer.claim(11, 8) == [8]
+
+
+def test_old_task_after_a_handled_batch_is_dropped(redis_server):
+    coalescer = MessageCoalescer()
+    coalescer.register(10, 1)
+    coalescer.register(10, 2)
+    assert coalescer.claim(10, 2) == [1, 2]
+
+    coalescer.register(10, 1)  # late duplicate registration
+    assert coalescer.claim(10, 1) is None
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from controllers import dashboard
+from database import get_db
+from models import Conversation, Lead
+
+
+@pytest.fixture
+def client(db):
+    app = FastAPI()
+    app.include_router(dashboard.router, prefix="/dashboard")
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+def _conversations(db, last_message_ats):
+    lead = Lead(phone="+5511999990000")
+    db.add(lead)
+    db.flush()
+    conversations = [
+        Conversation(lead_id=lead.id, status="closed", last_message_at=last_message_at)
+        for last_message_at in last_message_ats
+    ]
+    db.add_all(conversations)
+    db.flush()
+    # The column default fills in None on insert
+    undated = [c.id for c, at in zip(conversations, last_message_ats) if at is None]
+    db.execute(update(Conversation).where(Conversation.id.in_(undated)).values(last_message_at=None))
+    db.commit()
+
+
+def _pages(client, limit, **params):
+    ids, cursor = [], None
+    while True:
+        page = client.get("/dashboard/conversations", params={**params, "limit": limit, "cursor": cursor}).json()
+        ids.append([item["id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_conversations_without_activity_are_listed_last(client, db):
+    base = datetime(2025, 1, 6, 12, 0)
+    # ids 1..6: two NULLs mixed in and a tie on last_message_at
+    _conversations(db, [base, None, base + timedelta(hours=1), base, None, base - timedelta(hours=1)])
+
+    assert _pages(client, limit=2) == [[3, 4], [1, 6], [5, 2]]
+    assert _pages(client, limit=4) == [[3, 4, 1, 6], [5, 2]]
+    assert _pages(client, limit=10) == [[3, 4, 1, 6, 5, 2]]
+
+
+def test_time_filters_leave_out_conversations_without_activity(client, db):
+    base = datetime(2025, 1, 6, 12, 0)
+    _conversations(db, [base, None, base + timedelta(hours=1)])
+
+    assert _pages(client, limit=1, since=base.isoformat()) == [[3], [1]]
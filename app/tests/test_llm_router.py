@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from core.llm_router import CircuitBreaker, LLMUnavailableError, ProviderRouter
+from core.prompts import get_prompt
+
+RESULT = {"service": "corte", "date": "2026-10-20", "time": "15:00", "missing_slots": [], "confidence": 90}
+PROMPT = get_prompt("extract").render("quero um corte amanhã às 15h")
+
+
+class StubProvider:
+    """Provider call that answers after ``delay`` or raises while ``failing``."""
+
+    def __init__(self, delay: float = 0.0, failing: bool = False):
+        self.delay = delay
+        self.failing = failing
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, prompt, model):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.failing:
+            raise ConnectionError("provider down")
+        return {**RESULT, "model": model}
+
+
+def _router(providers, **options):
+    defaults = {
+        "hedge_enabled": False,
+        "breaker_failures": 2,
+        "breaker_error_rate": 1.0,
+        "breaker_cooldown": 0.05,
+        "hedge_min_samples": 1000,
+    }
+    return ProviderRouter(
+        providers, models={name: f"{name}-model" for name in providers}, **{**defaults, **options}
+    )
+
+
+def test_circuit_opens_half_opens_and_closes():
+    provider = StubProvider(failing=True)
+    router = _router({"primary": provider})
+    breaker = router.breakers["primary"]
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await router.complete(PROMPT, "oi")
+        assert breaker.state == "open"
+        with pytest.raises(LLMUnavailableError):
+            await router.complete(PROMPT, "oi")
+        assert provider.calls == 2  # no request while open
+
+        await asyncio.sleep(0.06)
+        provider.failing = False
+        return await router.complete(PROMPT, "oi")
+
+    assert asyncio.run(scenario())["service"] == "corte"
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    provider = StubProvider(failing=True)
+    router = _router({"primary": provider})
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await router.complete(PROMPT, "oi")
+        await asyncio.sleep(0.06)
+        with pytest.raises(ConnectionError):
+            await router.complete(PROMPT, "oi")
+
+    asyncio.run(scenario())
+    assert router.breakers["primary"].state == "open"
+    assert provider.calls == 3
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker("primary", failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.acquire()
+    assert breaker.state == "half_open"
+    assert not breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.acquire() and breaker.acquire()
+
+
+def test_open_circuit_fails_over_to_next_provider():
+    primary, backup = StubProvider(failing=True), StubProvider()
+    router = _router({"primary": primary, "backup": backup})
+
+    async def scenario():
+        return [await router.complete(PROMPT, "oi", preferred="primary") for _ in range(3)]
+
+    results = asyncio.run(scenario())
+    assert all(r["model"] == "backup-model" for r in results)
+    # Two failures opened the primary's circuit; the third call skipped it
+    assert primary.calls == 2
+    assert router.breakers["primary"].state == "open"
+
+
+def test_hedged_request_wins_and_loser_is_cancelled():
+    slow, fast = StubProvider(delay=2.0), StubProvider(delay=0.01)
+    router = _router(
+        {"slow": slow, "fast": fast}, hedge_enabled=True, hedge_default_delay=0.05, hedge_min_delay=0.0
+    )
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        result = await router.complete(PROMPT, "oi", preferred="slow")
+        elapsed = asyncio.get_running_loop().time() - started
+        await asyncio.sleep(0)  # let the cancellation reach the loser
+        return result, elapsed
+
+    result, elapsed = asyncio.run(scenario())
+    assert result["model"] == "fast-model"
+    assert elapsed < 0.5
+    assert slow.calls == fast.calls == 1
+    assert slow.cancelled == 1
+    # A cancelled call is neither a failure nor a held probe slot
+    assert router.breakers["slow"].state == "closed"
+    assert router.breakers["slow"].failures == 0
+
+
+def test_no_hedge_when_primary_answers_in_time():
+    primary, backup = StubProvider(delay=0.01), StubProvider()
+    router = _router({"primary": primary, "backup": backup}, hedge_enabled=True, hedge_default_delay=0.5)
+
+    result = asyncio.run(router.complete(PROMPT, "oi", preferred="primary"))
+    assert result["model"] == "primary-model"
+    assert backup.calls == 0
@@ -0,0 +1,31 @@
+import asyncio
+
+from benchmarks.stub_servers import LLMStub
+from config import settings
+from core import llm
+from core.http import close_async_clients
+from core.prompts import get_prompt
+
+
+def test_http1_streams_are_read_to_the_end_and_keep_the_connection(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_STREAMING", True)
+    monkeypatch.setattr(settings, "LLM_HTTP2", False)
+    prompt = get_prompt(llm.EXTRACTION_PROMPT).render("quero cortar o cabelo sexta às 14h")
+
+    with LLMStub() as stub:
+        async def stream_all():
+            try:
+                return [
+                    await llm._complete("openrouter", "stub", stub.url, {}, prompt)
+                    for _ in range(5)
+                ]
+            finally:
+                await close_async_clients()
+
+        results = asyncio.run(stream_all())
+        connections, requests = stub.connections, stub.requests
+
+    assert requests == 5
+    assert connections == 1
+    assert {r["service"] for r in results} == {"corte"}
+    assert results[0]["missing_slots"] == []
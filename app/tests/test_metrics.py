@@ -0,0 +1,49 @@
+import logging
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from config import settings
+from core.metrics import current_message_id, llm_request, observe_stage, stage_timer
+
+
+def _requests(outcome):
+    return REGISTRY.get_sample_value(
+        "atendente_llm_requests_total", {"provider": "test", "model": "m", "outcome": outcome}
+    ) or 0
+
+
+def test_llm_requests_are_counted_by_outcome():
+    request = httpx.Request("POST", "http://llm.test/chat")
+    before = {outcome: _requests(outcome) for outcome in ("ok", "error", "timeout")}
+
+    with llm_request("test", "m"):
+        pass
+    with pytest.raises(httpx.HTTPStatusError):
+        with llm_request("test", "m"):
+            httpx.Response(503, request=request).raise_for_status()
+    with pytest.raises(httpx.ReadTimeout):
+        with llm_request("test", "m"):
+            raise httpx.ReadTimeout("read timed out", request=request)
+
+    assert {outcome: _requests(outcome) - before[outcome] for outcome in before} == {
+        "ok": 1, "error": 1, "timeout": 1,
+    }
+
+
+def test_slow_stages_are_logged_at_info_with_the_message_id(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "SLOW_STAGE_SECONDS", 1.0)
+    caplog.set_level(logging.INFO, logger="core.metrics")
+    token = current_message_id.set(42)
+    try:
+        observe_stage("end_to_end", 0.2)
+        observe_stage("end_to_end", 3.0)
+        with stage_timer("webhook"):
+            pass
+    finally:
+        current_message_id.reset(token)
+
+    assert [r.getMessage() for r in caplog.records] == [
+        "slow stage message_id=42 stage=end_to_end duration_ms=3000.0 failed=False",
+    ]
@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from benchmarks.stub_servers import TwilioStub
+from config import settings
+from core.http import close_async_clients
+from services.outbound import OutboundDispatcher, RedisTokenBucket
+
+
+class FlakyTwilioStub(TwilioStub):
+    """Answers 503 to the first ``failures`` attempts of each listed body."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = dict(failures)
+
+    def handle(self, path, body):
+        for text, left in self.failures.items():
+            if left and f"Body={text}".encode() in body:
+                self.failures[text] = left - 1
+                return 503, {"code": 20503, "message": "Service unavailable"}
+        return super().handle(path, body)
+
+
+@pytest.fixture
+def twilio(monkeypatch):
+    def start(stub):
+        stub.start()
+        monkeypatch.setattr(settings, "TWILIO_API_BASE", stub.base_url)
+        monkeypatch.setattr(settings, "TWILIO_SID", "ACtest")
+        monkeypatch.setattr(settings, "TWILIO_WHATSAPP", "+15550000000")
+        started.append(stub)
+        return stub
+
+    started = []
+    yield start
+    for stub in started:
+        stub.stop()
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_async_clients()
+    return asyncio.run(main())
+
+
+def test_account_rate_is_shared_between_processes(twilio, redis_server):
+    stub = twilio(TwilioStub())
+    redis_client = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+    # Two dispatchers stand for two worker processes drawing from one bucket
+    workers = [OutboundDispatcher(account_rate=10, number_rate=1000, redis_client=redis_client) for _ in range(2)]
+
+    async def send_all():
+        for i in range(30):
+            await workers[i % 2].send(f"+5511{i:08d}", f"msg {i}", key=i)
+        await asyncio.gather(*(w.flush() for w in workers))
+
+    _run(send_all())
+
+    assert len(stub.messages) == 30
+    # A burst of 10, then 10/s for both together: ~2s. With a bucket per
+    # process each would send its 15 in ~0.5s.
+    assert stub.received_at[-1] - stub.received_at[0] >= 1.8
+
+
+def test_redis_bucket_paces_after_the_burst(redis_server):
+    bucket = RedisTokenBucket("ratelimit:test", rate=50, capacity=5)
+
+    async def take(n):
+        started = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert _run(take(5)) < 0.05
+    assert 0.35 <= _run(take(20)) < 1.0
+
+
+def test_redis_bucket_falls_back_to_local_limit():
+    class DownRedis:
+        def register_script(self, script):
+            raise ConnectionError("redis down")
+
+    bucket = RedisTokenBucket("ratelimit:test", rate=50, capacity=1, redis_client=DownRedis())
+
+    async def take(n):
+        started = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert 0.15 <= _run(take(11)) < 0.6
+
+
+def test_retries_keep_conversation_order(twilio, redis_server):
+    stub = twilio(FlakyTwilioStub({"first": 2, "third": 1}))
+    dispatcher = OutboundDispatcher(backoff_base=0.01, backoff_cap=0.05, max_retries=3)
+
+    async def send():
+        futures = [await dispatcher.send("+5511999", body, key=7) for body in ("first", "second", "third")]
+        other = await dispatcher.send("+5511888", "other lead", key=8)
+        await dispatcher.flush()
+        return futures, other
+
+    futures, other = _run(send())
+
+    bodies = [m["Body"] for m in stub.messages]
+    conversation = [b for b in bodies if b != "other lead"]
+    assert conversation == ["first", "second", "third"]
+    # Another conversation is not held up behind the retries
+    assert bodies.index("other lead") < bodies.index("second")
+    assert dispatcher.retried == 3
+    assert all(f.result()["status"] == "queued" for f in futures + [other])
+
+
+def test_gives_up_after_max_retries(twilio, redis_server):
+    stub = twilio(FlakyTwilioStub({"doomed": 10}))
+    dispatcher = OutboundDispatcher(backoff_base=0.01, backoff_cap=0.02, max_retries=2)
+
+    async def send():
+        future = await dispatcher.send("+5511999", "doomed", key=1)
+        await dispatcher.flush()
+        return future
+
+    future = _run(send())
+
+    assert future.exception() is not None
+    assert dispatcher.failed == 1
+    assert stub.messages == []
+    assert stub.requests == 3
@@ -0,0 +1,44 @@
+from core.prompts import get_prompt
+
+# Prompt built inline by analyze_message before the registry existed
+BASELINE_SYSTEM = "Você é um especialista em extração de dados para agendamentos. Responda APENAS em JSON válido."
+BASELINE_USER = """Extraia em JSON estruturado a seguinte informação da mensagem do cliente:
+{
+  "name": "nome do cliente (se mencionado)",
+  "service": "tipo de serviço desejado",
+  "preferred_date": "data preferida em YYYY-MM-DD (se mencionada)",
+  "preferred_time": "hora preferida em HH:MM (se mencionada)",
+  "missing_slots": ["lista de campos faltantes para completar o agendamento"],
+  "confidence": "nível de confiança 0-100"
+}
+
+Mensagem: {text}
+
+Retorne APENAS JSON válido, sem markdown ou comentários."""
+
+
+def test_v3_renders_the_baseline_prompt():
+    text = "Oi, quero marcar um corte amanhã às 15h"
+    prompt = get_prompt("extract", "v3").render(text)
+
+    assert prompt.messages == [
+        {"role": "system", "content": BASELINE_SYSTEM},
+        {"role": "user", "content": BASELINE_USER.replace("{text}", text)},
+    ]
+    assert prompt.temperature == 0.3
+
+
+def test_v4_is_smaller_than_v3():
+    text = "Oi, quero marcar um corte amanhã às 15h"
+    v3 = get_prompt("extract", "v3").render(text)
+    v4 = get_prompt("extract", "v4").render(text)
+
+    assert v4.prompt_tokens < v3.prompt_tokens
+    assert v4.max_tokens < 500
+
+
+def test_long_messages_are_truncated_to_the_budget():
+    prompt = get_prompt("extract", "v4").render("quero marcar " * 500, budget=200)
+
+    assert prompt.truncated
+    assert prompt.prompt_tokens <= 200
@@ -0,0 +1,78 @@
+import asyncio
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+from core.idempotency import idempotency
+from services.outbound import OutboundError
+from workers import async_worker, process_message
+from workers.async_worker import AsyncWorker
+
+
+def _send(monkeypatch, fail=False):
+    queued = []
+
+    def fake_apply_async(kwargs):
+        if fail:
+            raise ConnectionError("broker unavailable")
+        queued.append(kwargs)
+
+    monkeypatch.setattr(process_message.send_message, "apply_async", fake_apply_async)
+    process_message._send_reply("+5511999", "Olá!", 7, 42, datetime(2025, 1, 6, 12, 0))
+    return queued
+
+
+def test_reply_is_handed_to_the_outbound_queue_once(monkeypatch, redis_server):
+    [queued] = _send(monkeypatch)
+    assert queued["to"] == "+5511999"
+    assert queued["body"] == "Olá!"
+    assert queued["conversation_id"] == 7
+    assert queued["received_at"] == 1736164800.0  # 2025-01-06 12:00 UTC
+
+    # A rerun of the task does not queue it again
+    assert _send(monkeypatch) == []
+
+
+def test_reply_that_could_not_be_queued_is_released(monkeypatch, redis_server):
+    with pytest.raises(ConnectionError):
+        _send(monkeypatch, fail=True)
+
+    # The task retry can queue it
+    assert len(_send(monkeypatch)) == 1
+
+
+def _send_async(monkeypatch, outcome):
+    sent = []
+
+    async def fake_send(phone, reply, conversation_id=None):
+        sent.append(reply)
+        future = Future()
+        asyncio.get_running_loop().call_later(0.01, outcome, future)
+        return future
+
+    monkeypatch.setattr(async_worker, "send_whatsapp_async", fake_send)
+    worker = AsyncWorker()
+
+    async def send():
+        await worker._send_reply("+5511999", "Olá!", 7, 42, datetime.utcnow())
+
+    asyncio.run(send())
+    return sent
+
+
+def test_async_worker_waits_for_delivery_and_releases_a_failed_reply(monkeypatch, redis_server):
+    def fail(future):
+        future.set_exception(OutboundError("Twilio returned 503", status_code=503))
+
+    with pytest.raises(OutboundError):
+        _send_async(monkeypatch, fail)
+
+    # The retried turn can send the reply again
+    assert _send_async(monkeypatch, lambda f: f.set_result({"sid": "SM1"})) == ["Olá!"]
+
+
+def test_async_worker_does_not_send_a_delivered_reply_twice(monkeypatch, redis_server):
+    assert _send_async(monkeypatch, lambda f: f.set_result({"sid": "SM1"})) == ["Olá!"]
+    assert _send_async(monkeypatch, lambda f: f.set_result({"sid": "SM2"})) == []
+    assert not idempotency.claim("reply", "7:42")
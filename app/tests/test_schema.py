@@ -0,0 +1,116 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from database import Base
+import models
+from services.schema import upgrade_schema
+
+# Tables as the first release created them, before any upgrade step
+LEGACY_SCHEMA = [
+    """CREATE TABLE leads (
+        id INTEGER PRIMARY KEY, phone VARCHAR NOT NULL UNIQUE, name VARCHAR, created_at DATETIME
+    )""",
+    """CREATE TABLE conversations (
+        id INTEGER PRIMARY KEY, lead_id INTEGER NOT NULL REFERENCES leads (id),
+        last_message_at DATETIME, status VARCHAR
+    )""",
+    """CREATE TABLE messages (
+        id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+        sender VARCHAR NOT NULL, content TEXT NOT NULL, timestamp DATETIME
+    )""",
+    """CREATE TABLE appointments (
+        id INTEGER PRIMARY KEY, lead_id INTEGER NOT NULL REFERENCES leads (id), service VARCHAR NOT NULL,
+        start_at DATETIME NOT NULL, end_at DATETIME NOT NULL, status VARCHAR, created_at DATETIME
+    )""",
+]
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO leads (id, phone) VALUES (1, '+5511999990000')"))
+        conn.execute(text("INSERT INTO conversations (id, lead_id, status) VALUES (1, 1, 'open')"))
+        conn.execute(text(
+            "INSERT INTO appointments (id, lead_id, service, start_at, end_at, status) "
+            "VALUES (1, 1, 'corte', '2030-01-07 10:00:00', '2030-01-07 11:00:00', 'confirmed')"
+        ))
+    yield engine
+    engine.dispose()
+
+
+def _columns(engine, table):
+    return {c["name"] for c in inspect(engine).get_columns(table)}
+
+
+def test_upgrade_adds_the_missing_columns_once(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    applied = upgrade_schema(legacy_engine)
+
+    assert "conversations.slot_state" in applied
+    assert "slot_state" in _columns(legacy_engine, "conversations")
+    assert "messages.message_sid" in applied
+    assert "message_sid" in _columns(legacy_engine, "messages")
+    assert "appointments.resource" in applied
+    assert "resource" in _columns(legacy_engine, "appointments")
+    assert "ix_appointments_resource" in {i["name"] for i in inspect(legacy_engine).get_indexes("appointments")}
+    assert "uq_conversations_lead_open" in applied
+    assert "dashboard keyset indexes" in applied
+    assert "ix_messages_conversation_timestamp" in {i["name"] for i in inspect(legacy_engine).get_indexes("messages")}
+    assert upgrade_schema(legacy_engine) == []
+
+
+def test_models_load_from_an_upgraded_database(legacy_engine):
+    Base.metadata.create_all(legacy_engine)
+    upgrade_schema(legacy_engine)
+
+    with Session(legacy_engine) as db:
+        conversation = db.get(models.Conversation, 1)
+        assert conversation.slot_state is None
+        conversation.slot_state = {"service": "corte"}
+        db.commit()
+        assert db.get(models.Conversation, 1).slot_state == {"service": "corte"}
+
+
+def test_ingest_works_on_an_upgraded_database(legacy_engine, monkeypatch, redis_server):
+    from services import ingest
+    Base.metadata.create_all(legacy_engine)
+    upgrade_schema(legacy_engine)
+    monkeypatch.setattr(ingest.settings, "LOOKUP_CACHE_ENABLED", False)
+
+    with Session(legacy_engine) as db:
+        first = ingest.ingest_inbound_message(db, "+5511999990000", "Oi", message_sid="SM1")
+        retry = ingest.ingest_inbound_message(db, "+5511999990000", "Oi", message_sid="SM1")
+        message = db.get(models.Message, first.message_id)
+
+    assert message.message_sid == "SM1"
+    assert retry.duplicate
+
+
+def test_availability_loads_appointments_of_an_upgraded_database(legacy_engine):
+    from core.availability import AvailabilityEngine
+    Base.metadata.create_all(legacy_engine)
+    upgrade_schema(legacy_engine)
+    engine = AvailabilityEngine(resources=["default"])
+
+    with Session(legacy_engine) as db:
+        engine.load(db)
+
+    assert engine.find_resource(datetime(2030, 1, 7, 10, 30), datetime(2030, 1, 7, 11, 0)) is None
+
+
+def test_extra_open_conversations_are_closed_before_the_unique_index(legacy_engine):
+    with legacy_engine.begin() as conn:
+        conn.execute(text("INSERT INTO conversations (id, lead_id, status) VALUES (2, 1, 'open'), (3, 1, 'closed')"))
+    Base.metadata.create_all(legacy_engine)
+    upgrade_schema(legacy_engine)
+
+    with legacy_engine.connect() as conn:
+        statuses = dict(conn.execute(text("SELECT id, status FROM conversations")).all())
+    assert statuses == {1: "closed", 2: "open", 3: "closed"}
+    assert "uq_conversations_lead_open" in {i["name"] for i in inspect(legacy_engine).get_indexes("conversations")}
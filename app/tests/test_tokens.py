@@ -0,0 +1,37 @@
+from core import tokens
+
+
+class _Encoding:
+    def encode(self, text):
+        return text.split()
+
+
+class _Tiktoken:
+    """Stands in for tiktoken; the encoding files fail to load ``failures`` times."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.loads = 0
+
+    def get_encoding(self, name):
+        self.loads += 1
+        if self.loads <= self.failures:
+            raise OSError("could not download the encoding")
+        return _Encoding()
+
+
+def test_a_failed_encoding_load_is_retried_after_the_back_off(monkeypatch):
+    fake = _Tiktoken(failures=1)
+    monkeypatch.setattr(tokens, "tiktoken", fake)
+    monkeypatch.setattr(tokens, "_loaded_encoding", None)
+    monkeypatch.setattr(tokens, "_encoding_retry_at", 0.0)
+    text = "quero cortar o cabelo sexta-feira"
+
+    estimate = tokens.count_tokens(text)
+    assert tokens.count_tokens(text) == estimate
+    assert fake.loads == 1
+
+    monkeypatch.setattr(tokens, "_encoding_retry_at", 0.0)
+    assert tokens.count_tokens(text) == 5
+    assert tokens.count_tokens(text) == 5
+    assert fake.loads == 2
@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, Optional, Set
+from config import settings
+from core.coalesce import coalescer
+from core.conversation_state import merge_slots, slot_state_store
+from core.idempotency import idempotency
+from core.llm import analyze_message, generate_reply
+from core.metrics import current_message_id, observe_queue_lag, observe_stage
+from core.redis_client import get_async_redis
+from core.http import close_async_clients
+from database import AsyncSessionLocal, dispose_async_engine
+from services.ingest import PROCESS_MESSAGE_TOPIC
+from services.outbound import dispatcher
+from services.twilio_service import send_whatsapp_async
+from workers.process_message import _observe_end_to_end, reply_for, turn_query
+
+logger = logging.getLogger(__name__)
+
+# Asyncio runtime for process_message: one process runs hundreds of chat
+# turns at once instead of one per prefork child, since a turn mostly waits
+# on the database, the LLM and Twilio. The outbox relay feeds it through a
+# Redis stream consumer group instead of the Celery broker:
+#
+#   python -m workers.outbox_relay --target stream
+#   python -m workers.async_worker --concurrency 200
+#
+# Entries are acknowledged only after the turn finished (like acks_late);
+# entries of a consumer that died are claimed by the others after
+# ASYNC_WORKER_CLAIM_IDLE. Reruns are safe: the coalescer and the reply
+# idempotency claim drop duplicates. Requires Postgres (asyncpg).
+#
+# Entries that are not due yet (the coalescing window, retry backoff) are
+# not held in memory: they move to the ASYNC_WORKER_DELAYED sorted set,
+# scored by ready_at, and every worker moves due entries back to the stream.
+
+# KEYS: delayed sorted set, stream
+# ARGV: now (epoch seconds), max entries
+# Moves the entries due by now back to the stream in one step, so two
+# workers never promote the same entry twice. Returns the number moved.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    local fields = {}
+    for name, value in pairs(cjson.decode(member)) do
+        fields[#fields + 1] = name
+        fields[#fields + 1] = value
+    end
+    redis.call('XADD', KEYS[2], '*', unpack(fields))
+end
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return #due
+"""
+
+
+class AsyncWorker:
+    """
+    Consume ``process_message`` events from a Redis stream on one event loop.
+
+    Concurrency is bounded by semaphores: ``concurrency`` turns at once,
+    of which at most ``llm_concurrency`` wait on the LLM and
+    ``db_concurrency`` hold a database connection. Reading stops while
+    ``max_pending`` entries are in flight. Entries that are not due yet
+    wait in the ``delayed`` sorted set instead of in flight.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = None,
+        max_pending: int = None,
+        llm_concurrency: int = None,
+        db_concurrency: int = None,
+        max_retries: int = None,
+        claim_idle: int = None,
+        shutdown_timeout: float = None,
+        promote_interval: float = None,
+        stream: str = None,
+        delayed: str = None,
+        group: str = None,
+        consumer: str = None,
+        redis_client=None,
+    ):
+        self.concurrency = concurrency or settings.ASYNC_WORKER_CONCURRENCY
+        self.max_pending = max(max_pending or settings.ASYNC_WORKER_MAX_PENDING, self.concurrency)
+        self.llm_concurrency = llm_concurrency or settings.ASYNC_WORKER_LLM_CONCURRENCY
+        self.db_concurrency = db_concurrency or settings.ASYNC_WORKER_DB_CONCURRENCY
+        self.max_retries = settings.ASYNC_WORKER_MAX_RETRIES if max_retries is None else max_retries
+        self.claim_idle = claim_idle or settings.ASYNC_WORKER_CLAIM_IDLE
+        self.shutdown_timeout = (
+            settings.ASYNC_WORKER_SHUTDOWN_TIMEOUT if shutdown_timeout is None else shutdown_timeout
+        )
+        self.promote_interval = promote_interval or settings.ASYNC_WORKER_PROMOTE_INTERVAL
+        self.stream = stream or settings.ASYNC_WORKER_STREAM
+        self.delayed = delayed or settings.ASYNC_WORKER_DELAYED
+        self.group = group or settings.ASYNC_WORKER_GROUP
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._redis = redis_client
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_async_redis()
+
+    async def run(self):
+        """Consume until ``stop()`` is called, then drain in-flight turns."""
+        # Asyncio primitives must be created on the loop that uses them
+        self._stopping = asyncio.Event()
+        self._turn_slots = asyncio.Semaphore(self.concurrency)
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        self._db_slots = asyncio.Semaphore(self.db_concurrency)
+        self._promote = self.redis.register_script(PROMOTE_SCRIPT)
+        await self._ensure_group()
+        logger.info(
+            f"Async worker {self.consumer} consuming '{self.stream}' "
+            f"(concurrency={self.concurrency}, llm={self.llm_concurrency}, db={self.db_concurrency})"
+        )
+
+        last_claim = last_promote = 0.0
+        while not self._stopping.is_set():
+            room = self.max_pending - len(self._tasks)
+            if room <= 0:
+                await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                if time.monotonic() - last_promote >= self.promote_interval:
+                    await self._promote_due()
+                    last_promote = time.monotonic()
+                entries = []
+                if time.monotonic() - last_claim >= self.claim_idle / 2:
+                    entries = await self._reclaim(room)
+                    last_claim = time.monotonic()
+                if not entries:
+                    entries = await self._read(room)
+            except Exception as e:
+                logger.error(f"Reading '{self.stream}' failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            for entry_id, fields in entries:
+                task = asyncio.get_running_loop().create_task(self._handle(entry_id, fields))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        await self._drain()
+
+    def stop(self):
+        """Stop reading new entries; ``run`` returns once in-flight turns finish."""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read(self, count: int):
+        # Block no longer than the promotion interval so due entries move on time
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=min(count, 100),
+            block=max(1, int(self.promote_interval * 1000)),
+        )
+        return response[0][1] if response else []
+
+    async def _reclaim(self, count: int):
+        """Take over entries another consumer received but never acknowledged."""
+        response = await self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=self.claim_idle * 1000, count=min(count, 100)
+        )
+        entries = [(entry_id, fields) for entry_id, fields in response[1] if fields]
+        if entries:
+            logger.warning(f"Reclaimed {len(entries)} stale entries from '{self.stream}'")
+        return entries
+
+    async def _promote_due(self) -> int:
+        """Move delayed entries whose ``ready_at`` has passed back to the stream."""
+        moved = await self._promote(keys=[self.delayed, self.stream], args=[repr(time.time()), 100])
+        if moved:
+            logger.debug(f"Moved {moved} due entries to '{self.stream}'")
+        return moved
+
+    async def _ack(self, entry_id: str, delay: Optional[Dict[str, Any]] = None):
+        """
+        Acknowledge and delete a stream entry.
+
+        Args:
+            entry_id: ID of the stream entry
+            delay: Fields to park in the delayed set until their ``ready_at``,
+                in the same transaction, so the entry is neither lost nor
+                duplicated
+        """
+        pipe = self.redis.pipeline(transaction=delay is not None)
+        if delay is not None:
+            member = json.dumps({name: str(value) for name, value in delay.items()}, sort_keys=True)
+            pipe.zadd(self.delayed, {member: float(delay["ready_at"])})
+        pipe.xack(self.stream, self.group, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        await pipe.execute()
+
+    async def _handle(self, entry_id: str, fields: Dict[str, Any]):
+        try:
+            attempts = int(fields.get("attempts") or 0)
+            ready_at = float(fields["ready_at"]) if fields.get("ready_at") else None
+            payload = json.loads(fields["payload"])
+        except (KeyError, ValueError) as e:
+            logger.error(f"Dropping malformed entry {entry_id}: {e}")
+            await self._ack(entry_id)
+            return
+        if fields.get("topic") != PROCESS_MESSAGE_TOPIC:
+            logger.error(f"Dropping entry {entry_id} for unknown topic {fields.get('topic')}")
+            await self._ack(entry_id)
+            return
+
+        if ready_at is not None and ready_at > time.time():
+            await self._ack(entry_id, delay=fields)
+            return
+        # Cancelled while running (shutdown): left unacknowledged so another
+        # consumer reclaims it
+        retry = None
+        try:
+            async with self._turn_slots:
+                await asyncio.wait_for(
+                    self.process(payload["conversation_id"], payload["message_id"], ready_at, attempts),
+                    timeout=settings.LIVE_TASK_TIME_LIMIT,
+                )
+            self.processed += 1
+        except Exception as e:
+            logger.error(f"Unhandled error processing message {payload.get('message_id')}: {e}")
+            retry = self._retry(fields, attempts, e)
+        await self._ack(entry_id, delay=retry)
+
+    def _retry(self, fields: Dict[str, Any], attempts: int, error: Exception) -> Optional[Dict[str, Any]]:
+        """Return the fields of the next attempt, or None to give up."""
+        if attempts >= self.max_retries:
+            self.failed += 1
+            logger.error(f"Giving up on {fields.get('payload')} after {attempts + 1} attempts: {error}")
+            return None
+        # Same backoff as the Celery task
+        return {
+            **fields,
+            "ready_at": repr(time.time() + 60 * 2 ** attempts),
+            "attempts": attempts + 1,
+        }
+
+    async def process(self, conversation_id: int, message_id: int, ready_at: Optional[float] = None, attempts: int = 0):
+        """
+        Run one chat turn; the asyncio counterpart of ``process_message``.
+
+        Database work happens in short sessions so no connection is held
+        while the LLM answers. Calendar lookups and booking use the sync
+        engine and run in a thread.
+
+        Args:
+            conversation_id: ID of the conversation
+            message_id: ID of the message to process
+            ready_at: Epoch time the turn became due, used to measure queue lag
+            attempts: Previous failed attempts
+        """
+        started = time.perf_counter()
+        current_message_id.set(message_id)
+        if not attempts:
+            observe_queue_lag("process_message", ready_at)
+        try:
+            message_ids = await coalescer.claim_async(conversation_id, message_id)
+            if not message_ids:
+                return
+
+            async with self._db_slots:
+                async with AsyncSessionLocal() as db:
+                    rows = (await db.execute(turn_query(conversation_id, message_ids))).all()
+            if not rows:
+                logger.error(f"Message {message_id} of conversation {conversation_id} not found")
+                return
+            messages = [m for m, _, _ in rows]
+            _, conv, lead = rows[0]
+            text = "\n".join(m.content for m in messages)
+            received_at = messages[-1].timestamp
+            logger.info(f"Processing messages {message_ids} from lead {lead.phone}")
+
+            state = await slot_state_store.load_async(conv)
+            try:
+                async with self._llm_slots:
+                    nlu = await analyze_message(text, use_openrouter=True, state=state)
+            except Exception as e:
+                logger.error(f"LLM analysis failed: {e}")
+                await self._send_reply(lead.phone, generate_reply("error", None), conv.id, message_id, received_at)
+                return
+
+            nlu = merge_slots(state, nlu)
+            async with self._db_slots:
+                async with AsyncSessionLocal() as db:
+                    await slot_state_store.save_async(db, conv, nlu)
+                reply, booked = await asyncio.to_thread(reply_for, nlu, lead)
+                if booked:
+                    async with AsyncSessionLocal() as db:
+                        await slot_state_store.save_async(db, conv, {})
+
+            if reply:
+                await self._send_reply(lead.phone, reply, conv.id, message_id, received_at)
+        finally:
+            observe_stage("process_message", time.perf_counter() - started)
+
+    async def _send_reply(self, phone: str, reply: str, conversation_id: int, message_id: int, received_at):
+        if not await idempotency.claim_async("reply", f"{conversation_id}:{message_id}"):
+            logger.info(f"Reply to message {message_id} was already sent, skipping")
+            return
+        future = await send_whatsapp_async(phone, reply, conversation_id=conversation_id)
+        _observe_end_to_end(future, received_at)
+        logger.info(f"Reply queued for {phone}: {reply}")
+        # The entry is acknowledged only after delivery: a failed reply
+        # releases its claim and fails the turn, so the retry sends it again
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.warning(f"Reply to message {message_id} was not delivered, releasing it for a retry: {e}")
+            await idempotency.release_async("reply", f"{conversation_id}:{message_id}")
+            raise
+
+    async def _drain(self):
+        """Let in-flight turns finish, then deliver queued replies and close clients."""
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} in-flight turns")
+            _, pending = await asyncio.wait(self._tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+                logger.warning(f"Left {len(pending)} unfinished turns for redelivery")
+        try:
+            await asyncio.wait_for(dispatcher.flush(), timeout=self.shutdown_timeout)
+        except Exception as e:
+            logger.error(f"Error flushing outbound messages: {e}")
+        await _close_clients()
+        logger.info(f"Async worker stopped ({self.processed} processed, {self.failed} failed)")
+
+
+async def _close_clients():
+    await close_async_clients()
+    await dispose_async_engine()
+
+
+def main():
+    """Run the asyncio worker: ``python -m workers.async_worker``."""
+    parser = argparse.ArgumentParser(description="Process inbound messages on an asyncio event loop")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--llm-concurrency", type=int, default=None)
+    parser.add_argument("--db-concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if settings.WORKER_METRICS_PORT:
+        from core.metrics import start_metrics_server
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+    worker = AsyncWorker(
+        concurrency=args.concurrency, llm_concurrency=args.llm_concurrency, db_concurrency=args.db_concurrency
+    )
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import logging
+from typing import Optional
+from workers.celery_app import celery_app
+from database import SessionLocal
+from services.batch_extraction import run_batch_extraction
+
+logger = logging.getLogger(__name__)
+
+# Routed to the batch queue (workers.batch.* in workers.celery_app). Start or
+# resume a job with:
+#
+#   celery -A workers.celery_app call workers.batch.reextract_messages --kwargs '{"job": "reextract-v4"}'
+
+
+@celery_app.task(bind=True, acks_late=True, max_retries=10)
+def reextract_messages(
+    self,
+    job: str,
+    since_id: int = 0,
+    until_id: Optional[int] = None,
+    prompt_version: Optional[str] = None,
+    max_messages: Optional[int] = None,
+):
+    """
+    Run one slice of a batch re-extraction job and chain the next one.
+
+    Each run processes up to BATCH_EXTRACTION_MAX_MESSAGES messages so a job
+    over a large backlog never hits the task time limit and keeps each
+    cursor transaction short. Failures retry with backoff from the
+    checkpoint; completed chunks are never redone.
+
+    Args:
+        job: Job name; the same name resumes from its checkpoint
+        since_id: Start after this message id (new jobs only)
+        until_id: Last message id to cover (new jobs only)
+        prompt_version: Batch prompt version (new jobs only)
+        max_messages: Messages per run (defaults to settings.BATCH_EXTRACTION_MAX_MESSAGES)
+
+    Returns:
+        Checkpoint summary of the run
+    """
+    db = SessionLocal()
+    try:
+        summary = run_batch_extraction(
+            db, job, since_id=since_id, until_id=until_id, prompt_version=prompt_version, max_messages=max_messages
+        )
+    except Exception as e:
+        countdown = min(60 * 2 ** self.request.retries, 3600)
+        logger.error(f"Batch extraction job {job} failed, retrying in {countdown}s: {e}")
+        raise self.retry(exc=e, countdown=countdown)
+    finally:
+        db.close()
+
+    logger.info(
+        f"Batch extraction job {job}: {summary['processed']} extracted, {summary['failed']} failed, "
+        f"up to message {summary['last_message_id']} of {summary['until_message_id']}"
+    )
+    if not summary["done"]:
+        reextract_messages.apply_async(kwargs={"job": job, "max_messages": max_messages})
+    return summary
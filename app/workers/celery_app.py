@@ -1,13 +1,70 @@
 import logging
+import os
+from datetime import timedelta
 from celery import Celery
+from celery.signals import celeryd_init, worker_init, worker_process_init, worker_process_shutdown
+from kombu import Queue
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Queue topology
+#
+#   live      inbound chat turns; latency-sensitive, acks_late, prefetch 1
+#   outbound  standalone WhatsApp sends (notifications, replays)
+#   batch     background work (re-extraction, imports); may be autoscaled
+#
+# Run one worker pool per queue so a slow batch job or LLM call never holds
+# live messages in its prefetch buffer, e.g.:
+#
+#   celery -A workers.celery_app worker -Q live -n live@%h
+#   celery -A workers.celery_app worker -Q outbound -n outbound@%h
+#   celery -A workers.celery_app worker -Q batch -n batch@%h --autoscale=$CELERY_BATCH_AUTOSCALE
+#
+# Inbound messages reach the live queue through the transactional outbox,
+# published by a separate relay process:
+#
+#   python -m workers.outbox_relay
+#
+# With WEBHOOK_MODE=lean the webhook only queues events on a Redis stream and
+# a separate consumer stores them in batches (and writes the outbox rows):
+#
+#   python -m workers.ingest_consumer
+#
+# Alternatively the relay feeds a Redis stream and live turns run on the
+# asyncio runtime in workers/async_worker.py instead of the live queue:
+#
+#   python -m workers.outbox_relay --target stream
+#   python -m workers.async_worker
+#
+# Periodic maintenance (message partitions, idle conversations, archiving)
+# runs on the batch queue, scheduled by a single beat process:
+#
+#   celery -A workers.celery_app beat
+#
+# Concurrency and prefetch for single-queue workers come from settings
+# (CELERY_*_CONCURRENCY, CELERY_BATCH_PREFETCH) unless given on the command
+# line. A worker consuming several queues including "live" uses prefetch 1.
+LIVE_QUEUE = "live"
+OUTBOUND_QUEUE = "outbound"
+BATCH_QUEUE = "batch"
+
+# Redis broker: lower number = served first within a queue
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 3
+PRIORITY_LOW = 6
+
+QUEUE_PROFILES = {
+    LIVE_QUEUE: {"concurrency": settings.CELERY_LIVE_CONCURRENCY, "prefetch": 1},
+    OUTBOUND_QUEUE: {"concurrency": settings.CELERY_OUTBOUND_CONCURRENCY, "prefetch": 1},
+    BATCH_QUEUE: {"concurrency": settings.CELERY_BATCH_CONCURRENCY, "prefetch": settings.CELERY_BATCH_PREFETCH},
+}
+
 celery_app = Celery(
     "atendente_worker",
     broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL
+    backend=settings.REDIS_URL,
+    include=["workers.process_message", "workers.send_message", "workers.maintenance", "workers.batch"],
 )
 
 # Celery configuration
@@ -20,8 +77,84 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 minutes hard limit
     task_soft_time_limit=25 * 60,  # 25 minutes soft limit
-    worker_prefetch_multiplier=4,
+    worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    task_queues=[Queue(LIVE_QUEUE), Queue(OUTBOUND_QUEUE), Queue(BATCH_QUEUE)],
+    # Anything not routed explicitly is background work
+    task_default_queue=BATCH_QUEUE,
+    task_default_priority=PRIORITY_NORMAL,
+    task_routes={
+        "workers.process_message.*": {"queue": LIVE_QUEUE, "priority": PRIORITY_HIGH},
+        "workers.send_message.*": {"queue": OUTBOUND_QUEUE, "priority": PRIORITY_HIGH},
+        "workers.batch.*": {"queue": BATCH_QUEUE, "priority": PRIORITY_LOW},
+        "workers.maintenance.*": {"queue": BATCH_QUEUE, "priority": PRIORITY_LOW},
+    },
+    beat_schedule={
+        "maintain-partitions": {"task": "workers.maintenance.maintain_partitions", "schedule": timedelta(hours=6)},
+        "close-idle-conversations": {
+            "task": "workers.maintenance.close_idle_conversations",
+            "schedule": timedelta(minutes=15),
+        },
+        "archive-conversations": {"task": "workers.maintenance.archive_conversations", "schedule": timedelta(hours=1)},
+        "purge-message-sids": {"task": "workers.maintenance.purge_stale_message_sids", "schedule": timedelta(days=1)},
+    },
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "priority_steps": [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, 9],
+        "sep": ":",
+        # acks_late tasks (incl. countdown/ETA ones) are redelivered after this
+        "visibility_timeout": settings.CELERY_VISIBILITY_TIMEOUT,
+    },
 )
 
 logger.info(f"Celery app initialized with broker: {settings.REDIS_URL}")
+
+
+@celeryd_init.connect
+def configure_queue_profile(conf=None, options=None, **kwargs):
+    """Apply the concurrency/prefetch profile of the queues this worker consumes."""
+    queues = (options or {}).get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    queues = [q.strip() for q in queues if q.strip()]
+    if len(queues) == 1 and queues[0] in QUEUE_PROFILES:
+        profile = QUEUE_PROFILES[queues[0]]
+        if not options.get("concurrency"):
+            conf.worker_concurrency = profile["concurrency"]
+        if not options.get("prefetch_multiplier"):
+            conf.worker_prefetch_multiplier = profile["prefetch"]
+    elif LIVE_QUEUE in queues or not queues:
+        conf.worker_prefetch_multiplier = 1
+    logger.info(
+        f"Worker consuming {queues or 'all queues'}: concurrency={conf.worker_concurrency} "
+        f"prefetch={conf.worker_prefetch_multiplier}"
+    )
+
+
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    """Expose worker metrics for Prometheus when WORKER_METRICS_PORT is set."""
+    if settings.WORKER_METRICS_PORT:
+        from core.metrics import start_metrics_server
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Give each forked worker child its own worker-sized connection pool."""
+    from database import configure_engine
+    configure_engine("worker")
+
+
+@worker_process_shutdown.connect
+def shutdown_event_loop(**kwargs):
+    """Flush queued replies, then close pooled clients and the persistent loop."""
+    from services.twilio_service import flush_outbound
+    from workers.event_loop import shutdown
+    try:
+        flush_outbound()
+    except Exception as e:
+        logger.error(f"Error flushing outbound messages: {e}")
+    shutdown()
+    from core.metrics import mark_process_dead
+    mark_process_dead(os.getpid())
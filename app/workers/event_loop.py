@@ -0,0 +1,101 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_owner_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _run_forever(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the persistent event loop of this worker process.
+
+    The loop runs in a daemon thread and lives as long as the process, so
+    async resources bound to it (HTTP pools, Redis connections) survive
+    between Celery tasks instead of being torn down by ``asyncio.run``.
+    """
+    global _loop, _thread, _owner_pid
+    with _lock:
+        alive = _thread is not None and _thread.is_alive()
+        if _loop is None or _owner_pid != os.getpid() or not alive:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_run_forever, args=(_loop,), name="worker-event-loop", daemon=True
+            )
+            _thread.start()
+            _owner_pid = os.getpid()
+            logger.info(f"Started persistent event loop (pid {_owner_pid})")
+        return _loop
+
+
+async def _with_context(coro: Awaitable[Any], context: contextvars.Context) -> Any:
+    # Carry the caller's context variables (e.g. the traced message id) into the task
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def run_async(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the worker loop and block until it finishes.
+
+    Context variables of the calling thread are visible to the coroutine.
+
+    Args:
+        coro: Coroutine to run
+        timeout: Seconds to wait for the result (None waits forever)
+
+    Returns:
+        The coroutine result
+    """
+    loop = get_loop()
+    if _thread is threading.current_thread():
+        raise RuntimeError("run_async() cannot be called from the worker event loop")
+    future = asyncio.run_coroutine_threadsafe(_with_context(coro, contextvars.copy_context()), loop)
+    return future.result(timeout)
+
+
+def submit_async(coro: Awaitable[Any]) -> concurrent.futures.Future:
+    """
+    Schedule a coroutine on the worker loop without waiting for it.
+
+    Lets synchronous code keep several coroutines in flight (e.g. batch LLM
+    requests) and collect them through the returned future.
+    """
+    if _thread is threading.current_thread():
+        raise RuntimeError("submit_async() cannot be called from the worker event loop")
+    return asyncio.run_coroutine_threadsafe(_with_context(coro, contextvars.copy_context()), get_loop())
+
+
+def shutdown(timeout: float = 5.0):
+    """Close shared clients and stop the worker loop."""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _owner_pid != os.getpid():
+            return
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+
+    from core.http import close_async_clients
+    try:
+        asyncio.run_coroutine_threadsafe(close_async_clients(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"Error closing async clients: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not thread.is_alive():
+        loop.close()
+    logger.info("Persistent event loop stopped")
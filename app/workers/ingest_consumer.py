@@ -0,0 +1,201 @@
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy.exc import DBAPIError
+from config import settings
+from core.coalesce import coalescer
+from core.metrics import QUEUE_LAG, observe_stage
+from core.redis_client import get_redis
+from core.utils import clean_phone
+from database import SessionLocal
+from services.ingest import InboundEvent, ingest_inbound_batch, ingest_inbound_message
+
+logger = logging.getLogger(__name__)
+
+StreamEntry = Tuple[str, Dict[str, str]]
+
+
+def parse_event(fields: Dict[str, str]) -> InboundEvent:
+    """Turn a stream entry written by the lean webhook into an InboundEvent."""
+    return InboundEvent(
+        phone=clean_phone(fields["from"]),
+        content=fields["body"],
+        message_sid=fields.get("sid") or None,
+        received_at=datetime.utcfromtimestamp(float(fields["received_at"])),
+    )
+
+
+class IngestConsumer:
+    """
+    Store messages queued by the lean webhook (controllers.whatsapp.LeanWebhook).
+
+    Reads INGEST_STREAM through a consumer group, up to ``batch_size``
+    entries at a time, and writes each batch with one multi-row statement
+    (services.ingest.ingest_inbound_batch) that also schedules processing
+    through the outbox. Entries are acknowledged and deleted only after the
+    commit; a crash leaves them pending and they are claimed again after
+    ``claim_idle`` seconds. Redelivered entries are deduplicated by their
+    MessageSid. Run several consumers side by side with different names.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        redis_client=None,
+        stream: str = None,
+        group: str = None,
+        consumer: str = None,
+        batch_size: int = None,
+        claim_idle: int = None,
+        block_ms: int = 1000,
+    ):
+        self.session_factory = session_factory
+        self._redis = redis_client
+        self.stream = stream or settings.INGEST_STREAM
+        self.group = group or settings.INGEST_GROUP
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = settings.INGEST_BATCH_SIZE if batch_size is None else batch_size
+        self.claim_idle = settings.INGEST_CLAIM_IDLE if claim_idle is None else claim_idle
+        self.block_ms = block_ms
+        self.stored = 0
+        self.dropped = 0
+        self._own_pending = True  # re-read entries this consumer left unacknowledged
+        self._last_reclaim = 0.0
+        self._stop = threading.Event()
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else get_redis()
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self) -> List[StreamEntry]:
+        if self._own_pending:
+            response = self.redis.xreadgroup(self.group, self.consumer, {self.stream: "0"}, count=self.batch_size)
+            entries = response[0][1] if response else []
+            if entries:
+                return entries
+            self._own_pending = False
+        if time.monotonic() - self._last_reclaim >= self.claim_idle / 2:
+            self._last_reclaim = time.monotonic()
+            _, entries, *_ = self.redis.xautoclaim(
+                self.stream, self.group, self.consumer, min_idle_time=self.claim_idle * 1000, count=self.batch_size
+            )
+            if entries:
+                logger.warning(f"Reclaimed {len(entries)} stalled inbound events")
+                return entries
+        response = self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream: ">"}, count=self.batch_size, block=self.block_ms
+        )
+        return response[0][1] if response else []
+
+    def consume_batch(self) -> int:
+        """
+        Read and store one batch of events.
+
+        Returns:
+            Number of stream entries handled
+        """
+        entries = self._read()
+        if not entries:
+            return 0
+        started = time.perf_counter()
+
+        events, ids = [], []
+        for entry_id, fields in entries:
+            ids.append(entry_id)
+            if not fields:  # deleted before it was acknowledged
+                continue
+            try:
+                events.append(parse_event(fields))
+            except (KeyError, ValueError) as e:
+                logger.error(f"Dropping malformed inbound event {entry_id}: {e}")
+                self.dropped += 1
+
+        results = self._store(events)
+        try:
+            coalescer.register_many((r.conversation_id, r.message_id) for r in results)
+        except Exception as e:
+            logger.warning(f"Could not register {len(results)} messages for coalescing: {e}")
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, *ids)
+        pipe.xdel(self.stream, *ids)
+        pipe.execute()
+
+        self.stored += len(results)
+        observe_stage("ingest_batch", time.perf_counter() - started)
+        if events:
+            QUEUE_LAG.labels("ingest").set((datetime.utcnow() - events[0].received_at).total_seconds())
+        return len(entries)
+
+    def _store(self, events: List[InboundEvent]):
+        db = self.session_factory()
+        try:
+            try:
+                return ingest_inbound_batch(db, events)
+            except DBAPIError as e:
+                if e.connection_invalidated or len(events) == 1:
+                    raise
+                # One bad event must not block the stream: store them one by one
+                logger.error(f"Batch insert of {len(events)} events failed, storing individually: {e}")
+            results = []
+            for event in events:
+                try:
+                    result = ingest_inbound_message(db, event.phone, event.content, event.message_sid)
+                except DBAPIError as e:
+                    if e.connection_invalidated:
+                        raise
+                    logger.error(f"Dropping inbound message {event.message_sid} from {event.phone}: {e}")
+                    self.dropped += 1
+                    continue
+                if not result.duplicate:
+                    results.append(result)
+            return results
+        finally:
+            db.close()
+
+    def run(self):
+        """Consume until ``stop()`` is called."""
+        self.ensure_group()
+        logger.info(f"Ingest consumer {self.consumer} reading {self.stream}")
+        while not self._stop.is_set():
+            try:
+                self.consume_batch()
+            except Exception as e:
+                logger.error(f"Ingest consumer error: {e}")
+                self._own_pending = True
+                self._stop.wait(1.0)
+        logger.info(f"Ingest consumer stopped ({self.stored} stored, {self.dropped} dropped)")
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    """Run a consumer as a standalone process: ``python -m workers.ingest_consumer``."""
+    parser = argparse.ArgumentParser(description="Store inbound messages queued by the lean webhook")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--name", default=None, help="consumer name (defaults to host-pid)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    consumer = IngestConsumer(batch_size=args.batch_size, consumer=args.name)
+    signal.signal(signal.SIGTERM, lambda *_: consumer.stop())
+    signal.signal(signal.SIGINT, lambda *_: consumer.stop())
+    consumer.run()
+
+
+if __name__ == "__main__":
+    main()
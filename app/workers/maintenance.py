@@ -0,0 +1,65 @@
+import logging
+from workers.celery_app import celery_app
+from database import SessionLocal
+from services.archive import archive_conversations as archive_batch
+from services.archive import close_idle_conversations as close_idle
+from services.ingest import purge_message_sids
+from services.partitions import drop_empty_partitions, ensure_message_partitions
+
+logger = logging.getLogger(__name__)
+
+# Scheduled by celery beat (see beat_schedule in workers.celery_app) and
+# routed to the batch queue.
+
+
+@celery_app.task
+def maintain_partitions():
+    """Create upcoming monthly message partitions and drop emptied old ones."""
+    created = ensure_message_partitions()
+    dropped = drop_empty_partitions()
+    return {"created": created, "dropped": dropped}
+
+
+@celery_app.task
+def close_idle_conversations():
+    """Close conversations idle for CONVERSATION_IDLE_HOURS."""
+    db = SessionLocal()
+    try:
+        return close_idle(db)
+    finally:
+        db.close()
+
+
+@celery_app.task(acks_late=True)
+def archive_conversations(max_batches: int = 20):
+    """
+    Archive old closed conversations to the cold store.
+
+    Args:
+        max_batches: Archive files to write in this run at most
+
+    Returns:
+        Totals of conversations and messages archived
+    """
+    totals = {"conversations": 0, "messages": 0}
+    db = SessionLocal()
+    try:
+        for _ in range(max_batches):
+            result = archive_batch(db)
+            if not result["conversations"]:
+                break
+            totals["conversations"] += result["conversations"]
+            totals["messages"] += result["messages"]
+    finally:
+        db.close()
+    return totals
+
+
+@celery_app.task
+def purge_stale_message_sids():
+    """Forget webhook SIDs older than MESSAGE_SID_RETENTION_DAYS."""
+    db = SessionLocal()
+    try:
+        return purge_message_sids(db)
+    finally:
+        db.close()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import logging
+import select
+import signal
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from config import settings
+from core.metrics import QUEUE_LAG
+from core.redis_client import get_redis
+import database
+from database import SessionLocal
+from models import OutboxEvent
+from workers.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def publish_to_celery(event: OutboxEvent):
+    """Send an outbox row to the broker as a task, delayed until ``available_at``."""
+    ready_at = _epoch(event.available_at)
+    celery_app.send_task(
+        event.topic,
+        kwargs={**event.payload, "ready_at": ready_at},
+        countdown=max(0.0, ready_at - time.time()),
+    )
+
+
+def publish_to_stream(event: OutboxEvent):
+    """Append an outbox row to the Redis stream read by ``workers.async_worker``."""
+    get_redis().xadd(settings.ASYNC_WORKER_STREAM, {
+        "topic": event.topic,
+        "payload": json.dumps(event.payload),
+        "ready_at": repr(_epoch(event.available_at)),
+        "attempts": 0,
+    })
+
+
+PUBLISHERS = {"celery": publish_to_celery, "stream": publish_to_stream}
+
+
+class OutboxRelay:
+    """
+    Publish pending outbox rows to the Celery broker (or the asyncio worker stream).
+
+    Rows are claimed in batches with ``FOR UPDATE SKIP LOCKED`` so several
+    relays can run side by side, published, and marked in the same
+    transaction. A crash between publish and commit republishes the batch,
+    so delivery is at-least-once; the consuming tasks are idempotent. On
+    Postgres the relay sleeps on ``LISTEN`` and wakes on the ``NOTIFY``
+    sent by the ingest transaction, falling back to polling.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        publish: Callable[[OutboxEvent], None] = publish_to_celery,
+        batch_size: int = None,
+        poll_interval: float = None,
+        channel: str = None,
+    ):
+        self.session_factory = session_factory
+        self.publish = publish
+        self.batch_size = settings.OUTBOX_BATCH_SIZE if batch_size is None else batch_size
+        self.poll_interval = settings.OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.channel = channel or settings.OUTBOX_CHANNEL
+        self.published = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._listen_connection = None
+
+    def publish_batch(self) -> int:
+        """
+        Publish one batch of pending rows.
+
+        Returns:
+            Number of rows published
+        """
+        db: Session = self.session_factory()
+        try:
+            events = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.published_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            published = 0
+            now = datetime.utcnow()
+            for event in events:
+                try:
+                    self.publish(event)
+                except Exception as e:
+                    # Broker trouble: keep the rest pending and retry later
+                    event.attempts += 1
+                    event.last_error = str(e)[:1000]
+                    self.failed += 1
+                    logger.error(f"Publishing outbox event {event.id} failed: {e}")
+                    break
+                event.published_at = now
+                published += 1
+                QUEUE_LAG.labels("outbox").set((now - event.created_at).total_seconds())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.published += published
+        if published:
+            logger.debug(f"Published {published} outbox events")
+        return published
+
+    def purge_published(self, older_than: timedelta = None) -> int:
+        """Delete rows published more than ``older_than`` ago."""
+        cutoff = datetime.utcnow() - (older_than or timedelta(hours=settings.OUTBOX_RETENTION_HOURS))
+        db: Session = self.session_factory()
+        try:
+            result = db.execute(
+                delete(OutboxEvent).where(OutboxEvent.published_at.is_not(None), OutboxEvent.published_at < cutoff)
+            )
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+    def _listen(self):
+        if database.engine.dialect.name != "postgresql" or self._listen_connection is not None:
+            return
+        # Dedicated autocommit connection, taken out of the pool for good
+        raw = database.engine.raw_connection()
+        raw.detach()
+        connection = raw.dbapi_connection
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {self.channel}")
+        cursor.close()
+        self._listen_connection = connection
+        logger.info(f"Listening for outbox notifications on '{self.channel}'")
+
+    def _wait(self, timeout: float):
+        """Block until a NOTIFY arrives or ``timeout`` elapses."""
+        connection = self._listen_connection
+        if connection is None:
+            self._stop.wait(timeout)
+            return
+        if hasattr(connection, "notifies") and callable(connection.notifies):  # psycopg 3
+            for _ in connection.notifies(timeout=timeout, stop_after=1):
+                pass
+        else:  # psycopg2
+            if select.select([connection], [], [], timeout)[0]:
+                connection.poll()
+                connection.notifies.clear()
+
+    def run(self, purge_every: float = 3600.0):
+        """Publish until ``stop()`` is called."""
+        logger.info("Outbox relay started")
+        last_purge = 0.0
+        while not self._stop.is_set():
+            try:
+                self._listen()
+                published = self.publish_batch()
+                if time.monotonic() - last_purge >= purge_every:
+                    purged = self.purge_published()
+                    last_purge = time.monotonic()
+                    if purged:
+                        logger.info(f"Purged {purged} published outbox events")
+            except Exception as e:
+                logger.error(f"Outbox relay error: {e}")
+                self._close_listener()
+                self._stop.wait(self.poll_interval)
+                continue
+            # A full batch means more rows are waiting
+            if published < self.batch_size:
+                self._wait(self.poll_interval)
+        self._close_listener()
+        logger.info(f"Outbox relay stopped ({self.published} published, {self.failed} failed)")
+
+    def _close_listener(self):
+        if self._listen_connection is not None:
+            try:
+                self._listen_connection.close()
+            except Exception:
+                pass
+            self._listen_connection = None
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    """Run the relay as a standalone process: ``python -m workers.outbox_relay``."""
+    parser = argparse.ArgumentParser(description="Publish outbox rows to the Celery broker or a Redis stream")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--poll-interval", type=float, default=None)
+    parser.add_argument(
+        "--target", choices=sorted(PUBLISHERS), default="celery",
+        help="celery broker, or the Redis stream of the asyncio worker runtime",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    relay = OutboxRelay(
+        publish=PUBLISHERS[args.target], batch_size=args.batch_size, poll_interval=args.poll_interval
+    )
+    signal.signal(signal.SIGTERM, lambda *_: relay.stop())
+    signal.signal(signal.SIGINT, lambda *_: relay.stop())
+    relay.run()
+
+
+if __name__ == "__main__":
+    main()
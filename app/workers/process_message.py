@@ -1,84 +1,172 @@
 import logging
-from typing import Optional
-from workers.celery_app import celery_app
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import Select, select
+from workers.celery_app import celery_app, PRIORITY_NORMAL
+from workers.event_loop import run_async
 from core.llm import analyze_message, generate_reply
 from core.calendar import get_available_slots, create_event
-from services.twilio_service import send_whatsapp
+from core.conversation_state import merge_slots, slot_state_store
+from core.coalesce import coalescer
+from core.idempotency import idempotency
+from core.metrics import current_message_id, observe_queue_lag, observe_stage
 from database import SessionLocal
+from config import settings
 from models import Lead, Conversation, Message
+from workers.send_message import send_message
 
 logger = logging.getLogger(__name__)
 
+NO_SLOTS_REPLY = "Desculpe, não há horários disponíveis no momento. Por favor, tente novamente mais tarde. 📅"
 
-@celery_app.task(bind=True, max_retries=3)
-def process_message(self, conversation_id: int, message_id: int):
+
+@celery_app.task(
+    bind=True,
+    max_retries=3,
+    # Redeliver if the worker dies mid-turn; claim() makes reruns idempotent
+    acks_late=True,
+    reject_on_worker_lost=True,
+    soft_time_limit=settings.LIVE_TASK_SOFT_TIME_LIMIT,
+    time_limit=settings.LIVE_TASK_TIME_LIMIT,
+)
+def process_message(self, conversation_id: int, message_id: int, ready_at: Optional[float] = None):
     """
     Process incoming message asynchronously using Celery.
+
+    Messages that arrived in the same coalescing window are analyzed together
+    and answered once; tasks superseded by a newer message exit early. A
+    retried or redelivered task never sends a second reply.
     
     Args:
         conversation_id: ID of the conversation
         message_id: ID of the message to process
+        ready_at: Epoch time the task became due, used to measure queue lag
     """
     db = None
+    started = time.perf_counter()
+    current_message_id.set(message_id)
+    if not self.request.retries:
+        observe_queue_lag("process_message", ready_at)
     try:
+        message_ids = coalescer.claim(conversation_id, message_id)
+        if not message_ids:
+            return
+
         db = SessionLocal()
         
-        # Retrieve entities
-        msg = db.query(Message).filter_by(id=message_id).first()
-        if not msg:
-            logger.error(f"Message {message_id} not found")
-            return
-            
-        conv = db.query(Conversation).filter_by(id=conversation_id).first()
-        if not conv:
-            logger.error(f"Conversation {conversation_id} not found")
-            return
-            
-        lead = db.query(Lead).filter_by(id=conv.lead_id).first()
-        if not lead:
-            logger.error(f"Lead for conversation {conversation_id} not found")
+        # Retrieve messages, conversation and lead in one round trip
+        rows = db.execute(turn_query(conversation_id, message_ids)).all()
+        if not rows:
+            logger.error(f"Message {message_id} of conversation {conversation_id} not found")
             return
+        messages = [m for m, _, _ in rows]
+        _, conv, lead = rows[0]
+        text = "\n".join(m.content for m in messages)
 
-        logger.info(f"Processing message {message_id} from lead {lead.phone}")
+        logger.info(f"Processing messages {message_ids} from lead {lead.phone}")
 
-        # Analyze message using LLM (sync wrapper for async function)
-        import asyncio
+        # Analyze the latest messages against the slots collected so far
+        state = slot_state_store.load(conv)
         try:
-            nlu = asyncio.run(analyze_message(msg.content, use_openrouter=True))
+            nlu = run_async(analyze_message(text, use_openrouter=True, state=state))
         except Exception as e:
             logger.error(f"LLM analysis failed: {e}")
-            reply = generate_reply("error", None)
-            send_whatsapp(lead.phone, reply)
+            _send_reply(lead.phone, generate_reply("error", None), conv.id, message_id, messages[-1].timestamp)
             return
 
-        # Check if we have all required slots
-        reply = None
-        missing_slots = nlu.get("missing_slots", [])
-        
-        if missing_slots and len(missing_slots) > 0:
-            reply = generate_reply("ask_slot", nlu)
-        else:
-            try:
-                # All slots filled, proceed with appointment
-                slots = get_available_slots(nlu)
-                if slots:
-                    event = create_event(slots[0], lead, nlu)
-                    reply = generate_reply("confirm", slots)
-                else:
-                    reply = "Desculpe, não há horários disponíveis no momento. Por favor, tente novamente mais tarde. 📅"
-            except Exception as e:
-                logger.error(f"Calendar/event creation failed: {e}")
-                reply = generate_reply("error", None)
+        nlu = merge_slots(state, nlu)
+        slot_state_store.save(db, conv, nlu)
+
+        reply, booked = reply_for(nlu, lead)
+        if booked:
+            slot_state_store.clear(db, conv)
 
         # Send reply via WhatsApp
         if reply:
-            send_whatsapp(lead.phone, reply)
-            logger.info(f"Reply sent to {lead.phone}: {reply}")
+            _send_reply(lead.phone, reply, conv.id, message_id, messages[-1].timestamp)
 
     except Exception as e:
         logger.error(f"Unhandled error in process_message: {e}")
-        # Retry with exponential backoff
-        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
+        # Retry with exponential backoff, behind fresh messages in the live queue
+        raise self.retry(exc=e, countdown=60 * (2 ** self.request.retries), priority=PRIORITY_NORMAL)
     finally:
+        observe_stage("process_message", time.perf_counter() - started)
         if db:
             db.close()
+
+
+def turn_query(conversation_id: int, message_ids: List[int]) -> Select:
+    """
+    Load the messages of a turn with their conversation and lead.
+
+    Rows are ``(Message, Conversation, Lead)`` in message id order; the
+    conversation and lead are the same objects on every row.
+    """
+    return (
+        select(Message, Conversation, Lead)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .join(Lead, Lead.id == Conversation.lead_id)
+        .where(Message.id.in_(message_ids), Message.conversation_id == conversation_id)
+        .order_by(Message.id)
+    )
+
+
+def reply_for(nlu: Dict[str, Any], lead: Lead) -> Tuple[str, bool]:
+    """
+    Choose the reply for a merged extraction, booking the slot once complete.
+
+    Args:
+        nlu: Extraction merged with the conversation's slot state
+        lead: Lead being served
+
+    Returns:
+        Reply text and whether an appointment was booked
+    """
+    # Check if we have all required slots
+    missing_slots = nlu.get("missing_slots", [])
+    if missing_slots and len(missing_slots) > 0:
+        return generate_reply("ask_slot", nlu), False
+    try:
+        # All slots filled, proceed with appointment
+        slots = get_available_slots(nlu)
+        if not slots:
+            return NO_SLOTS_REPLY, False
+        create_event(slots[0], lead, nlu)
+        return generate_reply("confirm", slots), True
+    except Exception as e:
+        logger.error(f"Calendar/event creation failed: {e}")
+        return generate_reply("error", None), False
+
+
+def _send_reply(phone: str, reply: str, conversation_id: int, message_id: int, received_at: datetime):
+    """
+    Hand the reply to a message batch to the outbound queue unless a previous run already did.
+
+    ``send_message`` is acks_late and retries Twilio errors, so the reply is
+    not lost when this task is acked (or its worker dies) before delivery.
+    """
+    key = f"{conversation_id}:{message_id}"
+    if not idempotency.claim("reply", key):
+        logger.info(f"Reply to message {message_id} was already sent, skipping")
+        return
+    try:
+        send_message.apply_async(kwargs={
+            "to": phone,
+            "body": reply,
+            "conversation_id": conversation_id,
+            "received_at": received_at.replace(tzinfo=timezone.utc).timestamp(),
+        })
+    except Exception:
+        # Not queued: let the task retry send it
+        idempotency.release("reply", key)
+        raise
+    logger.info(f"Reply queued for {phone}: {reply}")
+
+
+def _observe_end_to_end(future, received_at: datetime):
+    """Record inbound-to-delivered latency once the reply is accepted by Twilio."""
+    def done(f):
+        if not f.cancelled() and f.exception() is None:
+            observe_stage("end_to_end", (datetime.utcnow() - received_at).total_seconds())
+    future.add_done_callback(done)
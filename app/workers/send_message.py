@@ -0,0 +1,43 @@
+import logging
+import time
+from typing import Optional
+from workers.celery_app import celery_app
+from core.metrics import observe_stage
+from services.outbound import OutboundError
+from services.twilio_service import send_whatsapp
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(bind=True, max_retries=5, acks_late=True)
+def send_message(
+    self, to: str, body: str, conversation_id: Optional[int] = None, received_at: Optional[float] = None
+):
+    """
+    Deliver a WhatsApp message from the outbound queue.
+
+    Carries the chat replies of ``process_message`` as well as sends that
+    are not part of a live chat turn (notifications, replays).
+
+    Args:
+        to: Recipient phone number
+        body: Message text
+        conversation_id: Ordering key for the reply
+        received_at: Epoch time the answered message arrived, to record
+            inbound-to-delivered latency
+
+    Returns:
+        Twilio message SID
+    """
+    timeout = (settings.TWILIO_HTTP_TIMEOUT + settings.OUTBOUND_BACKOFF_CAP) * (settings.OUTBOUND_MAX_RETRIES + 1)
+    try:
+        result = send_whatsapp(to, body, conversation_id=conversation_id).result(timeout=timeout)
+    except OutboundError as e:
+        if not e.retryable:
+            logger.error(f"Dropping message to {to}: {e}")
+            return None
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+    if received_at is not None:
+        observe_stage("end_to_end", time.time() - received_at)
+    return result.get("sid")